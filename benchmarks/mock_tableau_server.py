@@ -0,0 +1,681 @@
+"""
+A local stand-in for the Tableau REST endpoints used by the blueprints.
+
+Serves sign-in, server info, project/workbook/view/datasource listings with filters and
+paging, view and workbook exports, refreshes and jobs for a generated site. Every endpoint group can be
+given a fixed latency, a failure rate (503) and a throttle rate (429 with Retry-After),
+so the blueprints can be measured under realistic and degraded conditions.
+
+Run it on its own with:
+    python benchmarks/mock_tableau_server.py --port 8000 --projects 10
+"""
+import argparse
+import functools
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape, quoteattr
+
+REST_API_VERSION = '3.15'
+PRODUCT_VERSION = '2022.1'
+XML_NAMESPACE = 'http://tableau.com/api'
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+EXPORT_CHUNK_SIZE = 64 * 1024
+SHUTDOWN_POLL_INTERVAL = 0.05
+CSV_HEADER = b'Region,Category,Order Date,Sales,Quantity\n'
+CSV_REGIONS = ('Central', 'East', 'South', 'West')
+CSV_CATEGORIES = ('Furniture', 'Office Supplies', 'Technology')
+EXPORT_CONTENT_TYPES = {
+    'image': 'image/png',
+    'pdf': 'application/pdf',
+    'data': 'text/csv',
+}
+ENDPOINTS = (
+    'serverinfo',
+    'signin',
+    'signout',
+    'session',
+    'projects',
+    'workbooks',
+    'views',
+    'datasources',
+    'export',
+    'refresh',
+    'jobs',
+)
+# Maps REST filter and sort fields to item attributes.
+FIELD_NAMES = {
+    'name': 'name',
+    'projectName': 'project_name',
+    'workbookName': 'workbook_name',
+    'updatedAt': 'updated_at',
+    'createdAt': 'created_at',
+    'title': 'title',
+    'status': 'status',
+}
+
+
+def format_timestamp(timestamp):
+    return timestamp.strftime(TIMESTAMP_FORMAT) if timestamp else None
+
+
+@functools.lru_cache(maxsize=None)
+def get_csv_block():
+    """
+    Returns about EXPORT_CHUNK_SIZE bytes of whole CSV rows, repeated to build data exports of any size.
+    """
+    rows = []
+    block_size = 0
+    i = 0
+    while block_size < EXPORT_CHUNK_SIZE:
+        row = (
+            f'{CSV_REGIONS[i % len(CSV_REGIONS)]},{CSV_CATEGORIES[i % len(CSV_CATEGORIES)]},'
+            f'2022-01-{i % 28 + 1:02d},{i * 7.31 % 1000:.2f},{i % 17 + 1}\n').encode('utf-8')
+        rows.append(row)
+        block_size += len(row)
+        i += 1
+    return b''.join(rows)
+
+
+def generate_export(export_type, export_size):
+    """
+    Returns the content length and the chunks of an export of about export_size bytes.
+    Data exports are CSV with a header and whole rows, and other exports are filler bytes.
+    """
+    if export_type != 'data':
+        chunk = b'x' * EXPORT_CHUNK_SIZE
+        chunks = (
+            chunk[:min(EXPORT_CHUNK_SIZE, export_size - offset)]
+            for offset in range(0, export_size, EXPORT_CHUNK_SIZE))
+        return export_size, chunks
+
+    block = get_csv_block()
+    block_count, remaining_size = divmod(
+        max(export_size - len(CSV_HEADER), 0), len(block))
+    # The last block is cut after its last whole row, so the export never ends mid-row.
+    last_block = block[:block.rfind(b'\n', 0, remaining_size) + 1]
+    content_length = len(CSV_HEADER) + block_count * len(block) + len(last_block)
+    chunks = (
+        chunk for chunks in ([CSV_HEADER], (block for _ in range(block_count)), [last_block])
+        for chunk in chunks if chunk)
+    return content_length, chunks
+
+
+def generate_id(*parts):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, '/'.join(str(part) for part in parts)))
+
+
+class MockSite():
+    """
+    A generated site with projects, workbooks, views and published datasources.
+
+    Names follow a fixed pattern, e.g. View 3 of Workbook 1-2 in Project 1, so benchmarks can address any item.
+    """
+
+    def __init__(
+            self,
+            projects=2,
+            workbooks_per_project=5,
+            views_per_workbook=5,
+            datasources_per_project=2):
+        updated_at = datetime(2022, 1, 1, tzinfo=timezone.utc)
+        self.projects = []
+        self.workbooks = []
+        self.views = []
+        self.datasources = []
+        for i in range(projects):
+            project = {'id': generate_id('project', i), 'name': f'Project {i}'}
+            self.projects.append(project)
+            project_datasources = []
+            for j in range(datasources_per_project):
+                datasource = {
+                    'type': 'datasource',
+                    'id': generate_id('datasource', i, j),
+                    'name': f'Datasource {i}-{j}',
+                    'project_id': project['id'],
+                    'project_name': project['name'],
+                    'updated_at': updated_at,
+                }
+                project_datasources.append(datasource)
+                self.datasources.append(datasource)
+            for j in range(workbooks_per_project):
+                workbook = {
+                    'type': 'workbook',
+                    'id': generate_id('workbook', i, j),
+                    'name': f'Workbook {i}-{j}',
+                    'project_id': project['id'],
+                    'project_name': project['name'],
+                    'updated_at': updated_at,
+                    'datasource_ids': [
+                        datasource['id'] for datasource in project_datasources[:1]],
+                }
+                self.workbooks.append(workbook)
+                for k in range(views_per_workbook):
+                    self.views.append({
+                        'type': 'view',
+                        'id': generate_id('view', i, j, k),
+                        'name': f'View {k}',
+                        'project_id': project['id'],
+                        'project_name': project['name'],
+                        'workbook_id': workbook['id'],
+                        'workbook_name': workbook['name'],
+                        'updated_at': updated_at,
+                    })
+        self.items_by_id = {
+            item['id']: item
+            for item in self.workbooks + self.datasources + self.views}
+
+
+class MockTableauServer():
+    """
+    Serves a MockSite on a local port from a background thread.
+
+    latency, failure_rates and throttle_rates map an endpoint group from ENDPOINTS to
+    seconds of delay or the fraction of requests that fail. Refresh jobs complete
+    job_duration seconds after they are created.
+    """
+
+    def __init__(
+            self,
+            site=None,
+            export_size=100 * 1024,
+            latency=None,
+            failure_rates=None,
+            throttle_rates=None,
+            retry_after=1,
+            job_duration=2.0,
+            seed=0,
+            port=0):
+        self.site = site or MockSite()
+        self.export_size = export_size
+        self.latency = latency or {}
+        self.failure_rates = failure_rates or {}
+        self.throttle_rates = throttle_rates or {}
+        self.retry_after = retry_after
+        self.job_duration = job_duration
+        self.port = port
+        self.jobs = {}
+        self.auth_tokens = set()
+        self.request_counts = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._http_server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._http_server.server_port}'
+
+    def start(self):
+        mock_server = self
+
+        class RequestHandler(MockRequestHandler):
+            server_state = mock_server
+
+        self._http_server = ThreadingHTTPServer(
+            ('127.0.0.1', self.port), RequestHandler)
+        self._http_server.daemon_threads = True
+        # A short poll interval lets stop return promptly, which adds up over many tests.
+        self._thread = threading.Thread(
+            target=self._http_server.serve_forever,
+            kwargs={'poll_interval': SHUTDOWN_POLL_INTERVAL},
+            daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._http_server:
+            self._http_server.shutdown()
+            self._http_server.server_close()
+            self._http_server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def reset_request_counts(self):
+        with self._lock:
+            self.request_counts.clear()
+
+    def get_request_counts(self):
+        with self._lock:
+            return dict(self.request_counts)
+
+    def issue_auth_token(self):
+        auth_token = uuid.uuid4().hex
+        with self._lock:
+            self.auth_tokens.add(auth_token)
+        return auth_token
+
+    def expire_sessions(self):
+        """
+        Makes every token issued so far invalid, as if the sessions had timed out.
+        """
+        with self._lock:
+            self.auth_tokens.clear()
+
+    def create_job(self, resource, created_at=None, refuse_if_running=False):
+        """
+        Starts a refresh job for a workbook or datasource and returns its ID.
+
+        With refuse_if_running, returns None instead while the resource already has a
+        running job, the way Tableau refuses a second refresh of the same extract.
+        """
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            if refuse_if_running and any(
+                    job['resource'] is resource and self.get_job_state(job)['completed_at'] is None
+                    for job in self.jobs.values()):
+                return None
+            self.jobs[job_id] = {
+                'id': job_id,
+                'resource': resource,
+                'title': resource['name'],
+                'created_at': created_at or datetime.now(timezone.utc),
+            }
+        return job_id
+
+    def get_job_state(self, job):
+        """
+        Returns the job with its status and timestamps as of now.
+        """
+        created_at = job['created_at']
+        completed_at = created_at + timedelta(seconds=self.job_duration)
+        is_complete = datetime.now(timezone.utc) >= completed_at
+        return dict(
+            job,
+            started_at=created_at,
+            completed_at=completed_at if is_complete else None,
+            status='Success' if is_complete else 'InProgress',
+            progress=100 if is_complete else 50)
+
+    def record_request(self, endpoint):
+        """
+        Counts the request, applies the endpoint's latency and returns the injected error status, if any.
+        """
+        with self._lock:
+            self.request_counts[endpoint] += 1
+            roll = self._random.random()
+        delay = self.latency.get(endpoint, 0)
+        if delay:
+            time.sleep(delay)
+        if roll < self.throttle_rates.get(endpoint, 0):
+            return 429
+        if roll < self.throttle_rates.get(
+                endpoint, 0) + self.failure_rates.get(endpoint, 0):
+            return 503
+        return None
+
+
+def parse_filters(query):
+    """
+    Parses filter=field:operator:value,... into (attribute, operator, value) tuples.
+    """
+    filters = []
+    # Commas inside the [...] list of an in filter don't separate expressions.
+    for expression in re.split(r',(?![^\[]*\])', query.get('filter', [''])[0]):
+        if not expression:
+            continue
+        field, operator, value = expression.split(':', 2)
+        filters.append((FIELD_NAMES.get(field, field), operator, value))
+    return filters
+
+
+def matches_filters(item, filters):
+    for attribute, operator, value in filters:
+        item_value = item.get(attribute)
+        if isinstance(item_value, datetime):
+            item_value = format_timestamp(item_value)
+        if operator == 'eq' and item_value != value:
+            return False
+        if operator == 'gte' and (item_value is None or item_value < value):
+            return False
+        if operator == 'in' and item_value not in value.strip('[]').split(','):
+            return False
+    return True
+
+
+def apply_sort(items, query):
+    for expression in reversed(query.get('sort', [''])[0].split(',')):
+        if not expression:
+            continue
+        field, direction = expression.split(':')
+        attribute = FIELD_NAMES.get(field, field)
+        items = sorted(
+            items,
+            key=lambda item: format_timestamp(item.get(attribute)) if isinstance(
+                item.get(attribute), datetime) else str(item.get(attribute)),
+            reverse=direction == 'desc')
+    return items
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_state = None
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, status_code, body=b'', content_type='application/xml', headers=None):
+        self.send_response(status_code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_xml(self, content, status_code=200):
+        body = f'<?xml version="1.0" encoding="UTF-8"?><tsResponse xmlns="{XML_NAMESPACE}">{content}</tsResponse>'
+        self.send_body(status_code, body.encode('utf-8'))
+
+    def send_error_status(
+            self,
+            status_code,
+            summary='Injected',
+            detail='Injected by the mock server'):
+        headers = {}
+        if status_code == 429:
+            headers['Retry-After'] = str(self.server_state.retry_after)
+        body = f'<tsResponse xmlns="{XML_NAMESPACE}"><error code="{status_code}000"><summary>{escape(summary)}</summary><detail>{escape(detail)}</detail></error></tsResponse>'
+        self.send_body(status_code, body.encode('utf-8'), headers=headers)
+
+    def send_page(self, tag, items, query, to_xml):
+        items = apply_sort(
+            [item for item in items if matches_filters(item, parse_filters(query))],
+            query)
+        page_size = int(query.get('pageSize', ['100'])[0])
+        page_number = int(query.get('pageNumber', ['1'])[0])
+        page = items[(page_number - 1) * page_size:page_number * page_size]
+        self.send_xml(
+            f'<pagination pageNumber="{page_number}" pageSize="{page_size}" totalAvailable="{len(items)}"/>'
+            f'<{tag}s>{"".join(to_xml(item) for item in page)}</{tag}s>')
+
+    def read_request_body(self):
+        content_length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(content_length)
+
+    def route(self, method):
+        """
+        Returns the endpoint group and the handler for the request path.
+        """
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip('/').split('/')
+        # Paths look like api/<version>/sites/<site_id>/<resource>[/<id>[/<action>]]
+        if url.path.lower().endswith('/serverinfo'):
+            return 'serverinfo', lambda: self.handle_server_info()
+        if url.path.endswith('/auth/signin'):
+            return 'signin', lambda: self.handle_sign_in()
+        if url.path.endswith('/auth/signout'):
+            return 'signout', lambda: self.send_body(204)
+        if url.path.endswith('/sessions/current'):
+            return 'session', lambda: self.handle_current_session()
+        if len(parts) < 5 or parts[2] != 'sites':
+            return None, None
+        resource, resource_parts = parts[4], parts[5:]
+        state = self.server_state
+        site = state.site
+
+        if resource == 'projects' and method == 'GET':
+            return 'projects', lambda: self.send_page(
+                'project', site.projects, query, project_xml)
+        if resource in ('workbooks', 'datasources', 'views') and method == 'GET' and not resource_parts:
+            return resource, lambda: self.send_page(
+                resource[:-1], getattr(site, resource), query, ITEM_XML[resource])
+        if resource == 'views' and len(resource_parts) == 2 and resource_parts[1] in EXPORT_CONTENT_TYPES:
+            return 'export', lambda: self.handle_export(
+                resource_parts[0], resource_parts[1])
+        if resource in ('workbooks', 'datasources') and resource_parts:
+            item = site.items_by_id.get(resource_parts[0])
+            if len(resource_parts) == 2 and resource_parts[1] == 'refresh' and method == 'POST':
+                return 'refresh', lambda: self.handle_refresh(item)
+            if len(resource_parts) == 2 and resource_parts[1] == 'connections':
+                return resource, lambda: self.handle_connections(item)
+            if resource == 'workbooks' and len(resource_parts) == 2 and resource_parts[1] == 'views':
+                return resource, lambda: self.send_page(
+                    'view',
+                    [view for view in site.views if view['workbook_id'] == resource_parts[0]],
+                    query,
+                    view_xml)
+            if resource == 'workbooks' and len(resource_parts) == 2 and resource_parts[1] == 'pdf':
+                return 'export', lambda: self.handle_export(
+                    resource_parts[0], 'pdf')
+            if len(resource_parts) == 1 and method == 'GET':
+                return resource, lambda: self.send_item(
+                    item, ITEM_XML[resource])
+        if resource == 'jobs' and method == 'GET':
+            if resource_parts:
+                return 'jobs', lambda: self.handle_job(resource_parts[0])
+            return 'jobs', lambda: self.handle_job_list(query)
+        return None, None
+
+    def handle_request(self, method):
+        if method == 'POST':
+            self.read_request_body()
+        endpoint, handler = self.route(method)
+        if endpoint is None:
+            self.send_error_status(404)
+            return
+        error_status = self.server_state.record_request(endpoint)
+        if error_status:
+            self.send_error_status(error_status)
+            return
+        handler()
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def handle_server_info(self):
+        self.send_xml(
+            f'<serverInfo><productVersion build="20221.0">{PRODUCT_VERSION}</productVersion>'
+            f'<restApiVersion>{REST_API_VERSION}</restApiVersion></serverInfo>')
+
+    def handle_sign_in(self):
+        auth_token = self.server_state.issue_auth_token()
+        self.send_xml(
+            f'<credentials token="{auth_token}">'
+            f'<site id="{generate_id("site")}" contentUrl=""/>'
+            f'<user id="{generate_id("user")}"/></credentials>')
+
+    def handle_current_session(self):
+        # Only the session check validates the token, so other endpoints stay cheap to call in benchmarks.
+        if self.headers.get('x-tableau-auth') not in self.server_state.auth_tokens:
+            self.send_error_status(401, 'Unauthorized', 'The session has expired.')
+            return
+        self.send_xml('<session/>')
+
+    def send_item(self, item, to_xml):
+        if item is None:
+            self.send_error_status(404)
+            return
+        self.send_xml(to_xml(item))
+
+    def handle_connections(self, item):
+        if item is None:
+            self.send_error_status(404)
+            return
+        connections = ''.join(
+            f'<connection id="{generate_id("connection", datasource_id)}" type="sqlserver">'
+            f'<datasource id="{datasource_id}"/></connection>'
+            for datasource_id in item.get('datasource_ids', []))
+        self.send_xml(f'<connections>{connections}</connections>')
+
+    def handle_export(self, item_id, export_type):
+        if item_id not in self.server_state.site.items_by_id:
+            self.send_error_status(404)
+            return
+        content_length, chunks = generate_export(
+            export_type, self.server_state.export_size)
+        self.send_response(200)
+        self.send_header('Content-Type', EXPORT_CONTENT_TYPES[export_type])
+        self.send_header('Content-Length', str(content_length))
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write(chunk)
+
+    def handle_refresh(self, item):
+        if item is None:
+            self.send_error_status(404)
+            return
+        job_id = self.server_state.create_job(item, refuse_if_running=True)
+        if job_id is None:
+            self.send_error_status(
+                409,
+                'Resource Conflict',
+                f'Job for \'{item["name"]}\' is already queued. Not queuing a duplicate.')
+            return
+        job = self.server_state.get_job_state(self.server_state.jobs[job_id])
+        self.send_xml(job_xml(job), status_code=202)
+
+    def handle_job(self, job_id):
+        job = self.server_state.jobs.get(job_id)
+        if job is None:
+            self.send_error_status(404)
+            return
+        self.send_xml(job_xml(self.server_state.get_job_state(job)))
+
+    def handle_job_list(self, query):
+        jobs = [self.server_state.get_job_state(job)
+                for job in list(self.server_state.jobs.values())]
+        self.send_page('backgroundJob', jobs, query, background_job_xml)
+
+
+def project_xml(project):
+    return f'<project id="{project["id"]}" name={quoteattr(project["name"])}/>'
+
+
+def item_project_xml(item):
+    return f'<project id="{item["project_id"]}" name={quoteattr(item["project_name"])}/>'
+
+
+def workbook_xml(workbook):
+    return (
+        f'<workbook id="{workbook["id"]}" name={quoteattr(workbook["name"])} '
+        f'updatedAt="{format_timestamp(workbook["updated_at"])}">'
+        f'{item_project_xml(workbook)}</workbook>')
+
+
+def datasource_xml(datasource):
+    return (
+        f'<datasource id="{datasource["id"]}" name={quoteattr(datasource["name"])} '
+        f'updatedAt="{format_timestamp(datasource["updated_at"])}">'
+        f'{item_project_xml(datasource)}</datasource>')
+
+
+def view_xml(view):
+    return (
+        f'<view id="{view["id"]}" name={quoteattr(view["name"])} '
+        f'updatedAt="{format_timestamp(view["updated_at"])}">'
+        f'<workbook id="{view["workbook_id"]}"/>{item_project_xml(view)}</view>')
+
+
+ITEM_XML = {
+    'workbooks': workbook_xml,
+    'datasources': datasource_xml,
+    'views': view_xml,
+}
+
+
+def job_xml(job):
+    resource = job['resource']
+    completed_at = format_timestamp(job['completed_at'])
+    return (
+        f'<job id="{job["id"]}" mode="Asynchronous" type="RefreshExtract" progress="{job["progress"]}" '
+        f'createdAt="{format_timestamp(job["created_at"])}" startedAt="{format_timestamp(job["started_at"])}"'
+        + (f' completedAt="{completed_at}" finishCode="0"' if completed_at else '')
+        + f'><extractRefreshJob><{resource["type"]} id="{resource["id"]}" name={quoteattr(resource["name"])}/>'
+        + '</extractRefreshJob></job>')
+
+
+def background_job_xml(job):
+    ended_at = format_timestamp(job['completed_at'])
+    return (
+        f'<backgroundJob id="{job["id"]}" status="{job["status"]}" priority="50" jobType="refresh_extracts" '
+        f'title={quoteattr(job["title"])} createdAt="{format_timestamp(job["created_at"])}" '
+        f'startedAt="{format_timestamp(job["started_at"])}"'
+        + (f' endedAt="{ended_at}"' if ended_at else '')
+        + '/>')
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', dest='port', type=int, default=8000)
+    parser.add_argument('--projects', dest='projects', type=int, default=2)
+    parser.add_argument(
+        '--workbooks-per-project',
+        dest='workbooks_per_project',
+        type=int,
+        default=5)
+    parser.add_argument(
+        '--views-per-workbook',
+        dest='views_per_workbook',
+        type=int,
+        default=5)
+    parser.add_argument(
+        '--datasources-per-project',
+        dest='datasources_per_project',
+        type=int,
+        default=2)
+    parser.add_argument(
+        '--export-size',
+        dest='export_size',
+        type=int,
+        default=100 * 1024)
+    parser.add_argument('--latency', dest='latency', type=float, default=0)
+    parser.add_argument(
+        '--failure-rate',
+        dest='failure_rate',
+        type=float,
+        default=0)
+    parser.add_argument(
+        '--throttle-rate',
+        dest='throttle_rate',
+        type=float,
+        default=0)
+    parser.add_argument(
+        '--job-duration',
+        dest='job_duration',
+        type=float,
+        default=2.0)
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    site = MockSite(
+        args.projects,
+        args.workbooks_per_project,
+        args.views_per_workbook,
+        args.datasources_per_project)
+    server = MockTableauServer(
+        site=site,
+        export_size=args.export_size,
+        latency={endpoint: args.latency for endpoint in ENDPOINTS},
+        failure_rates={endpoint: args.failure_rate for endpoint in ENDPOINTS},
+        throttle_rates={
+            endpoint: args.throttle_rate for endpoint in ENDPOINTS},
+        job_duration=args.job_duration,
+        port=args.port)
+    with server:
+        print(f'Serving a mock Tableau site at {server.url}')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+"""
+Measures the blueprint entry points end to end against the local mock Tableau server.
+
+Each case runs a blueprint as its own process, the way Shipyard runs it, and records wall
+time, the number of REST requests the mock server received, the peak RSS of the process
+and the phase timings from the blueprint's metrics file. Cases cover every combination of
+site size and export size, and view exports are measured as PDF, CSV and Parquet, since
+text exports and the Parquet conversion take different paths through the download.
+
+    python benchmarks/run_benchmarks.py --output-file-name results.json
+    python benchmarks/run_benchmarks.py --baseline-file-name results.json --max-regression 0.2
+
+With a baseline, the run exits with 1 when any case's median wall time, request count or
+peak RSS grew by more than --max-regression, so performance and memory changes can be gated.
+"""
+import argparse
+import functools
+import glob
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import mock_tableau_server
+except BaseException:
+    from . import mock_tableau_server
+
+BLUEPRINTS_FOLDER_NAME = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'tableau_blueprints')
+SITE_SIZES = {
+    'small': {
+        'projects': 2,
+        'workbooks_per_project': 5,
+        'views_per_workbook': 5,
+        'datasources_per_project': 2},
+    'large': {
+        'projects': 50,
+        'workbooks_per_project': 40,
+        'views_per_workbook': 10,
+        'datasources_per_project': 20},
+}
+EXPORT_SIZES = {
+    '100KB': 100 * 1024,
+    '20MB': 20 * 1024 * 1024,
+}
+JOB_COUNT = 10
+METRICS_FILE_NAME = 'metrics.json'
+CREDENTIAL_ARGUMENTS = [
+    '--username', 'benchmark',
+    '--password', 'benchmark',
+    '--site-id', 'default',
+]
+
+
+def download_view_arguments(server, working_folder_name, file_type='pdf'):
+    return [
+        'download_view.py',
+        '--project-name', 'Project 1',
+        '--workbook-name', 'Workbook 1-1',
+        '--view-name', 'View 1',
+        '--file-type', file_type,
+        '--destination-file-name', f'view.{file_type}',
+        '--destination-folder-name', working_folder_name,
+    ]
+
+
+def refresh_resource_arguments(server, working_folder_name):
+    return [
+        'refresh_resource.py',
+        '--project-name', 'Project 1',
+        '--datasource-name', 'Datasource 1-1',
+        '--check-status', 'TRUE',
+    ]
+
+
+def job_status_arguments(server, working_folder_name):
+    job_ids = [
+        server.create_job(datasource)
+        for datasource in server.site.datasources[:JOB_COUNT]]
+    return [
+        'job_status.py',
+        '--job-ids', ','.join(job_ids),
+        '--wait-for-completion', 'TRUE',
+    ]
+
+
+ENTRY_POINTS = {
+    'download_view': download_view_arguments,
+    'download_view_csv': functools.partial(download_view_arguments, file_type='csv'),
+    'download_view_parquet': functools.partial(download_view_arguments, file_type='parquet'),
+    'refresh_resource': refresh_resource_arguments,
+    'job_status': job_status_arguments,
+}
+# The Parquet case needs pyarrow, so it only runs by default where pyarrow is installed.
+DEFAULT_ENTRY_POINTS = [
+    entry_point for entry_point in ENTRY_POINTS
+    if entry_point != 'download_view_parquet' or importlib.util.find_spec('pyarrow')]
+
+
+def run_blueprint(server, entry_point):
+    """
+    Runs one blueprint process against the mock server and returns its measurements.
+    """
+    server.reset_request_counts()
+    with tempfile.TemporaryDirectory() as working_folder_name:
+        script_name, *arguments = ENTRY_POINTS[entry_point](
+            server, working_folder_name)
+        command = [
+            sys.executable,
+            os.path.join(BLUEPRINTS_FOLDER_NAME, script_name),
+            *CREDENTIAL_ARGUMENTS,
+            '--server-url', server.url,
+            '--metrics-file-name', METRICS_FILE_NAME,
+            *arguments]
+        start_time = time.perf_counter()
+        process = subprocess.Popen(
+            command,
+            cwd=working_folder_name,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE)
+        _, status, resource_usage = os.wait4(process.pid, 0)
+        wall_time = time.perf_counter() - start_time
+        stderr = process.stderr.read().decode('utf-8', 'replace')
+        process.stderr.close()
+        phases = {}
+        for metrics_file_name in glob.glob(
+                os.path.join(working_folder_name, '**', METRICS_FILE_NAME), recursive=True):
+            with open(metrics_file_name) as f:
+                phases = json.load(f).get('phases', {})
+
+    exit_code = os.WEXITSTATUS(status) if os.WIFEXITED(
+        status) else -os.WTERMSIG(status)
+    if exit_code != 0:
+        print(f'{entry_point} exited with {exit_code}: {stderr.strip()[-500:]}')
+    return {
+        'exit_code': exit_code,
+        'wall_time_seconds': wall_time,
+        'request_count': sum(server.get_request_counts().values()),
+        # ru_maxrss is reported in kilobytes on Linux.
+        'peak_rss_mb': resource_usage.ru_maxrss / 1024,
+        'phases': {
+            name: phase['total_seconds'] for name, phase in phases.items()},
+    }
+
+
+def run_case(
+        entry_point,
+        site_size,
+        export_size,
+        repeat,
+        latency=0,
+        failure_rate=0,
+        throttle_rate=0,
+        job_duration=2.0):
+    site = mock_tableau_server.MockSite(**SITE_SIZES[site_size])
+    endpoints = mock_tableau_server.ENDPOINTS
+    server = mock_tableau_server.MockTableauServer(
+        site=site,
+        export_size=EXPORT_SIZES[export_size],
+        latency={endpoint: latency for endpoint in endpoints},
+        failure_rates={endpoint: failure_rate for endpoint in endpoints},
+        throttle_rates={endpoint: throttle_rate for endpoint in endpoints},
+        job_duration=job_duration)
+    with server:
+        runs = [run_blueprint(server, entry_point) for _ in range(repeat)]
+    return {
+        'entry_point': entry_point,
+        'site_size': site_size,
+        'export_size': export_size,
+        'runs': runs,
+        'failed_runs': sum(run['exit_code'] != 0 for run in runs),
+        'wall_time_seconds': round(statistics.median(
+            run['wall_time_seconds'] for run in runs), 3),
+        'request_count': statistics.median(run['request_count'] for run in runs),
+        'peak_rss_mb': round(max(run['peak_rss_mb'] for run in runs), 1),
+    }
+
+
+def get_case_key(result):
+    return f'{result["entry_point"]}/{result["site_size"]}/{result["export_size"]}'
+
+
+def find_regressions(results, baseline_results, max_regression):
+    """
+    Returns a description of every case whose wall time, request count or peak RSS grew by more than max_regression.
+    """
+    baseline_by_case = {
+        get_case_key(result): result for result in baseline_results}
+    regressions = []
+    for result in results:
+        baseline = baseline_by_case.get(get_case_key(result))
+        if not baseline:
+            continue
+        for measurement in ('wall_time_seconds', 'request_count', 'peak_rss_mb'):
+            limit = baseline[measurement] * (1 + max_regression)
+            if result[measurement] > limit:
+                regressions.append(
+                    f'{get_case_key(result)} {measurement}: {baseline[measurement]} -> {result[measurement]}')
+    return regressions
+
+
+def print_results(results):
+    print(
+        f'{"Case":<42} {"Wall (s)":>9} {"Requests":>9} {"Peak RSS (MB)":>14} {"Failed":>7}')
+    for result in results:
+        print(
+            f'{get_case_key(result):<42} {result["wall_time_seconds"]:>9} {result["request_count"]:>9} '
+            f'{result["peak_rss_mb"]:>14} {result["failed_runs"]:>7}')
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--entry-points',
+        dest='entry_points',
+        default=','.join(DEFAULT_ENTRY_POINTS))
+    parser.add_argument(
+        '--site-sizes',
+        dest='site_sizes',
+        default=','.join(SITE_SIZES))
+    parser.add_argument(
+        '--export-sizes',
+        dest='export_sizes',
+        default=','.join(EXPORT_SIZES))
+    parser.add_argument('--repeat', dest='repeat', type=int, default=3)
+    parser.add_argument('--latency', dest='latency', type=float, default=0)
+    parser.add_argument(
+        '--failure-rate',
+        dest='failure_rate',
+        type=float,
+        default=0)
+    parser.add_argument(
+        '--throttle-rate',
+        dest='throttle_rate',
+        type=float,
+        default=0)
+    parser.add_argument(
+        '--job-duration',
+        dest='job_duration',
+        type=float,
+        default=2.0)
+    parser.add_argument(
+        '--output-file-name',
+        dest='output_file_name',
+        default=None)
+    parser.add_argument(
+        '--baseline-file-name',
+        dest='baseline_file_name',
+        default=None)
+    parser.add_argument(
+        '--max-regression',
+        dest='max_regression',
+        type=float,
+        default=0.2)
+    args = parser.parse_args()
+    for option, names, valid_names in (
+            ('--entry-points', args.entry_points, ENTRY_POINTS),
+            ('--site-sizes', args.site_sizes, SITE_SIZES),
+            ('--export-sizes', args.export_sizes, EXPORT_SIZES)):
+        invalid_names = set(names.split(',')) - set(valid_names)
+        if invalid_names:
+            parser.error(
+                f'{option} has invalid values {", ".join(sorted(invalid_names))}. Valid options are {", ".join(valid_names)}')
+    return args
+
+
+def main():
+    args = get_args()
+    results = []
+    for entry_point in args.entry_points.split(','):
+        for site_size in args.site_sizes.split(','):
+            # Only view exports depend on the export size.
+            export_sizes = args.export_sizes.split(
+                ',') if entry_point.startswith('download_view') else args.export_sizes.split(',')[:1]
+            for export_size in export_sizes:
+                results.append(run_case(
+                    entry_point,
+                    site_size,
+                    export_size,
+                    args.repeat,
+                    latency=args.latency,
+                    failure_rate=args.failure_rate,
+                    throttle_rate=args.throttle_rate,
+                    job_duration=args.job_duration))
+    print_results(results)
+
+    if args.output_file_name:
+        with open(args.output_file_name, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    exit_code = 0
+    if any(result['failed_runs'] for result in results):
+        exit_code = 1
+    if args.baseline_file_name:
+        with open(args.baseline_file_name) as f:
+            regressions = find_regressions(
+                results, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        if regressions:
+            exit_code = 1
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
@@ -19,6 +19,11 @@ config = {
     "author_email": "tech@shipyardapp.com",
     "packages": find_packages(),
     "install_requires": install_requires,
+    "extras_require": {
+        "parquet": ["pyarrow>=7.0.0"],
+        "async": ["aiohttp>=3.7.0"],
+        "zstd": ["zstandard>=0.15.0"],
+    },
     "name": "googlebigquery-blueprints",
     "version": "v0.1.0",
     "license": "Apache-2.0",
@@ -0,0 +1,313 @@
+"""
+An asyncio engine for the Tableau REST calls the blueprints make, so one process can keep
+hundreds of lookups, exports and job polls in flight on a single thread.
+
+Requests are built with TSC's RequestFactory and request options, and responses are parsed
+into the same TSC model items that TSC's endpoints return. The *_async functions in
+authorization, lookup, download_view, refresh_resource and job_status are the async
+counterparts of their synchronous functions and take an AsyncServer in place of a TSC.Server.
+
+Requires aiohttp, which is installed with pip install aiohttp.
+"""
+import copy
+import importlib.util
+import time
+
+try:
+    import lazy_imports
+    import metrics
+    import rate_limit
+    import transport
+except BaseException:
+    from . import lazy_imports
+    from . import metrics
+    from . import rate_limit
+    from . import transport
+
+TSC = lazy_imports.lazy_import('tableauserverclient')
+aiohttp = lazy_imports.lazy_import('aiohttp')
+asyncio = lazy_imports.lazy_import('asyncio')
+ElementTree = lazy_imports.lazy_import('defusedxml.ElementTree')
+
+# Connections are cheap on an event loop, so the pool is sized for many requests in flight.
+DEFAULT_POOL_SIZE = 100
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+# The earliest REST API version with the serverInfo endpoint, used to detect the server's version.
+SERVER_INFO_VERSION = '2.4'
+# Only idempotent requests are retried on a throttled or unavailable response,
+# so sign-ins and refresh requests are never sent twice.
+RETRY_METHODS = ('GET',)
+XML_CONTENT_TYPE = 'text/xml'
+
+
+def is_aiohttp_installed():
+    return importlib.util.find_spec('aiohttp') is not None
+
+
+def get_retry_after(response):
+    """
+    Returns the seconds to wait from a Retry-After header, or None when there isn't one in seconds.
+    """
+    retry_after = response.headers.get('Retry-After', '')
+    return int(retry_after) if retry_after.isdigit() else None
+
+
+async def iterate_response_content(response, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields the body of a response in chunks, releasing the connection once exhausted.
+    """
+    async with response:
+        async for chunk in response.content.iter_chunked(chunk_size):
+            metrics.record_bytes_received(len(chunk))
+            yield chunk
+
+
+class AsyncServer():
+    """
+    Holds a signed-in session and sends REST requests on a pooled aiohttp session.
+
+    It has the server_address, site_id, user_id, auth_token and version attributes of a TSC.Server,
+    so the lookup cache and session cache work with either. Create it inside a running event loop,
+    and close it, or use it as an async context manager, when done.
+    """
+
+    def __init__(
+            self,
+            server_address,
+            pool_size=DEFAULT_POOL_SIZE,
+            max_retries=transport.DEFAULT_MAX_RETRIES,
+            read_timeout=transport.DEFAULT_READ_TIMEOUT,
+            rate_limiter=None):
+        self.server_address = server_address
+        self.version = SERVER_INFO_VERSION
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter
+        self.sign_out_on_close = True
+        self._set_auth(None, None, None)
+        self._namespace = TSC.namespace.Namespace()
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=pool_size),
+            timeout=aiohttp.ClientTimeout(
+                sock_connect=transport.DEFAULT_CONNECT_TIMEOUT,
+                sock_read=read_timeout))
+
+    @property
+    def baseurl(self):
+        return f'{self.server_address}/api/{self.version}'
+
+    @property
+    def namespace(self):
+        return self._namespace()
+
+    def _set_auth(self, site_id, user_id, auth_token):
+        self.site_id = site_id
+        self.user_id = user_id
+        self.auth_token = auth_token
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """
+        Signs out, unless the session is kept open for reuse, and closes the connection pool.
+        """
+        try:
+            if self.sign_out_on_close:
+                await self.sign_out()
+        finally:
+            await self.session.close()
+
+    async def send(
+            self,
+            method,
+            url,
+            content=None,
+            req_options=None,
+            authenticated=True):
+        """
+        Sends a request and returns the response, which the caller releases.
+        A failed response raises the same error TSC would.
+
+        Connection failures are retried, as are throttled or unavailable responses to
+        GET requests, with the same backoff and Retry-After handling as the synchronous transport.
+        With a rate_limiter, every attempt first waits for its share of the host's request budget.
+        """
+        headers = {}
+        if authenticated:
+            headers['x-tableau-auth'] = self.auth_token
+        if content is not None:
+            headers['content-type'] = XML_CONTENT_TYPE
+        params = req_options.get_query_params() if req_options else None
+        retry_number = 0
+        while True:
+            if self.rate_limiter:
+                delay = self.rate_limiter.reserve(url)
+                rate_limit.record_wait(delay)
+                await asyncio.sleep(delay)
+            start_counter = time.perf_counter()
+            try:
+                response = await self.session.request(
+                    method, url, data=content, params=params, headers=headers)
+            except aiohttp.ClientConnectorError:
+                if retry_number >= self.max_retries:
+                    raise
+                retry_number += 1
+                await asyncio.sleep(transport.get_backoff_time(retry_number))
+                continue
+            # The body is counted where it is read, since Content-Length is missing from chunked responses.
+            metrics.record_request(
+                response.status,
+                time.perf_counter() - start_counter)
+            if response.status in transport.RETRY_STATUS_CODES and method in RETRY_METHODS \
+                    and retry_number < self.max_retries:
+                retry_after = get_retry_after(response)
+                response.release()
+                retry_number += 1
+                await asyncio.sleep(
+                    retry_after if retry_after is not None else transport.get_backoff_time(retry_number))
+                continue
+            if response.status not in transport.SUCCESS_STATUS_CODES:
+                async with response:
+                    error_content = await response.read()
+                metrics.record_bytes_received(len(error_content))
+                raise transport.create_response_error(
+                    response.status, error_content, self.namespace)
+            return response
+
+    async def request(
+            self,
+            method,
+            url,
+            content=None,
+            req_options=None,
+            authenticated=True):
+        """
+        Sends a request and returns the response body.
+        """
+        response = await self.send(
+            method, url, content, req_options, authenticated)
+        async with response:
+            response_content = await response.read()
+        metrics.record_bytes_received(len(response_content))
+        self._namespace.detect(response_content)
+        return response_content
+
+    async def stream(self, url, req_options=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Sends a GET request and returns an async iterator over the response body, so
+        the body is never held in memory. The request is sent before this returns.
+        """
+        response = await self.send('GET', url, req_options=req_options)
+        return iterate_response_content(response, chunk_size)
+
+    async def use_server_version(self):
+        self.version = SERVER_INFO_VERSION
+        response_content = await self.request(
+            'GET', f'{self.baseurl}/serverInfo', authenticated=False)
+        self.version = TSC.models.ServerInfoItem.from_response(
+            response_content, self.namespace).rest_api_version
+
+    async def sign_in(self, auth_item):
+        """
+        Signs in with a TSC.TableauAuth or TSC.PersonalAccessTokenAuth.
+        """
+        response_content = await self.request(
+            'POST',
+            f'{self.baseurl}/auth/signin',
+            TSC.server.request_factory.RequestFactory.Auth.signin_req(auth_item),
+            authenticated=False)
+        parsed_response = ElementTree.fromstring(response_content)
+        self._set_auth(
+            parsed_response.find('.//t:site', namespaces=self.namespace).get('id'),
+            parsed_response.find('.//t:user', namespaces=self.namespace).get('id'),
+            parsed_response.find('t:credentials', namespaces=self.namespace).get('token'))
+
+    async def sign_out(self):
+        if self.auth_token is None:
+            return
+        await self.request('POST', f'{self.baseurl}/auth/signout', b'')
+        self._set_auth(None, None, None)
+
+    async def is_session_valid(self):
+        """
+        Async counterpart of session_cache.is_session_valid.
+        """
+        try:
+            async with self.session.get(
+                    f'{self.baseurl}/sessions/current',
+                    headers={'x-tableau-auth': self.auth_token}) as response:
+                return response.status != 401
+        except Exception:
+            return False
+
+    async def get_items(self, endpoint, item_class, req_options=None):
+        """
+        Returns one page of a site endpoint such as 'views' or 'jobs', as the items and the
+        pagination that the TSC endpoint's get would return. item_class is the TSC model of the endpoint's items.
+        """
+        response_content = await self.request(
+            'GET',
+            f'{self.baseurl}/sites/{self.site_id}/{endpoint}',
+            req_options=req_options)
+        return item_class.from_response(response_content, self.namespace), \
+            TSC.PaginationItem.from_response(response_content, self.namespace)
+
+    async def pager(self, endpoint, item_class, req_options=None):
+        """
+        Yields every item of the endpoint, loading one page at a time like TSC.Pager.
+        """
+        req_options = copy.copy(req_options) if req_options else TSC.RequestOptions()
+        while True:
+            items, pagination_item = await self.get_items(
+                endpoint, item_class, req_options)
+            for item in items:
+                yield item
+            if not items or pagination_item.total_available is None or \
+                    pagination_item.page_number * pagination_item.page_size >= pagination_item.total_available:
+                return
+            req_options.pagenumber = pagination_item.page_number + 1
+
+    async def get_job(self, job_id):
+        """
+        Async counterpart of server.jobs.get_by_id.
+        """
+        response_content = await self.request(
+            'GET', f'{self.baseurl}/sites/{self.site_id}/jobs/{job_id}')
+        return TSC.JobItem.from_response(response_content, self.namespace)[0]
+
+    async def refresh(self, endpoint, resource_id):
+        """
+        Async counterpart of server.datasources.refresh and server.workbooks.refresh,
+        where endpoint is 'datasources' or 'workbooks'. Returns the refresh job.
+        """
+        response_content = await self.request(
+            'POST',
+            f'{self.baseurl}/sites/{self.site_id}/{endpoint}/{resource_id}/refresh',
+            TSC.server.request_factory.RequestFactory.Empty.empty_req())
+        return TSC.JobItem.from_response(response_content, self.namespace)[0]
+
+    async def export(self, endpoint, item_id, export_type, req_options=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Streams an export such as a view's image, pdf or data, returning an async iterator over its bytes.
+        """
+        return await self.stream(
+            f'{self.baseurl}/sites/{self.site_id}/{endpoint}/{item_id}/{export_type}',
+            req_options,
+            chunk_size)
+
+
+async def create_server(server_url, transport_options=None, use_server_version=True):
+    """
+    Async counterpart of transport.create_server.
+    """
+    server = AsyncServer(server_url, **(transport_options or {}))
+    if use_server_version:
+        try:
+            await server.use_server_version()
+        except BaseException:
+            await server.session.close()
+            raise
+    return server
@@ -1,15 +1,73 @@
 import sys
-import tableauserverclient as TSC
+
+try:
+    import async_client
+    import lazy_imports
+    import metrics
+    import session_cache
+    import transport
+except BaseException:
+    from . import async_client
+    from . import lazy_imports
+    from . import metrics
+    from . import session_cache
+    from . import transport
+
+TSC = lazy_imports.lazy_import('tableauserverclient')
 
 EXIT_CODE_INVALID_CREDENTIALS = 200
 
 
+def add_connection_arguments(parser):
+    """
+    Adds the optional connection settings shared by every blueprint that signs in to Tableau.
+    """
+    parser.add_argument(
+        '--session-cache-file-name',
+        dest='session_cache_file_name',
+        default=None,
+        required=False)
+    transport.add_transport_arguments(parser)
+
+
+def get_connection_options(args):
+    """
+    Returns the keyword arguments for connect_to_tableau from the parsed connection settings.
+    """
+    return {
+        'session_cache_file_name': args.session_cache_file_name,
+        'transport_options': transport.get_transport_options(args),
+    }
+
+
+def create_tableau_auth(username, password, site_id, sign_in_method):
+    if sign_in_method == 'username_password':
+        return TSC.TableauAuth(username, password, site_id=site_id)
+    return TSC.PersonalAccessTokenAuth(
+        token_name=username,
+        personal_access_token=password,
+        site_id=site_id)
+
+
+def print_sign_in_failure(sign_in_method, error):
+    print(f'Failed to connect to Tableau.')
+    if sign_in_method == 'username_password':
+        print('Invalid username or password. Please check for typos and try again.')
+    if sign_in_method == 'access_token':
+        print(
+            'Invalid token name or access token. Please check for typos and try again.')
+    print(error)
+
+
+@metrics.timed('sign_in')
 def connect_to_tableau(
         username,
         password,
         site_id,
         server_url,
-        sign_in_method):
+        sign_in_method,
+        session_cache_file_name=None,
+        transport_options=None):
     """TSC library to sign in and sign out of Tableau Server and Tableau Online.
 
     :param username:The username or access token name of the user.
@@ -17,37 +75,172 @@ def connect_to_tableau(
     :param site_id: The site_id for required datasources. ex: ffc7f88a-85a7-48d5-ac03-09ef0a677280
     :param server_url: This corresponds to the contentUrl attribute in the Tableau REST API.
     :param sign_in_method: Whether to log in with username_password or access_token.
+    :param session_cache_file_name: Optional file used to share the auth token between runs.
+        When provided, the connection object does not sign out, so the session stays reusable.
+    :param transport_options: Optional connection pool size, retry count, timeout and rate limiter for every request.
     :return: server object, connection object
     """
     # handle the cases where the tableau server does not have a specific site
     if str(site_id).lower() == 'default': 
         site_id = ''
+    tableau_auth = create_tableau_auth(
+        username, password, site_id, sign_in_method)
 
-    if sign_in_method == 'username_password':
-        tableau_auth = TSC.TableauAuth(username, password, site_id=site_id)
+    if session_cache_file_name:
+        cache_key = session_cache.get_cache_key(
+            server_url, site_id, username, password, sign_in_method)
+        return connect_with_session_cache(
+            server_url,
+            tableau_auth,
+            sign_in_method,
+            session_cache_file_name,
+            cache_key,
+            transport_options)
+
+    return sign_in(server_url, tableau_auth, sign_in_method, transport_options)
 
-    if sign_in_method == 'access_token':
-        tableau_auth = TSC.PersonalAccessTokenAuth(
-            token_name=username,
-            personal_access_token=password,
-            site_id=site_id)
 
+def sign_in(server_url, tableau_auth, sign_in_method, transport_options=None):
     try:
         # Make sure we use an updated version of the rest apis.
-        server = TSC.Server(
+        server = transport.create_server(
             server_url,
+            transport_options,
             use_server_version=True,
         )
         connection = server.auth.sign_in(tableau_auth)
         print("Successfully authenticated with Tableau.")
     except Exception as e:
-        print(f'Failed to connect to Tableau.')
-        if sign_in_method == 'username_password':
-            print('Invalid username or password. Please check for typos and try again.')
-        if sign_in_method == 'access_token':
-            print(
-                'Invalid token name or access token. Please check for typos and try again.')
-        print(e)
+        print_sign_in_failure(sign_in_method, e)
         sys.exit(EXIT_CODE_INVALID_CREDENTIALS)
 
     return server, connection
+
+
+def restore_cached_session(server_url, cached_session, transport_options=None):
+    """
+    Returns a server using the cached session, or None if Tableau no longer accepts its token.
+    """
+    server = session_cache.restore_session(
+        transport.create_server(
+            server_url, transport_options, use_server_version=False),
+        cached_session)
+    if session_cache.is_session_valid(server):
+        return server
+    return None
+
+
+def connect_with_session_cache(
+        server_url,
+        tableau_auth,
+        sign_in_method,
+        session_cache_file_name,
+        cache_key,
+        transport_options=None):
+    """
+    Reuses the cached session for these credentials while Tableau still accepts it, and signs in otherwise.
+
+    Signing in happens under an exclusive lock on the cache file, so concurrent runs
+    with an expired token wait for a single sign-in instead of each signing in.
+    """
+    with session_cache.locked_session_cache(session_cache_file_name, exclusive=False) as sessions:
+        cached_session = sessions.get(cache_key)
+    if cached_session:
+        server = restore_cached_session(
+            server_url, cached_session, transport_options)
+        if server:
+            print("Reusing cached Tableau session.")
+            return server, session_cache.keep_session_open(server)
+
+    with session_cache.locked_session_cache(session_cache_file_name, exclusive=True) as sessions:
+        refreshed_session = sessions.get(cache_key)
+        if refreshed_session and refreshed_session != cached_session:
+            # Another run signed in while this one was waiting for the lock.
+            server = restore_cached_session(
+                server_url, refreshed_session, transport_options)
+            if server:
+                print("Reusing cached Tableau session.")
+                return server, session_cache.keep_session_open(server)
+        server, connection = sign_in(
+            server_url, tableau_auth, sign_in_method, transport_options)
+        sessions[cache_key] = session_cache.capture_session(server)
+
+    return server, session_cache.keep_session_open(server)
+
+
+async def connect_to_tableau_async(
+        username,
+        password,
+        site_id,
+        server_url,
+        sign_in_method,
+        session_cache_file_name=None,
+        transport_options=None):
+    """
+    Async counterpart of connect_to_tableau. Returns a signed-in async_client.AsyncServer,
+    which signs out when it is closed unless its session came from or was added to the session cache.
+    """
+    if str(site_id).lower() == 'default':
+        site_id = ''
+    tableau_auth = create_tableau_auth(
+        username, password, site_id, sign_in_method)
+
+    with metrics.phase('sign_in'):
+        if not session_cache_file_name:
+            return await sign_in_async(
+                server_url, tableau_auth, sign_in_method, transport_options)
+
+        cache_key = session_cache.get_cache_key(
+            server_url, site_id, username, password, sign_in_method)
+        with session_cache.locked_session_cache(session_cache_file_name, exclusive=False) as sessions:
+            cached_session = sessions.get(cache_key)
+        if cached_session:
+            server = await restore_cached_session_async(
+                server_url, cached_session, transport_options)
+            if server:
+                print("Reusing cached Tableau session.")
+                return server
+
+        with session_cache.locked_session_cache(session_cache_file_name, exclusive=True) as sessions:
+            refreshed_session = sessions.get(cache_key)
+            if refreshed_session and refreshed_session != cached_session:
+                # Another run signed in while this one was waiting for the lock.
+                server = await restore_cached_session_async(
+                    server_url, refreshed_session, transport_options)
+                if server:
+                    print("Reusing cached Tableau session.")
+                    return server
+            server = await sign_in_async(
+                server_url, tableau_auth, sign_in_method, transport_options)
+            server.sign_out_on_close = False
+            sessions[cache_key] = session_cache.capture_session(server)
+        return server
+
+
+async def sign_in_async(server_url, tableau_auth, sign_in_method, transport_options=None):
+    server = None
+    try:
+        server = await async_client.create_server(server_url, transport_options)
+        await server.sign_in(tableau_auth)
+        print("Successfully authenticated with Tableau.")
+    except Exception as e:
+        if server:
+            await server.session.close()
+        print_sign_in_failure(sign_in_method, e)
+        sys.exit(EXIT_CODE_INVALID_CREDENTIALS)
+    return server
+
+
+async def restore_cached_session_async(server_url, cached_session, transport_options=None):
+    """
+    Async counterpart of restore_cached_session.
+    """
+    server = session_cache.restore_session(
+        await async_client.create_server(
+            server_url, transport_options, use_server_version=False),
+        cached_session)
+    server.sign_out_on_close = False
+    if await server.is_session_valid():
+        return server
+    await server.session.close()
+    return None
@@ -0,0 +1,492 @@
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import async_client
+    import authorization
+    import download_view
+    import errors
+    import export_cache
+    import export_compression
+    import lazy_imports
+    import lookup
+    import lookup_cache
+    import manifest
+    import metrics
+    import parquet_export
+except BaseException:
+    from . import async_client
+    from . import authorization
+    from . import download_view
+    from . import errors
+    from . import export_cache
+    from . import export_compression
+    from . import lazy_imports
+    from . import lookup
+    from . import lookup_cache
+    from . import manifest
+    from . import metrics
+    from . import parquet_export
+
+TSC = lazy_imports.lazy_import('tableauserverclient')
+shipyard = lazy_imports.lazy_import('shipyard_utils')
+asyncio = lazy_imports.lazy_import('asyncio')
+
+MANIFEST_REQUIRED_FIELDS = (
+    'project_name',
+    'workbook_name',
+    'view_name',
+    'file_type',
+    'destination_file_name')
+MANIFEST_OPTIONAL_FIELDS = ('destination_folder_name',)
+VALID_FILE_TYPES = ('png', 'pdf', 'csv', 'parquet')
+# threads downloads on a thread pool of --max-workers threads, and async keeps up to
+# --max-workers downloads in flight on one event loop, which scales to hundreds of views.
+ENGINES = ('threads', 'async')
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--username', dest='username', required=True)
+    parser.add_argument('--password', dest='password', required=True)
+    parser.add_argument(
+        '--sign-in-method',
+        dest='sign_in_method',
+        default='username_password',
+        choices={
+            'username_password',
+            'access_token'},
+        required=False)
+    parser.add_argument('--site-id', dest='site_id', required=True)
+    parser.add_argument('--server-url', dest='server_url', required=True)
+    parser.add_argument(
+        '--manifest-file-name',
+        dest='manifest_file_name',
+        required=True)
+    parser.add_argument(
+        '--max-workers',
+        dest='max_workers',
+        type=int,
+        default=4,
+        required=False)
+    parser.add_argument(
+        '--summary-file-name',
+        dest='summary_file_name',
+        default='download_summary.json',
+        required=False)
+    parser.add_argument(
+        '--engine',
+        dest='engine',
+        choices=ENGINES,
+        type=str.lower,
+        default='threads',
+        required=False)
+    lookup_cache.add_lookup_cache_arguments(parser)
+    export_cache.add_export_cache_arguments(parser)
+    parquet_export.add_parquet_arguments(parser)
+    export_compression.add_compression_arguments(parser)
+    authorization.add_connection_arguments(parser)
+    metrics.add_metrics_arguments(parser)
+    lazy_imports.add_profile_startup_argument(parser)
+    args = parser.parse_args()
+    if args.max_workers < 1:
+        parser.error('--max-workers must be at least 1.')
+    if args.engine == 'async':
+        if not async_client.is_aiohttp_installed():
+            parser.error(
+                '--engine async requires aiohttp. Install it with pip install aiohttp.')
+        if args.export_cache_folder_name:
+            parser.error(
+                '--export-cache-folder-name is not supported with --engine async.')
+    compression_error = export_compression.get_compression_error(args)
+    if compression_error:
+        parser.error(compression_error)
+    return args
+
+
+def read_download_manifest(manifest_file_name):
+    """
+    Reads the manifest of views to download and validates every entry before signing in.
+    """
+    entries = manifest.read_manifest(
+        manifest_file_name,
+        MANIFEST_REQUIRED_FIELDS,
+        MANIFEST_OPTIONAL_FIELDS)
+    for row_number, entry in enumerate(entries, start=1):
+        entry['file_type'] = entry['file_type'].lower()
+        if entry['file_type'] not in VALID_FILE_TYPES:
+            print(
+                f'Manifest entry {row_number} has an invalid file_type {entry["file_type"]}. Valid options are {", ".join(VALID_FILE_TYPES)}')
+            sys.exit(errors.EXIT_CODE_INVALID_MANIFEST)
+        entry['destination_folder_name'] = shipyard.files.clean_folder_name(
+            entry['destination_folder_name'] or '')
+    # Checked here rather than in get_args, since only a manifest with Parquet entries needs pyarrow.
+    has_parquet_entries = any(entry['file_type'] == 'parquet' for entry in entries)
+    if has_parquet_entries and not parquet_export.is_pyarrow_installed():
+        print(
+            'The manifest has parquet entries, which require pyarrow. Install it with pip install pyarrow.')
+        sys.exit(errors.EXIT_CODE_INVALID_MANIFEST)
+    return entries
+
+
+class IdResolver():
+    """
+    Shares project and workbook lookups between the entries of a batch, so that entries
+    sharing a project or workbook only resolve it once, even when they run on different
+    threads. Fully resolved view IDs are also read from and written to the lookup cache
+    when one is provided.
+    """
+
+    def __init__(self, server, cache=None):
+        self.server = server
+        self.cache = cache
+        self._project_ids = {}
+        self._workbook_ids = {}
+
+    def get_view_ids(self, project_name, workbook_name, view_name, refresh=False):
+        return lookup.get_view_ids(
+            server=self.server,
+            project_name=project_name,
+            workbook_name=workbook_name,
+            view_name=view_name,
+            cache=self.cache,
+            refresh=refresh,
+            project_ids=self._project_ids,
+            workbook_ids=self._workbook_ids)
+
+
+class AsyncIdResolver():
+    """
+    Async counterpart of IdResolver. Entries that need the same project or workbook wait
+    for the first of them to look it up.
+    """
+
+    def __init__(self, server, cache=None):
+        self.server = server
+        self.cache = cache
+        self._project_ids = {}
+        self._workbook_ids = {}
+
+    async def get_view_ids(self, project_name, workbook_name, view_name, refresh=False):
+        return await lookup.get_view_ids_async(
+            server=self.server,
+            project_name=project_name,
+            workbook_name=workbook_name,
+            view_name=view_name,
+            cache=self.cache,
+            refresh=refresh,
+            project_ids=self._project_ids,
+            workbook_ids=self._workbook_ids)
+
+
+def create_result(entry, destination_full_path, exit_code, reused_cached_export, start_time):
+    return {
+        'project_name': entry['project_name'],
+        'workbook_name': entry['workbook_name'],
+        'view_name': entry['view_name'],
+        'file_type': entry['file_type'],
+        'destination_full_path': destination_full_path,
+        'exit_code': exit_code,
+        'reused_cached_export': reused_cached_export,
+        'status': 'success' if exit_code == errors.EXIT_CODE_FINAL_STATUS_SUCCESS else 'failed',
+        'duration_seconds': round(time.time() - start_time, 3),
+    }
+
+
+def get_destination_full_path(entry, compression_options=None):
+    return shipyard.files.combine_folder_and_file_name(
+        folder_name=entry['destination_folder_name'],
+        file_name=export_compression.get_file_name(
+            entry['destination_file_name'],
+            (compression_options or {}).get('compression', 'none')))
+
+
+def download_manifest_entry(
+        server,
+        resolver,
+        entry,
+        exports=None,
+        parquet_options=None,
+        compression_options=None):
+    """
+    Downloads a single manifest entry and returns its result record.
+
+    The underlying lookup and write functions exit on failure, so their exit code
+    is captured here and recorded instead of ending the whole batch.
+    """
+    compression_options = export_compression.get_file_compression_options(
+        compression_options, entry['file_type'])
+    # Parquet options are part of the export cache key, so they're only passed for Parquet entries.
+    if entry['file_type'] != 'parquet':
+        parquet_options = None
+    destination_full_path = get_destination_full_path(
+        entry, compression_options)
+    start_time = time.time()
+    reused_cached_export = False
+    try:
+        view_ids = resolver.get_view_ids(
+            project_name=entry['project_name'],
+            workbook_name=entry['workbook_name'],
+            view_name=entry['view_name'])
+        try:
+            reused_cached_export = download_view.download_view_to_file(
+                server=server,
+                view_ids=view_ids,
+                file_type=entry['file_type'],
+                destination_full_path=destination_full_path,
+                view_name=entry['view_name'],
+                cache=exports,
+                parquet_options=parquet_options,
+                compression_options=compression_options)
+        except TSC.ServerResponseError as e:
+            if resolver.cache is None or not lookup.is_not_found_error(e):
+                raise
+            view_ids = resolver.get_view_ids(
+                project_name=entry['project_name'],
+                workbook_name=entry['workbook_name'],
+                view_name=entry['view_name'],
+                refresh=True)
+            reused_cached_export = download_view.download_view_to_file(
+                server=server,
+                view_ids=view_ids,
+                file_type=entry['file_type'],
+                destination_full_path=destination_full_path,
+                view_name=entry['view_name'],
+                cache=exports,
+                parquet_options=parquet_options,
+                compression_options=compression_options)
+        exit_code = errors.EXIT_CODE_FINAL_STATUS_SUCCESS
+    except SystemExit as e:
+        exit_code = e.code
+    except Exception as e:
+        print(f'Failed to download {entry["view_name"]}.')
+        print(e)
+        exit_code = errors.EXIT_CODE_UNKNOWN_ERROR
+
+    return create_result(
+        entry, destination_full_path, exit_code, reused_cached_export, start_time)
+
+
+async def download_manifest_entry_async(
+        server,
+        resolver,
+        entry,
+        parquet_options=None,
+        compression_options=None):
+    """
+    Async counterpart of download_manifest_entry.
+    """
+    compression_options = export_compression.get_file_compression_options(
+        compression_options, entry['file_type'])
+    if entry['file_type'] != 'parquet':
+        parquet_options = None
+    destination_full_path = get_destination_full_path(
+        entry, compression_options)
+    start_time = time.time()
+    try:
+        view_ids = await resolver.get_view_ids(
+            project_name=entry['project_name'],
+            workbook_name=entry['workbook_name'],
+            view_name=entry['view_name'])
+        try:
+            await download_view.download_view_to_file_async(
+                server=server,
+                view_ids=view_ids,
+                file_type=entry['file_type'],
+                destination_full_path=destination_full_path,
+                view_name=entry['view_name'],
+                parquet_options=parquet_options,
+                compression_options=compression_options)
+        except TSC.ServerResponseError as e:
+            if resolver.cache is None or not lookup.is_not_found_error(e):
+                raise
+            view_ids = await resolver.get_view_ids(
+                project_name=entry['project_name'],
+                workbook_name=entry['workbook_name'],
+                view_name=entry['view_name'],
+                refresh=True)
+            await download_view.download_view_to_file_async(
+                server=server,
+                view_ids=view_ids,
+                file_type=entry['file_type'],
+                destination_full_path=destination_full_path,
+                view_name=entry['view_name'],
+                parquet_options=parquet_options,
+                compression_options=compression_options)
+        exit_code = errors.EXIT_CODE_FINAL_STATUS_SUCCESS
+    except SystemExit as e:
+        # Caught here, as a SystemExit escaping an asyncio task stops the event loop.
+        exit_code = e.code
+    except Exception as e:
+        print(f'Failed to download {entry["view_name"]}.')
+        print(e)
+        exit_code = errors.EXIT_CODE_UNKNOWN_ERROR
+
+    return create_result(
+        entry, destination_full_path, exit_code, False, start_time)
+
+
+def download_manifest(
+        server,
+        entries,
+        max_workers,
+        cache=None,
+        exports=None,
+        parquet_options=None,
+        compression_options=None):
+    """
+    Downloads every manifest entry on a bounded thread pool that shares one signed-in session.
+    Results are returned in manifest order.
+    """
+    resolver = IdResolver(server, cache)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(
+            lambda entry: download_manifest_entry(
+                server, resolver, entry, exports, parquet_options, compression_options),
+            entries))
+    return results
+
+
+async def download_manifest_async(
+        server,
+        entries,
+        max_workers,
+        cache=None,
+        parquet_options=None,
+        compression_options=None):
+    """
+    Async counterpart of download_manifest, which keeps up to max_workers downloads in flight on the event loop.
+    """
+    resolver = AsyncIdResolver(server, cache)
+    in_flight = asyncio.Semaphore(max_workers)
+
+    async def download_entry(entry):
+        async with in_flight:
+            return await download_manifest_entry_async(
+                server, resolver, entry, parquet_options, compression_options)
+
+    return list(await asyncio.gather(*map(download_entry, entries)))
+
+
+async def download_manifest_with_async_engine(
+        username,
+        password,
+        site_id,
+        server_url,
+        sign_in_method,
+        connection_options,
+        entries,
+        max_workers,
+        cache=None,
+        parquet_options=None,
+        compression_options=None):
+    """
+    Signs in with the async engine and downloads every manifest entry on one event loop.
+    The connection pool is sized to max_workers, so every download in flight has its own connection.
+    """
+    transport_options = dict(
+        connection_options['transport_options'], pool_size=max_workers)
+    server = await authorization.connect_to_tableau_async(
+        username,
+        password,
+        site_id,
+        server_url,
+        sign_in_method,
+        session_cache_file_name=connection_options['session_cache_file_name'],
+        transport_options=transport_options)
+    async with server:
+        return await download_manifest_async(
+            server, entries, max_workers, cache, parquet_options, compression_options)
+
+
+def print_results_summary(results):
+    failed_results = [
+        result for result in results if result['status'] != 'success']
+    print(
+        f'{len(results) - len(failed_results)} of {len(results)} views downloaded successfully.')
+    for result in failed_results:
+        print(
+            f'Failed: {result["project_name"]}/{result["workbook_name"]}/{result["view_name"]} (exit code {result["exit_code"]})')
+
+
+def determine_batch_exit_code(results):
+    """
+    Returns the exit code of the first failed entry, in manifest order, or success if every entry succeeded.
+    """
+    for result in results:
+        if result['exit_code'] != errors.EXIT_CODE_FINAL_STATUS_SUCCESS:
+            return result['exit_code']
+    return errors.EXIT_CODE_FINAL_STATUS_SUCCESS
+
+
+def main():
+    args = get_args()
+    metrics.start(args)
+    username = args.username
+    password = args.password
+    site_id = args.site_id
+    server_url = args.server_url
+    sign_in_method = args.sign_in_method
+    max_workers = args.max_workers
+
+    entries = read_download_manifest(args.manifest_file_name)
+    cache = lookup_cache.create_lookup_cache(
+        args.lookup_cache_ttl,
+        args.lookup_cache_folder_name,
+        args.catalog_file_name)
+    exports = export_cache.create_export_cache(
+        args.export_cache_folder_name, args.export_cache_max_age)
+    parquet_options = parquet_export.get_parquet_options(args, 'parquet')
+    compression_options = export_compression.get_compression_options(args)
+
+    base_folder_name = shipyard.logs.determine_base_artifact_folder(
+        'tableau')
+    artifact_subfolder_paths = shipyard.logs.determine_artifact_subfolders(
+        base_folder_name)
+    shipyard.logs.create_artifacts_folders(artifact_subfolder_paths)
+
+    if args.engine == 'async':
+        results = asyncio.run(download_manifest_with_async_engine(
+            username,
+            password,
+            site_id,
+            server_url,
+            sign_in_method,
+            authorization.get_connection_options(args),
+            entries,
+            max_workers,
+            cache,
+            parquet_options,
+            compression_options))
+    else:
+        server, connection = authorization.connect_to_tableau(
+            username,
+            password,
+            site_id,
+            server_url,
+            sign_in_method,
+            **authorization.get_connection_options(args))
+
+        with connection:
+            results = download_manifest(
+                server,
+                entries,
+                max_workers,
+                cache,
+                exports,
+                parquet_options,
+                compression_options)
+
+    print_results_summary(results)
+    if exports:
+        exports.print_summary()
+    summary_file_name = shipyard.files.combine_folder_and_file_name(
+        artifact_subfolder_paths['responses'], args.summary_file_name)
+    shipyard.files.write_json_to_file(results, summary_file_name)
+    sys.exit(determine_batch_exit_code(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+import argparse
+import os
+import sqlite3
+import sys
+
+try:
+    import authorization
+    import errors
+    import lazy_imports
+    import metrics
+except BaseException:
+    from . import authorization
+    from . import errors
+    from . import lazy_imports
+    from . import metrics
+
+TSC = lazy_imports.lazy_import('tableauserverclient')
+shipyard = lazy_imports.lazy_import('shipyard_utils')
+
+SYNC_PAGE_SIZE = 1000
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalog_info (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS sync_watermarks (
+    resource_type TEXT PRIMARY KEY,
+    watermark TEXT
+);
+CREATE TABLE IF NOT EXISTS projects (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    parent_project_id TEXT
+);
+CREATE INDEX IF NOT EXISTS projects_name ON projects (name);
+CREATE TABLE IF NOT EXISTS workbooks (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    project_id TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS workbooks_project_name ON workbooks (project_id, name);
+CREATE TABLE IF NOT EXISTS views (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    project_id TEXT,
+    workbook_id TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS views_workbook_name ON views (workbook_id, name);
+CREATE TABLE IF NOT EXISTS datasources (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    project_id TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS datasources_project_name ON datasources (project_id, name);
+"""
+
+# Each name path maps to a query over the indexed name columns that returns the IDs along the path.
+NAME_PATH_QUERIES = {
+    'view': (
+        """SELECT p.id, w.id, v.id FROM projects p
+           JOIN workbooks w ON w.project_id = p.id
+           JOIN views v ON v.workbook_id = w.id
+           WHERE p.name = ? AND w.name = ? AND v.name = ?""",
+        ('project_id', 'workbook_id', 'view_id')),
+    'workbook': (
+        """SELECT p.id, w.id FROM projects p
+           JOIN workbooks w ON w.project_id = p.id
+           WHERE p.name = ? AND w.name = ?""",
+        ('project_id', 'workbook_id')),
+    'datasource': (
+        """SELECT p.id, d.id FROM projects p
+           JOIN datasources d ON d.project_id = p.id
+           WHERE p.name = ? AND d.name = ?""",
+        ('project_id', 'datasource_id')),
+}
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--username', dest='username', required=True)
+    parser.add_argument('--password', dest='password', required=True)
+    parser.add_argument(
+        '--sign-in-method',
+        dest='sign_in_method',
+        default='username_password',
+        choices={
+            'username_password',
+            'access_token'},
+        required=False)
+    parser.add_argument('--site-id', dest='site_id', required=True)
+    parser.add_argument('--server-url', dest='server_url', required=True)
+    parser.add_argument(
+        '--catalog-file-name',
+        dest='catalog_file_name',
+        required=True)
+    parser.add_argument('--full-sync', dest='full_sync', default='FALSE',
+                        required=False)
+    authorization.add_connection_arguments(parser)
+    metrics.add_metrics_arguments(parser)
+    lazy_imports.add_profile_startup_argument(parser)
+    args = parser.parse_args()
+    return args
+
+
+def format_timestamp(timestamp):
+    return timestamp.strftime(TIMESTAMP_FORMAT) if timestamp else None
+
+
+def open_catalog(catalog_file_name):
+    folder_name = os.path.dirname(os.path.abspath(catalog_file_name))
+    os.makedirs(folder_name, exist_ok=True)
+    connection = sqlite3.connect(catalog_file_name)
+    connection.executescript(CATALOG_SCHEMA)
+    return connection
+
+
+def prepare_catalog(connection, server, full_sync):
+    """
+    Clears the catalog when a full sync is requested or it was built for a different server or site,
+    then records which server and site it describes.
+    """
+    catalog_info = dict(connection.execute(
+        'SELECT key, value FROM catalog_info').fetchall())
+    same_site = (
+        catalog_info.get('server_url') == server.server_address and
+        catalog_info.get('site_id') == server.site_id)
+    if full_sync or not same_site:
+        for table_name in (
+                'projects',
+                'workbooks',
+                'views',
+                'datasources',
+                'sync_watermarks'):
+            connection.execute(f'DELETE FROM {table_name}')
+    connection.executemany(
+        'INSERT OR REPLACE INTO catalog_info (key, value) VALUES (?, ?)',
+        [('server_url', server.server_address), ('site_id', server.site_id)])
+
+
+def get_watermark(connection, resource_type):
+    row = connection.execute(
+        'SELECT watermark FROM sync_watermarks WHERE resource_type = ?',
+        (resource_type,)).fetchone()
+    return row[0] if row else None
+
+
+def set_watermark(connection, resource_type, watermark):
+    connection.execute(
+        'INSERT OR REPLACE INTO sync_watermarks (resource_type, watermark) VALUES (?, ?)',
+        (resource_type, watermark))
+
+
+def iterate_updated_items(endpoint, watermark):
+    """
+    Pages through every item of the endpoint, or only those updated at or after the watermark.
+    """
+    req_option = TSC.RequestOptions(pagesize=SYNC_PAGE_SIZE)
+    if watermark:
+        req_option.filter.add(TSC.Filter(TSC.RequestOptions.Field.UpdatedAt,
+                                         TSC.RequestOptions.Operator.GreaterThanOrEqual,
+                                         watermark))
+    return TSC.Pager(endpoint, req_option)
+
+
+def sync_projects(connection, server):
+    """
+    Projects have no updated timestamp in TSC, and there are few of them, so they are always fully synced.
+    """
+    rows = [(project.id, project.name, project.parent_id)
+            for project in TSC.Pager(server.projects, TSC.RequestOptions(pagesize=SYNC_PAGE_SIZE))]
+    connection.execute('DELETE FROM projects')
+    connection.executemany(
+        'INSERT INTO projects (id, name, parent_project_id) VALUES (?, ?, ?)',
+        rows)
+    return len(rows)
+
+
+def sync_resource(connection, resource_type, endpoint, to_row, insert_sql):
+    """
+    Upserts every item updated since the last sync and advances the watermark to the newest updated_at seen.
+    """
+    watermark = get_watermark(connection, resource_type)
+    rows = []
+    for item in iterate_updated_items(endpoint, watermark):
+        rows.append(to_row(item))
+        updated_at = format_timestamp(item.updated_at)
+        if updated_at and (watermark is None or updated_at > watermark):
+            watermark = updated_at
+    connection.executemany(insert_sql, rows)
+    if watermark:
+        set_watermark(connection, resource_type, watermark)
+    return len(rows)
+
+
+@metrics.timed('sync_catalog')
+def sync_catalog(connection, server, full_sync=False):
+    """
+    Brings the catalog up to date with the site and returns the number of items fetched per resource type.
+
+    Incremental syncs only fetch items updated since the previous sync, so deleted items
+    stay in the catalog until the next full sync.
+    """
+    prepare_catalog(connection, server, full_sync)
+    synced_counts = {'projects': sync_projects(connection, server)}
+    synced_counts['workbooks'] = sync_resource(
+        connection,
+        'workbooks',
+        server.workbooks,
+        lambda workbook: (
+            workbook.id,
+            workbook.name,
+            workbook.project_id,
+            format_timestamp(workbook.updated_at)),
+        'INSERT OR REPLACE INTO workbooks (id, name, project_id, updated_at) VALUES (?, ?, ?, ?)')
+    synced_counts['views'] = sync_resource(
+        connection,
+        'views',
+        server.views,
+        lambda view: (
+            view.id,
+            view.name,
+            view.project_id,
+            view.workbook_id,
+            format_timestamp(view.updated_at)),
+        'INSERT OR REPLACE INTO views (id, name, project_id, workbook_id, updated_at) VALUES (?, ?, ?, ?, ?)')
+    synced_counts['datasources'] = sync_resource(
+        connection,
+        'datasources',
+        server.datasources,
+        lambda datasource: (
+            datasource.id,
+            datasource.name,
+            datasource.project_id,
+            format_timestamp(datasource.updated_at)),
+        'INSERT OR REPLACE INTO datasources (id, name, project_id, updated_at) VALUES (?, ?, ?, ?)')
+    connection.commit()
+    return synced_counts
+
+
+class CatalogIndex():
+    """
+    Resolves name paths from a synced catalog instead of the REST API.
+
+    Provides the same get/set/invalidate interface as lookup_cache.LookupCache, so it can be
+    passed wherever a lookup cache is accepted. Only a single unambiguous match is returned;
+    anything else falls back to a live lookup.
+    """
+
+    def __init__(self, catalog_file_name):
+        self.catalog_file_name = catalog_file_name
+
+    def get(self, server, name_path):
+        resource_type, names = name_path[0], name_path[1:]
+        if resource_type not in NAME_PATH_QUERIES:
+            return None
+        query, id_names = NAME_PATH_QUERIES[resource_type]
+        try:
+            connection = sqlite3.connect(
+                f'file:{self.catalog_file_name}?mode=ro', uri=True)
+        except sqlite3.Error:
+            return None
+        try:
+            catalog_info = dict(connection.execute(
+                'SELECT key, value FROM catalog_info').fetchall())
+            if catalog_info.get('server_url') != server.server_address or catalog_info.get(
+                    'site_id') != server.site_id:
+                return None
+            rows = connection.execute(query, names).fetchmany(2)
+        except sqlite3.Error:
+            return None
+        finally:
+            connection.close()
+        if len(rows) != 1:
+            return None
+        return dict(zip(id_names, rows[0]))
+
+    def set(self, server, name_path, ids):
+        pass
+
+    def invalidate(self, server, name_path):
+        pass
+
+
+def main():
+    args = get_args()
+    metrics.start(args)
+    username = args.username
+    password = args.password
+    site_id = args.site_id
+    server_url = args.server_url
+    sign_in_method = args.sign_in_method
+    full_sync = shipyard.args.convert_to_boolean(args.full_sync)
+
+    server, connection = authorization.connect_to_tableau(
+        username,
+        password,
+        site_id,
+        server_url,
+        sign_in_method,
+        **authorization.get_connection_options(args))
+
+    with connection:
+        try:
+            catalog_connection = open_catalog(args.catalog_file_name)
+        except (OSError, sqlite3.Error) as e:
+            print(f'Could not open catalog file: {args.catalog_file_name}')
+            print(e)
+            sys.exit(errors.EXIT_CODE_FILE_WRITE_ERROR)
+        with catalog_connection:
+            synced_counts = sync_catalog(
+                catalog_connection, server, full_sync)
+        catalog_connection.close()
+
+    for resource_type, count in synced_counts.items():
+        print(f'Synced {count} {resource_type}.')
+    print(f'Catalog saved to {args.catalog_file_name}')
+
+
+if __name__ == '__main__':
+    main()
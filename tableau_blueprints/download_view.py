@@ -1,17 +1,56 @@
 import argparse
+import functools
+import json
+import os
 import sys
-import shipyard_utils as shipyard
-
-import tableauserverclient as TSC
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 
 try:
     import authorization
     import errors
+    import export_cache
+    import export_compression
+    import lazy_imports
     import lookup
+    import lookup_cache
+    import metrics
+    import parquet_export
+    import transport
+    import worker_client
 except BaseException:
     from . import authorization
     from . import errors
+    from . import export_cache
+    from . import export_compression
+    from . import lazy_imports
     from . import lookup
+    from . import lookup_cache
+    from . import metrics
+    from . import parquet_export
+    from . import transport
+    from . import worker_client
+
+TSC = lazy_imports.lazy_import('tableauserverclient')
+shipyard = lazy_imports.lazy_import('shipyard_utils')
+requests = lazy_imports.lazy_import('requests')
+aiohttp = lazy_imports.lazy_import('aiohttp')
+asyncio = lazy_imports.lazy_import('asyncio')
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+VIEW_EXPORT_ENDPOINTS = {
+    'png': 'image',
+    'pdf': 'pdf',
+    'csv': 'data',
+    'parquet': 'data',
+}
+REQUEST_OPTIONS_CLASS_NAMES = {
+    'png': 'ImageRequestOptions',
+    'pdf': 'PDFRequestOptions',
+    'csv': 'CSVRequestOptions',
+    'parquet': 'CSVRequestOptions',
+}
 
 
 def get_args():
@@ -35,7 +74,8 @@ def get_args():
         choices=[
             'png',
             'pdf',
-            'csv'],
+            'csv',
+            'parquet'],
         type=str.lower,
         required=True)
     parser.add_argument(
@@ -51,51 +91,499 @@ def get_args():
     parser.add_argument('--file-options', dest='file_options', required=False)
     parser.add_argument('--workbook-name', dest='workbook_name', required=True)
     parser.add_argument('--project-name', dest='project_name', required=True)
+    parser.add_argument('--filter-name', dest='filter_name', required=False)
+    parser.add_argument(
+        '--filter-values',
+        dest='filter_values',
+        default='',
+        required=False)
+    parser.add_argument(
+        '--filter-values-file-name',
+        dest='filter_values_file_name',
+        default=None,
+        required=False)
+    parser.add_argument(
+        '--max-workers',
+        dest='max_workers',
+        type=int,
+        default=4,
+        required=False)
+    lookup_cache.add_lookup_cache_arguments(parser)
+    export_cache.add_export_cache_arguments(parser)
+    parquet_export.add_parquet_arguments(parser)
+    export_compression.add_compression_arguments(parser)
+    authorization.add_connection_arguments(parser)
+    metrics.add_metrics_arguments(parser)
+    lazy_imports.add_profile_startup_argument(parser)
+    worker_client.add_worker_arguments(parser)
     args = parser.parse_args()
+    try:
+        args.file_options = parse_file_options(
+            args.file_type, args.file_options)
+    except (TypeError, ValueError) as e:
+        parser.error(f'--file-options is invalid: {e}')
+    has_filter_values = bool(
+        args.filter_values or args.filter_values_file_name)
+    if bool(args.filter_name) != has_filter_values:
+        parser.error(
+            '--filter-name must be provided together with --filter-values or --filter-values-file-name.')
+    if args.max_workers < 1:
+        parser.error('--max-workers must be at least 1.')
+    if args.file_type == 'parquet' and not parquet_export.is_pyarrow_installed():
+        parser.error(
+            '--file-type parquet requires pyarrow. Install it with pip install pyarrow.')
+    compression_error = export_compression.get_compression_error(args)
+    if compression_error:
+        parser.error(compression_error)
+    if args.file_type == 'parquet' and args.compression != 'none':
+        parser.error(
+            '--compression is not supported with --file-type parquet. Use --parquet-compression instead.')
     return args
 
 
-def generate_view_content(server, view_id, file_type):
+def parse_file_options(file_type, file_options):
+    """
+    Parses --file-options, a JSON object of export settings such as
+    {"page_type": "a4", "orientation": "landscape", "filters": {"Region": "West"}}.
+    The keys match the arguments of the TSC request options class for the file type.
+    """
+    if not file_options:
+        return None
+    file_options = json.loads(file_options)
+    if not isinstance(file_options, dict):
+        raise ValueError('expected a JSON object')
+    build_request_options(file_type, file_options)
+    return file_options
+
+
+def build_request_options(file_type, file_options=None, view_filters=None):
+    """
+    Builds the request options for an export, or returns None when there is nothing to set.
+    """
+    file_options = dict(file_options or {})
+    view_filters = {**file_options.pop('filters', {}), **(view_filters or {})}
+    if not file_options and not view_filters:
+        return None
+    req_options = getattr(TSC, REQUEST_OPTIONS_CLASS_NAMES[file_type])(
+        **file_options)
+    for name, value in view_filters.items():
+        req_options.vf(name, value)
+    return req_options
+
+
+def read_filter_values(filter_values, filter_values_file_name=None):
+    """
+    Combines comma-separated filter values with those listed one per line in a file, dropping blanks and duplicates.
+    """
+    values = filter_values.split(',') if filter_values else []
+    if filter_values_file_name:
+        try:
+            with open(filter_values_file_name, 'r') as f:
+                values.extend(f.read().splitlines())
+        except OSError as e:
+            print(f'Could not read filter values file: {filter_values_file_name}')
+            print(e)
+            sys.exit(errors.EXIT_CODE_UNKNOWN_ERROR)
+    return list(dict.fromkeys(
+        value.strip() for value in values if value.strip()))
+
+
+@metrics.timed('render')
+def generate_view_content(server, view_id, file_type, req_options=None):
+    """
+    Given a specific view_id, request the export and return an iterator over the bytes necessary for creating the file.
+
+    The export is streamed in DOWNLOAD_CHUNK_SIZE chunks, so the full file is never held in memory.
+    """
+    url = f'{server.views.baseurl}/{view_id}/{VIEW_EXPORT_ENDPOINTS[file_type]}'
+    server_response = transport.send_streamed_request(server, url, req_options)
+    return iterate_response_content(server_response)
+
+
+async def generate_view_content_async(server, view_id, file_type, req_options=None):
+    """
+    Async counterpart of generate_view_content, returning an async iterator over the export's bytes.
+    """
+    with metrics.phase('render'):
+        return await server.export(
+            'views',
+            view_id,
+            VIEW_EXPORT_ENDPOINTS[file_type],
+            req_options,
+            DOWNLOAD_CHUNK_SIZE)
+
+
+def iterate_response_content(server_response):
     """
-    Given a specific view_id, populate the view and return the bytes necessary for creating the file.
+    Yield the body of a streamed response in fixed-size chunks, releasing the connection once exhausted.
     """
-    view_object = server.views.get_by_id(view_id)
-    if file_type == 'png':
-        server.views.populate_image(view_object)
-        view_content = view_object.image
-    if file_type == 'pdf':
-        server.views.populate_pdf(view_object, req_options=None)
-        view_content = view_object.pdf
-    if file_type == 'csv':
-        server.views.populate_csv(view_object, req_options=None)
-        view_content = view_object.csv
-    return view_content
+    with closing(server_response):
+        for chunk in server_response.iter_content(DOWNLOAD_CHUNK_SIZE):
+            metrics.record_bytes_received(len(chunk))
+            yield chunk
+
+
+def remove_file_if_exists(file_name):
+    try:
+        os.remove(file_name)
+    except (FileNotFoundError, NotADirectoryError):
+        pass
 
 
+@metrics.timed('write')
 def write_view_content_to_file(
         destination_full_path,
         view_content,
         file_type,
-        view_name):
+        view_name,
+        parquet_options=None,
+        compression_options=None):
     """
-    Write the byte contents to the specified file path.
+    Write the byte contents to the specified file path. Parquet exports are converted
+    from the streamed CSV as they are written.
+
+    Chunks are written to a temporary file in the destination folder, which is fsynced
+    and then renamed into place, so an interrupted download never leaves a truncated file.
+    With compression_options, chunks are compressed and the written bytes hashed for the
+    checksum sidecar as they stream through, so the file is still written in a single pass.
     """
+    if isinstance(view_content, bytes):
+        view_content = [view_content]
+    compression_options = compression_options or {}
+    compression = compression_options.get('compression', 'none')
+    destination_folder_name = os.path.dirname(
+        os.path.abspath(destination_full_path))
+    temporary_full_path = os.path.join(
+        destination_folder_name,
+        f'.{os.path.basename(destination_full_path)}.{uuid.uuid4().hex[:8]}.part')
     try:
-        with open(destination_full_path, 'wb') as f:
-            if file_type == 'csv':
-                f.writelines(view_content)
-            else:
-                f.write(view_content)
+        with open(temporary_full_path, 'xb') as f:
+            output = export_compression.HashingWriter(f) \
+                if compression_options.get('checksum') else f
+            with export_compression.open_compressor(
+                    output,
+                    compression,
+                    compression_options.get('compression_level')) as compressor:
+                if file_type == 'parquet':
+                    parquet_export.write_csv_as_parquet(
+                        view_content, compressor, **(parquet_options or {}))
+                else:
+                    for chunk in view_content:
+                        compressor.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+            metrics.increment('bytes_written', f.tell())
+        os.replace(temporary_full_path, destination_full_path)
+        if compression_options.get('checksum'):
+            export_compression.write_checksum_file(
+                destination_full_path, output.get_checksum(), compression)
+        fsync_folder(destination_folder_name)
         print(
             f'Successfully downloaded {view_name} to {destination_full_path}')
+    except requests.exceptions.RequestException:
+        remove_file_if_exists(temporary_full_path)
+        raise
     except OSError as e:
+        remove_file_if_exists(temporary_full_path)
         print(f'Could not write file: {destination_full_path}')
         print(e)
         sys.exit(errors.EXIT_CODE_FILE_WRITE_ERROR)
+    except BaseException:
+        remove_file_if_exists(temporary_full_path)
+        raise
+
+
+def iterate_async_content(view_content, loop):
+    """
+    Yields the chunks of an async iterator to a thread other than the event loop's, fetching each chunk on the loop.
+    """
+    while True:
+        try:
+            yield asyncio.run_coroutine_threadsafe(
+                view_content.__anext__(), loop).result()
+        except StopAsyncIteration:
+            return
+
+
+async def write_view_content_to_file_async(
+        destination_full_path,
+        view_content,
+        file_type,
+        view_name,
+        parquet_options=None,
+        compression_options=None):
+    """
+    Async counterpart of write_view_content_to_file for an async iterator of chunks.
+
+    Chunks are written as they arrive and only the fsyncs run on the default executor, so a
+    download holds a thread just while its file is synced. The Parquet conversion reads the
+    CSV with blocking calls, and compression would hold up the event loop, so both run
+    write_view_content_to_file on the executor instead.
+    """
+    loop = asyncio.get_event_loop()
+    compression_options = compression_options or {}
+    if file_type == 'parquet' or compression_options.get('compression', 'none') != 'none':
+        return await loop.run_in_executor(None, functools.partial(
+            write_view_content_to_file,
+            destination_full_path,
+            iterate_async_content(view_content, loop),
+            file_type,
+            view_name,
+            parquet_options,
+            compression_options))
+
+    destination_folder_name = os.path.dirname(
+        os.path.abspath(destination_full_path))
+    temporary_full_path = os.path.join(
+        destination_folder_name,
+        f'.{os.path.basename(destination_full_path)}.{uuid.uuid4().hex[:8]}.part')
+    with metrics.phase('write'):
+        try:
+            with open(temporary_full_path, 'xb') as f:
+                output = export_compression.HashingWriter(f) \
+                    if compression_options.get('checksum') else f
+                async for chunk in view_content:
+                    output.write(chunk)
+                f.flush()
+                await loop.run_in_executor(None, os.fsync, f.fileno())
+                metrics.increment('bytes_written', f.tell())
+            os.replace(temporary_full_path, destination_full_path)
+            if compression_options.get('checksum'):
+                export_compression.write_checksum_file(
+                    destination_full_path, output.get_checksum())
+            await loop.run_in_executor(None, fsync_folder, destination_folder_name)
+            print(
+                f'Successfully downloaded {view_name} to {destination_full_path}')
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            # Checked before OSError, which some connection errors subclass.
+            remove_file_if_exists(temporary_full_path)
+            raise
+        except OSError as e:
+            remove_file_if_exists(temporary_full_path)
+            print(f'Could not write file: {destination_full_path}')
+            print(e)
+            sys.exit(errors.EXIT_CODE_FILE_WRITE_ERROR)
+        except BaseException:
+            remove_file_if_exists(temporary_full_path)
+            raise
+
+
+def fsync_folder(folder_name):
+    """
+    Persist a rename by syncing the folder entry. Not every platform allows opening a folder, so failures are ignored.
+    """
+    try:
+        folder_descriptor = os.open(folder_name, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(folder_descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(folder_descriptor)
+
+
+def write_cached_export_checksum(destination_full_path, compression_options=None):
+    """
+    A reused cached export isn't downloaded, so its checksum sidecar is written from the file on disk.
+    """
+    if not (compression_options or {}).get('checksum'):
+        return
+    export_compression.write_checksum_file(
+        destination_full_path,
+        export_compression.hash_file(destination_full_path),
+        compression_options['compression'])
+
+
+def download_view_to_file(
+        server,
+        view_ids,
+        file_type,
+        destination_full_path,
+        view_name,
+        req_options=None,
+        cache=None,
+        parquet_options=None,
+        compression_options=None):
+    """
+    Downloads the view to destination_full_path, reusing an export from the export cache
+    when neither the view's workbook nor its datasources have changed since it was cached.
+    Returns True when the cached export was reused.
+    """
+    with metrics.phase(
+            'download_view',
+            view_name=view_name,
+            file_type=file_type,
+            destination_full_path=destination_full_path):
+        # The cached export is copied into the destination folder, so it has to exist first.
+        shipyard.files.create_folder_if_dne(
+            destination_folder_name=os.path.dirname(destination_full_path))
+        if cache:
+            export_options = req_options.get_query_params() if req_options else None
+            if parquet_options:
+                export_options = {
+                    'query': export_options, 'parquet': parquet_options}
+            if export_compression.get_cache_options(compression_options):
+                export_options = {
+                    'query': export_options,
+                    'compression': export_compression.get_cache_options(compression_options)}
+            cache_key = cache.get_cache_key(
+                server, view_ids, file_type, export_options)
+            if cache.fetch(cache_key, destination_full_path):
+                print(
+                    f'{view_name} is unchanged since it was last downloaded. Reused the cached export at {destination_full_path}')
+                write_cached_export_checksum(
+                    destination_full_path, compression_options)
+                return True
+
+        view_content = generate_view_content(
+            server=server,
+            view_id=view_ids['view_id'],
+            file_type=file_type,
+            req_options=req_options)
+        write_view_content_to_file(
+            destination_full_path=destination_full_path,
+            view_content=view_content,
+            file_type=file_type,
+            view_name=view_name,
+            parquet_options=parquet_options,
+            compression_options=compression_options)
+        if cache:
+            cache.store(cache_key, destination_full_path)
+        return False
+
+
+async def download_view_to_file_async(
+        server,
+        view_ids,
+        file_type,
+        destination_full_path,
+        view_name,
+        req_options=None,
+        parquet_options=None,
+        compression_options=None):
+    """
+    Async counterpart of download_view_to_file. The export cache is not used, as its keys are built with synchronous calls.
+    """
+    with metrics.phase(
+            'download_view',
+            view_name=view_name,
+            file_type=file_type,
+            destination_full_path=destination_full_path):
+        view_content = await generate_view_content_async(
+            server=server,
+            view_id=view_ids['view_id'],
+            file_type=file_type,
+            req_options=req_options)
+        shipyard.files.create_folder_if_dne(
+            destination_folder_name=os.path.dirname(destination_full_path))
+        await write_view_content_to_file_async(
+            destination_full_path=destination_full_path,
+            view_content=view_content,
+            file_type=file_type,
+            view_name=view_name,
+            parquet_options=parquet_options,
+            compression_options=compression_options)
+        return False
+
+
+def get_partition_full_path(
+        destination_folder_name,
+        destination_file_name,
+        filter_name,
+        filter_value):
+    """
+    Places each slice in its own filter_name=filter_value folder, so every slice keeps the destination file name.
+    """
+    partition_folder_name = f'{filter_name}={filter_value}'.replace(
+        os.sep, '_')
+    return shipyard.files.combine_folder_and_file_name(
+        folder_name=os.path.join(
+            destination_folder_name, partition_folder_name),
+        file_name=destination_file_name)
+
+
+def download_view_slice(
+        server,
+        view_ids,
+        file_type,
+        destination_full_path,
+        view_name,
+        req_options,
+        cache=None,
+        parquet_options=None,
+        compression_options=None):
+    """
+    Downloads one filtered slice and returns its exit code. Failures are recorded instead of
+    ending the run, except for a missing view, which affects every slice.
+    """
+    try:
+        download_view_to_file(
+            server=server,
+            view_ids=view_ids,
+            file_type=file_type,
+            destination_full_path=destination_full_path,
+            view_name=view_name,
+            req_options=req_options,
+            cache=cache,
+            parquet_options=parquet_options,
+            compression_options=compression_options)
+        return errors.EXIT_CODE_FINAL_STATUS_SUCCESS
+    except SystemExit as e:
+        return e.code
+    except Exception as e:
+        if lookup.is_not_found_error(e):
+            raise
+        print(f'Failed to download {view_name} to {destination_full_path}.')
+        print(e)
+        return errors.EXIT_CODE_UNKNOWN_ERROR
+
+
+def download_view_slices(
+        server,
+        view_ids,
+        file_type,
+        destination_folder_name,
+        destination_file_name,
+        view_name,
+        filter_name,
+        filter_values,
+        file_options=None,
+        max_workers=4,
+        cache=None,
+        parquet_options=None,
+        compression_options=None):
+    """
+    Renders the view once per filter value on a bounded thread pool that shares one signed-in session.
+    Returns the exit code of each slice, in filter value order.
+    """
+    def download_slice(filter_value):
+        return download_view_slice(
+            server=server,
+            view_ids=view_ids,
+            file_type=file_type,
+            destination_full_path=get_partition_full_path(
+                destination_folder_name,
+                destination_file_name,
+                filter_name,
+                filter_value),
+            view_name=view_name,
+            req_options=build_request_options(
+                file_type, file_options, {filter_name: filter_value}),
+            cache=cache,
+            parquet_options=parquet_options,
+            compression_options=compression_options)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(download_slice, filter_values))
 
 
 def main():
     args = get_args()
+    worker_client.forward_to_worker(
+        args.worker_socket_file_name, 'download_view')
+    metrics.start(args)
     username = args.username
     password = args.password
     site_id = args.site_id
@@ -105,43 +593,105 @@ def main():
     file_type = args.file_type
     project_name = args.project_name
     workbook_name = args.workbook_name
+    cache = lookup_cache.create_lookup_cache(
+        args.lookup_cache_ttl,
+        args.lookup_cache_folder_name,
+        args.catalog_file_name)
+    exports = export_cache.create_export_cache(
+        args.export_cache_folder_name, args.export_cache_max_age)
+    parquet_options = parquet_export.get_parquet_options(args)
+    compression_options = export_compression.get_compression_options(args)
 
     # Set all file parameters
-    destination_file_name = args.destination_file_name
+    destination_file_name = export_compression.get_file_name(
+        args.destination_file_name, args.compression)
     destination_folder_name = shipyard.files.clean_folder_name(
         args.destination_folder_name)
     destination_full_path = shipyard.files.combine_folder_and_file_name(
         folder_name=destination_folder_name, file_name=destination_file_name)
 
+    filter_values = []
+    if args.filter_name:
+        filter_values = read_filter_values(
+            args.filter_values, args.filter_values_file_name)
+        if not filter_values:
+            print('No filter values were provided.')
+            sys.exit(errors.EXIT_CODE_UNKNOWN_ERROR)
+
     server, connection = authorization.connect_to_tableau(
         username,
         password,
         site_id,
         server_url,
-        sign_in_method)
+        sign_in_method,
+        **authorization.get_connection_options(args))
 
-    with connection:
-        project_id = lookup.get_project_id(
-            server=server, project_name=project_name)
-        workbook_id = lookup.get_workbook_id(
+    def download(view_ids):
+        if not filter_values:
+            download_view_to_file(
+                server=server,
+                view_ids=view_ids,
+                file_type=file_type,
+                destination_full_path=destination_full_path,
+                view_name=view_name,
+                req_options=build_request_options(
+                    file_type, args.file_options),
+                cache=exports,
+                parquet_options=parquet_options,
+                compression_options=compression_options)
+            return [errors.EXIT_CODE_FINAL_STATUS_SUCCESS]
+        return download_view_slices(
             server=server,
-            project_id=project_id,
-            workbook_name=workbook_name)
-        view_id = lookup.get_view_id(
+            view_ids=view_ids,
+            file_type=file_type,
+            destination_folder_name=destination_folder_name,
+            destination_file_name=destination_file_name,
+            view_name=view_name,
+            filter_name=args.filter_name,
+            filter_values=filter_values,
+            file_options=args.file_options,
+            max_workers=args.max_workers,
+            cache=exports,
+            parquet_options=parquet_options,
+            compression_options=compression_options)
+
+    with connection:
+        view_ids = lookup.get_view_ids(
             server=server,
-            project_id=project_id,
-            workbook_id=workbook_id,
-            view_name=view_name)
+            project_name=project_name,
+            workbook_name=workbook_name,
+            view_name=view_name,
+            cache=cache)
+        try:
+            exit_codes = download(view_ids)
+        except TSC.ServerResponseError as e:
+            # A cached ID can go stale if the workbook was republished,
+            # so look it up again once before giving up.
+            if cache is None or not lookup.is_not_found_error(e):
+                raise
+            print(f'The cached ID for {view_name} no longer exists. Looking it up again.')
+            view_ids = lookup.get_view_ids(
+                server=server,
+                project_name=project_name,
+                workbook_name=workbook_name,
+                view_name=view_name,
+                cache=cache,
+                refresh=True)
+            exit_codes = download(view_ids)
 
-        view_content = generate_view_content(
-            server=server, view_id=view_id, file_type=file_type)
-        shipyard.files.create_folder_if_dne(
-            destination_folder_name=destination_folder_name)
-        write_view_content_to_file(
-            destination_full_path=destination_full_path,
-            view_content=view_content,
-            file_type=file_type,
-            view_name=view_name)
+    if exports:
+        exports.print_summary()
+    if filter_values:
+        failed_values = [
+            value for value, exit_code in zip(filter_values, exit_codes)
+            if exit_code != errors.EXIT_CODE_FINAL_STATUS_SUCCESS]
+        print(
+            f'{len(filter_values) - len(failed_values)} of {len(filter_values)} slices downloaded successfully.')
+        for value in failed_values:
+            print(f'Failed: {args.filter_name}={value}')
+        for exit_code in exit_codes:
+            if exit_code != errors.EXIT_CODE_FINAL_STATUS_SUCCESS:
+                sys.exit(exit_code)
 
 
 if __name__ == '__main__':
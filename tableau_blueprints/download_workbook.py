@@ -0,0 +1,352 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import authorization
+    import download_view
+    import errors
+    import export_cache
+    import export_compression
+    import lazy_imports
+    import lookup
+    import lookup_cache
+    import metrics
+    import parquet_export
+    import transport
+except BaseException:
+    from . import authorization
+    from . import download_view
+    from . import errors
+    from . import export_cache
+    from . import export_compression
+    from . import lazy_imports
+    from . import lookup
+    from . import lookup_cache
+    from . import metrics
+    from . import parquet_export
+    from . import transport
+
+TSC = lazy_imports.lazy_import('tableauserverclient')
+shipyard = lazy_imports.lazy_import('shipyard_utils')
+
+FILE_EXTENSIONS = {
+    'png': '.png',
+    'pdf': '.pdf',
+    'csv': '.csv',
+    'parquet': '.parquet',
+}
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--username', dest='username', required=True)
+    parser.add_argument('--password', dest='password', required=True)
+    parser.add_argument(
+        '--sign-in-method',
+        dest='sign_in_method',
+        default='username_password',
+        choices={
+            'username_password',
+            'access_token'},
+        required=False)
+    parser.add_argument('--site-id', dest='site_id', required=True)
+    parser.add_argument('--server-url', dest='server_url', required=True)
+    parser.add_argument('--project-name', dest='project_name', required=True)
+    parser.add_argument('--workbook-name', dest='workbook_name', required=True)
+    parser.add_argument(
+        '--file-type',
+        dest='file_type',
+        choices=list(FILE_EXTENSIONS),
+        type=str.lower,
+        required=True)
+    parser.add_argument(
+        '--destination-folder-name',
+        dest='destination_folder_name',
+        default='',
+        required=False)
+    parser.add_argument('--file-options', dest='file_options', required=False)
+    parser.add_argument(
+        '--max-workers',
+        dest='max_workers',
+        type=int,
+        default=4,
+        required=False)
+    parser.add_argument(
+        '--index-file-name',
+        dest='index_file_name',
+        default='index.json',
+        required=False)
+    lookup_cache.add_lookup_cache_arguments(parser)
+    export_cache.add_export_cache_arguments(parser)
+    parquet_export.add_parquet_arguments(parser)
+    export_compression.add_compression_arguments(parser)
+    authorization.add_connection_arguments(parser)
+    metrics.add_metrics_arguments(parser)
+    lazy_imports.add_profile_startup_argument(parser)
+    args = parser.parse_args()
+    try:
+        args.file_options = download_view.parse_file_options(
+            args.file_type, args.file_options)
+    except (TypeError, ValueError) as e:
+        parser.error(f'--file-options is invalid: {e}')
+    if args.max_workers < 1:
+        parser.error('--max-workers must be at least 1.')
+    if args.file_type == 'parquet' and not parquet_export.is_pyarrow_installed():
+        parser.error(
+            '--file-type parquet requires pyarrow. Install it with pip install pyarrow.')
+    compression_error = export_compression.get_compression_error(args)
+    if compression_error:
+        parser.error(compression_error)
+    if args.file_type == 'parquet' and args.compression != 'none':
+        parser.error(
+            '--compression is not supported with --file-type parquet. Use --parquet-compression instead.')
+    return args
+
+
+def get_output_file_name(name, file_type, compression='none'):
+    """
+    Names an output after its view or workbook, so a name containing a path separator stays in the destination folder.
+    """
+    return export_compression.get_file_name(
+        f'{name.replace(os.sep, "_")}{FILE_EXTENSIONS[file_type]}', compression)
+
+
+@metrics.timed('render')
+def generate_workbook_pdf(server, workbook_id, req_options=None):
+    """
+    Requests the PDF of every sheet in the workbook as one render and returns an iterator over its bytes.
+
+    This is the export behind TSC's populate_pdf, streamed like view exports instead of read into memory.
+    """
+    url = f'{server.workbooks.baseurl}/{workbook_id}/pdf'
+    server_response = transport.send_streamed_request(server, url, req_options)
+    return download_view.iterate_response_content(server_response)
+
+
+def download_workbook_pdf(
+        server,
+        workbook_ids,
+        workbook_name,
+        destination_full_path,
+        req_options=None,
+        cache=None,
+        compression_options=None):
+    """
+    Downloads the whole workbook as a single PDF, reusing the export cache like view downloads do.
+    Returns True when the cached export was reused.
+    """
+    with metrics.phase(
+            'download_workbook',
+            workbook_name=workbook_name,
+            file_type='pdf',
+            destination_full_path=destination_full_path):
+        # The cached export is copied into the destination folder, so it has to exist first.
+        shipyard.files.create_folder_if_dne(
+            destination_folder_name=os.path.dirname(destination_full_path))
+        if cache:
+            # A workbook export has no view, which keeps its cache key apart from every view export.
+            export_options = req_options.get_query_params() if req_options else None
+            if export_compression.get_cache_options(compression_options):
+                export_options = {
+                    'query': export_options,
+                    'compression': export_compression.get_cache_options(compression_options)}
+            cache_key = cache.get_cache_key(
+                server,
+                dict(workbook_ids, view_id=None),
+                'pdf',
+                export_options)
+            if cache.fetch(cache_key, destination_full_path):
+                print(
+                    f'{workbook_name} is unchanged since it was last downloaded. Reused the cached export at {destination_full_path}')
+                download_view.write_cached_export_checksum(
+                    destination_full_path, compression_options)
+                return True
+
+        workbook_content = generate_workbook_pdf(
+            server, workbook_ids['workbook_id'], req_options)
+        download_view.write_view_content_to_file(
+            destination_full_path=destination_full_path,
+            view_content=workbook_content,
+            file_type='pdf',
+            view_name=workbook_name,
+            compression_options=compression_options)
+        if cache:
+            cache.store(cache_key, destination_full_path)
+        return False
+
+
+def download_workbook_views(
+        server,
+        workbook_ids,
+        views,
+        file_type,
+        destination_folder_name,
+        file_options=None,
+        max_workers=4,
+        cache=None,
+        parquet_options=None,
+        compression_options=None):
+    """
+    Downloads every view of the workbook on a bounded thread pool that shares one signed-in session.
+    Returns the exit code of each view, in workbook order.
+    """
+    def download(view):
+        return download_view.download_view_slice(
+            server=server,
+            view_ids=dict(workbook_ids, view_id=view.id),
+            file_type=file_type,
+            destination_full_path=shipyard.files.combine_folder_and_file_name(
+                folder_name=destination_folder_name,
+                file_name=get_output_file_name(
+                    view.name,
+                    file_type,
+                    (compression_options or {}).get('compression', 'none'))),
+            view_name=view.name,
+            req_options=download_view.build_request_options(
+                file_type, file_options),
+            cache=cache,
+            parquet_options=parquet_options,
+            compression_options=compression_options)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(download, views))
+
+
+def get_workbook_views(server, workbook_id):
+    """
+    Returns the workbook and its views, in the order they appear in the workbook.
+    """
+    workbook = server.workbooks.get_by_id(workbook_id)
+    server.workbooks.populate_views(workbook)
+    return workbook, list(workbook.views)
+
+
+def build_index(workbook, views, file_type, exit_codes, compression='none'):
+    """
+    Describes every output written to the destination folder. A PDF export is one file
+    covering all of the views, while other file types have one file per view.
+    """
+    views = [{'view_id': view.id, 'view_name': view.name} for view in views]
+    index = {
+        'project_name': workbook.project_name,
+        'workbook_id': workbook.id,
+        'workbook_name': workbook.name,
+        'file_type': file_type,
+    }
+    if file_type == 'pdf':
+        index['files'] = [{
+            'file_name': get_output_file_name(workbook.name, file_type, compression),
+            'views': views,
+            'exit_code': exit_codes[0],
+        }]
+    else:
+        index['files'] = [
+            dict(
+                view,
+                file_name=get_output_file_name(view['view_name'], file_type, compression),
+                exit_code=exit_code)
+            for view, exit_code in zip(views, exit_codes)]
+    return index
+
+
+def main():
+    args = get_args()
+    metrics.start(args)
+    username = args.username
+    password = args.password
+    site_id = args.site_id
+    server_url = args.server_url
+    sign_in_method = args.sign_in_method
+    project_name = args.project_name
+    workbook_name = args.workbook_name
+    file_type = args.file_type
+    cache = lookup_cache.create_lookup_cache(
+        args.lookup_cache_ttl,
+        args.lookup_cache_folder_name,
+        args.catalog_file_name)
+    exports = export_cache.create_export_cache(
+        args.export_cache_folder_name, args.export_cache_max_age)
+    parquet_options = parquet_export.get_parquet_options(args)
+    compression_options = export_compression.get_compression_options(args)
+    destination_folder_name = shipyard.files.clean_folder_name(
+        args.destination_folder_name)
+
+    server, connection = authorization.connect_to_tableau(
+        username,
+        password,
+        site_id,
+        server_url,
+        sign_in_method,
+        **authorization.get_connection_options(args))
+
+    def download(workbook_ids):
+        workbook, views = get_workbook_views(
+            server, workbook_ids['workbook_id'])
+        print(f'Found {len(views)} view(s) in {workbook_name}.')
+        if file_type == 'pdf':
+            download_workbook_pdf(
+                server=server,
+                workbook_ids=workbook_ids,
+                workbook_name=workbook_name,
+                destination_full_path=shipyard.files.combine_folder_and_file_name(
+                    folder_name=destination_folder_name,
+                    file_name=get_output_file_name(
+                        workbook.name, file_type, args.compression)),
+                req_options=download_view.build_request_options(
+                    file_type, args.file_options),
+                cache=exports,
+                compression_options=compression_options)
+            exit_codes = [errors.EXIT_CODE_FINAL_STATUS_SUCCESS]
+        else:
+            exit_codes = download_workbook_views(
+                server=server,
+                workbook_ids=workbook_ids,
+                views=views,
+                file_type=file_type,
+                destination_folder_name=destination_folder_name,
+                file_options=args.file_options,
+                max_workers=args.max_workers,
+                cache=exports,
+                parquet_options=parquet_options,
+                compression_options=compression_options)
+        return build_index(
+            workbook, views, file_type, exit_codes, args.compression)
+
+    with connection:
+        workbook_ids = lookup.get_workbook_ids(
+            server, project_name, workbook_name, cache=cache)
+        try:
+            index = download(workbook_ids)
+        except TSC.ServerResponseError as e:
+            # A cached ID can go stale if the workbook was republished,
+            # so look it up again once before giving up.
+            if cache is None or not lookup.is_not_found_error(e):
+                raise
+            print(f'The cached ID for {workbook_name} no longer exists. Looking it up again.')
+            workbook_ids = lookup.get_workbook_ids(
+                server, project_name, workbook_name, cache=cache, refresh=True)
+            index = download(workbook_ids)
+
+    if exports:
+        exports.print_summary()
+    index_file_name = shipyard.files.combine_folder_and_file_name(
+        folder_name=destination_folder_name, file_name=args.index_file_name)
+    shipyard.files.create_folder_if_dne(
+        destination_folder_name=os.path.dirname(index_file_name))
+    shipyard.files.write_json_to_file(index, index_file_name)
+
+    failed_files = [
+        output for output in index['files']
+        if output['exit_code'] != errors.EXIT_CODE_FINAL_STATUS_SUCCESS]
+    print(
+        f'{len(index["files"]) - len(failed_files)} of {len(index["files"])} file(s) downloaded successfully.')
+    for output in failed_files:
+        print(f'Failed: {output["file_name"]} (exit code {output["exit_code"]})')
+    if failed_files:
+        sys.exit(failed_files[0]['exit_code'])
+
+
+if __name__ == '__main__':
+    main()
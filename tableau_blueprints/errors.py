@@ -2,6 +2,7 @@ EXIT_CODE_FINAL_STATUS_SUCCESS = 0
 EXIT_CODE_UNKNOWN_ERROR = 3
 
 EXIT_CODE_FILE_WRITE_ERROR = 100
+EXIT_CODE_INVALID_MANIFEST = 101
 
 EXIT_CODE_INVALID_CREDENTIALS = 200
 EXIT_CODE_INVALID_PROJECT = 201
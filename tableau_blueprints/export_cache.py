@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+try:
+    import metrics
+except BaseException:
+    from . import metrics
+
+DEFAULT_MAX_AGE_SECONDS = 24 * 60 * 60
+
+
+class ExportCache():
+    """
+    Content-addressed store of previously downloaded view exports.
+
+    An entry's key covers the view, the export settings and the last update time of the
+    workbook and every published datasource it uses, so any republish or extract refresh
+    produces a new key. Workbooks on live connections can change without any of those
+    timestamps moving, so entries also expire after max_age_seconds.
+    """
+
+    def __init__(self, cache_folder_name, max_age_seconds=DEFAULT_MAX_AGE_SECONDS):
+        self.cache_folder_name = cache_folder_name
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @metrics.timed('export_cache_check')
+    def get_cache_key(self, server, view_ids, file_type, file_options=None):
+        """
+        Builds the cache key for a view export, fetching the workbook's and its published datasources' update times.
+        """
+        workbook = server.workbooks.get_by_id(view_ids['workbook_id'])
+        server.workbooks.populate_connections(workbook)
+        datasource_versions = []
+        for datasource_id in sorted({
+                connection.datasource_id for connection in workbook.connections
+                if connection.datasource_id}):
+            try:
+                datasource = server.datasources.get_by_id(datasource_id)
+            except Exception:
+                # Embedded datasources can't be fetched on their own and change with the workbook.
+                continue
+            datasource_versions.append(
+                [datasource_id, str(datasource.updated_at)])
+
+        key = json.dumps([
+            server.server_address,
+            server.site_id,
+            view_ids['view_id'],
+            file_type,
+            file_options,
+            str(workbook.updated_at),
+            datasource_versions], sort_keys=True)
+        return f'{hashlib.sha256(key.encode("utf-8")).hexdigest()}.{file_type}'
+
+    def _entry_file_name(self, cache_key):
+        return os.path.join(self.cache_folder_name, cache_key)
+
+    def _record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.increment(
+            'export_cache_hits' if hit else 'export_cache_misses')
+
+    def fetch(self, cache_key, destination_full_path):
+        """
+        Places the cached export at destination_full_path and returns True, or returns False on a miss.
+        """
+        entry_file_name = self._entry_file_name(cache_key)
+        try:
+            is_fresh = time.time() - \
+                os.path.getmtime(entry_file_name) <= self.max_age_seconds
+        except OSError:
+            is_fresh = False
+        if not is_fresh:
+            self._record(hit=False)
+            return False
+        try:
+            copy_file(entry_file_name, destination_full_path)
+        except OSError as e:
+            print(f'Could not reuse the cached export: {e}')
+            self._record(hit=False)
+            return False
+        self._record(hit=True)
+        return True
+
+    def store(self, cache_key, source_full_path):
+        try:
+            os.makedirs(self.cache_folder_name, exist_ok=True)
+            copy_file(
+                source_full_path,
+                self._entry_file_name(cache_key))
+        except OSError as e:
+            # The cache is an optimization, so a failed write should never fail the run.
+            print(f'Could not add the export to the cache: {e}')
+
+    def print_summary(self):
+        print(
+            f'Export cache: {self.hits} hit(s), {self.misses} miss(es).')
+
+
+def copy_file(source_full_path, destination_full_path):
+    """
+    Atomically places a copy of source_full_path at destination_full_path.
+
+    Outputs and cache entries are never hardlinked, as they would share one inode and an
+    in-place edit of the output downstream would silently change the cached export too.
+    shutil.copyfile copies within the kernel where the platform allows it.
+    """
+    temporary_full_path = os.path.join(
+        os.path.dirname(os.path.abspath(destination_full_path)),
+        f'.{os.path.basename(destination_full_path)}.{uuid.uuid4().hex[:8]}.part')
+    try:
+        shutil.copyfile(source_full_path, temporary_full_path)
+        os.replace(temporary_full_path, destination_full_path)
+    except BaseException:
+        try:
+            os.remove(temporary_full_path)
+        except OSError:
+            pass
+        raise
+
+
+def create_export_cache(cache_folder_name, max_age_seconds=None):
+    """
+    Returns an ExportCache, or None when no cache folder is configured.
+    """
+    if not cache_folder_name:
+        return None
+    if max_age_seconds is None:
+        max_age_seconds = DEFAULT_MAX_AGE_SECONDS
+    return ExportCache(cache_folder_name, max_age_seconds)
+
+
+def add_export_cache_arguments(parser):
+    parser.add_argument(
+        '--export-cache-folder-name',
+        dest='export_cache_folder_name',
+        default=None,
+        required=False)
+    parser.add_argument(
+        '--export-cache-max-age',
+        dest='export_cache_max_age',
+        type=int,
+        default=None,
+        required=False)
@@ -0,0 +1,215 @@
+import contextlib
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import uuid
+
+try:
+    import lazy_imports
+except BaseException:
+    from . import lazy_imports
+
+gzip = lazy_imports.lazy_import('gzip')
+shipyard = lazy_imports.lazy_import('shipyard_utils')
+
+COMPRESSIONS = ('none', 'gzip', 'zstd')
+FILE_EXTENSIONS = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+COMPRESSION_LEVELS = {
+    'gzip': range(1, 10),
+    'zstd': range(1, 23),
+}
+# gzip's own default of 9 is several times slower than 6 for a few percent smaller files.
+DEFAULT_COMPRESSION_LEVELS = {
+    'gzip': 6,
+    'zstd': 3,
+}
+CHECKSUM_FILE_SUFFIX = '.sha256.json'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class HashingWriter(io.RawIOBase):
+    """
+    Passes writes through to a file while keeping the SHA-256 and size of everything written,
+    so a file's checksum is computed in the same pass that writes it.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.hash = hashlib.sha256()
+        self.byte_count = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.file.write(data)
+        self.hash.update(data)
+        size = memoryview(data).nbytes
+        self.byte_count += size
+        return size
+
+    def tell(self):
+        return self.byte_count
+
+    def get_checksum(self):
+        return {'sha256': self.hash.hexdigest(), 'bytes': self.byte_count}
+
+
+def is_zstandard_installed():
+    return importlib.util.find_spec('zstandard') is not None
+
+
+@contextlib.contextmanager
+def open_compressor(file, compression='none', compression_level=None):
+    """
+    Yields a file object that compresses everything written to it into file. The compressed
+    stream is finished on exit, leaving file open.
+    """
+    if compression == 'none':
+        yield file
+        return
+    if compression_level is None:
+        compression_level = DEFAULT_COMPRESSION_LEVELS[compression]
+    if compression == 'gzip':
+        # A fixed timestamp and no file name, which would be the temporary file's, keep the
+        # output identical for identical exports.
+        compressor = gzip.GzipFile(
+            filename='',
+            fileobj=file,
+            mode='wb',
+            compresslevel=compression_level,
+            mtime=0)
+    else:
+        import zstandard
+        compressor = zstandard.ZstdCompressor(
+            level=compression_level).stream_writer(file, closefd=False)
+    with compressor:
+        yield compressor
+
+
+def get_file_name(file_name, compression='none'):
+    """
+    Adds the compression's extension to a file name that doesn't already end with it.
+    """
+    extension = FILE_EXTENSIONS.get(compression, '')
+    if file_name.endswith(extension):
+        return file_name
+    return f'{file_name}{extension}'
+
+
+def get_file_compression_options(compression_options, file_type):
+    """
+    Parquet files are compressed internally with --parquet-compression, so they keep
+    only the checksum setting instead of being compressed a second time.
+    """
+    if not compression_options or file_type != 'parquet':
+        return compression_options
+    return dict(compression_options, compression='none', compression_level=None)
+
+
+def get_cache_options(compression_options):
+    """
+    Returns the settings that change the bytes of a written file, for the export cache key.
+    """
+    if not compression_options or compression_options['compression'] == 'none':
+        return None
+    return {
+        'compression': compression_options['compression'],
+        'compression_level': compression_options['compression_level'],
+    }
+
+
+def hash_file(file_name):
+    """
+    Returns the checksum of a file that is already on disk, such as a reused cached export.
+    """
+    file_hash = hashlib.sha256()
+    byte_count = 0
+    with open(file_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            file_hash.update(chunk)
+            byte_count += len(chunk)
+    return {'sha256': file_hash.hexdigest(), 'bytes': byte_count}
+
+
+def write_checksum_file(destination_full_path, checksum, compression='none'):
+    """
+    Writes the checksum sidecar next to the file, replacing any earlier one in a single rename.
+    """
+    checksum_full_path = f'{destination_full_path}{CHECKSUM_FILE_SUFFIX}'
+    temporary_full_path = os.path.join(
+        os.path.dirname(os.path.abspath(checksum_full_path)),
+        f'.{os.path.basename(checksum_full_path)}.{uuid.uuid4().hex[:8]}.part')
+    try:
+        with open(temporary_full_path, 'x') as f:
+            json.dump(dict(
+                file_name=os.path.basename(destination_full_path),
+                compression=compression,
+                **checksum), f)
+        os.replace(temporary_full_path, checksum_full_path)
+    except BaseException:
+        try:
+            os.remove(temporary_full_path)
+        except OSError:
+            pass
+        raise
+    return checksum_full_path
+
+
+def add_compression_arguments(parser):
+    parser.add_argument(
+        '--compression',
+        dest='compression',
+        choices=COMPRESSIONS,
+        type=str.lower,
+        default='none',
+        required=False)
+    parser.add_argument(
+        '--compression-level',
+        dest='compression_level',
+        type=int,
+        default=None,
+        required=False)
+    parser.add_argument(
+        '--write-checksum',
+        dest='write_checksum',
+        default='FALSE',
+        required=False)
+
+
+def get_compression_error(args):
+    """
+    Returns why the compression arguments can't be used, or None when they can.
+    """
+    if args.compression == 'zstd' and not is_zstandard_installed():
+        return '--compression zstd requires zstandard. Install it with pip install zstandard.'
+    if args.compression_level is None:
+        return None
+    if args.compression == 'none':
+        return '--compression-level requires --compression.'
+    levels = COMPRESSION_LEVELS[args.compression]
+    if args.compression_level not in levels:
+        return f'--compression-level must be between {levels[0]} and {levels[-1]} for {args.compression}.'
+    return None
+
+
+def get_compression_options(args):
+    """
+    Returns the keyword arguments for writing compressed and checksummed files, or None when neither is enabled.
+    """
+    checksum = shipyard.args.convert_to_boolean(args.write_checksum)
+    if args.compression == 'none' and not checksum:
+        return None
+    compression_level = args.compression_level
+    if compression_level is None and args.compression != 'none':
+        compression_level = DEFAULT_COMPRESSION_LEVELS[args.compression]
+    return {
+        'compression': args.compression,
+        'compression_level': compression_level,
+        'checksum': checksum,
+    }
@@ -1,14 +1,60 @@
-import tableauserverclient as TSC
 import argparse
+import os
+import random
+import statistics
 import sys
-import shipyard_utils as shipyard
+import time
+from datetime import datetime, timezone
 
 try:
     import errors
     import authorization
+    import metrics
+    import lazy_imports
+    import lookup
+    import worker_client
 except BaseException:
     from . import errors
     from . import authorization
+    from . import metrics
+    from . import lazy_imports
+    from . import lookup
+    from . import worker_client
+
+TSC = lazy_imports.lazy_import('tableauserverclient')
+shipyard = lazy_imports.lazy_import('shipyard_utils')
+asyncio = lazy_imports.lazy_import('asyncio')
+
+POLL_MIN_INTERVAL = 0.5
+POLL_MAX_INTERVAL = 30
+POLL_BACKOFF_FACTOR = 1.4
+POLL_JITTER = 0.2
+# Wake up slightly before a job's expected finish so completion is detected promptly.
+EXPECTED_DURATION_LEAD = 0.9
+HISTORICAL_JOB_SAMPLE_SIZE = 5
+
+# Checking at least this many jobs at once reads the site job list instead of calling get_by_id per job.
+JOB_LIST_MIN_JOB_COUNT = 5
+JOB_LIST_PAGE_SIZE = 250
+JOB_LIST_MAX_PAGES = 8
+# Background job statuses and their JobItem finish codes, spelled out so that TSC is not loaded at import time.
+BACKGROUND_JOB_FINISH_CODES = {
+    'Success': 0,
+    'Failed': 1,
+    'Cancelled': 2,
+}
+
+AGGREGATE_EXIT_CODE_PRIORITY = [
+    errors.EXIT_CODE_FINAL_STATUS_ERRORED,
+    errors.EXIT_CODE_FINAL_STATUS_CANCELLED,
+    errors.EXIT_CODE_STATUS_INCOMPLETE,
+]
+EXIT_CODE_DESCRIPTIONS = {
+    errors.EXIT_CODE_FINAL_STATUS_SUCCESS: 'Success',
+    errors.EXIT_CODE_FINAL_STATUS_ERRORED: 'Errored',
+    errors.EXIT_CODE_FINAL_STATUS_CANCELLED: 'Cancelled',
+    errors.EXIT_CODE_STATUS_INCOMPLETE: 'Incomplete',
+}
 
 
 def get_args():
@@ -26,6 +72,30 @@ def get_args():
             'access_token'},
         required=False)
     parser.add_argument('--job-id', dest='job_id', required=False)
+    parser.add_argument('--job-ids', dest='job_ids', required=False)
+    parser.add_argument(
+        '--job-ids-file-name',
+        dest='job_ids_file_name',
+        required=False)
+    parser.add_argument(
+        '--job-id-variables',
+        dest='job_id_variables',
+        required=False)
+    parser.add_argument(
+        '--wait-for-completion',
+        dest='wait_for_completion',
+        default='FALSE',
+        required=False)
+    parser.add_argument(
+        '--timeout',
+        dest='timeout',
+        type=float,
+        default=None,
+        required=False)
+    authorization.add_connection_arguments(parser)
+    metrics.add_metrics_arguments(parser)
+    lazy_imports.add_profile_startup_argument(parser)
+    worker_client.add_worker_arguments(parser)
     args = parser.parse_args()
     return args
 
@@ -43,6 +113,96 @@ def get_job_info(server, job_id):
     return job_info
 
 
+def convert_background_job(background_job):
+    """
+    Builds a JobItem from an entry of the site job list, so it can be handled like a get_by_id result.
+    """
+    finish_code = BACKGROUND_JOB_FINISH_CODES.get(background_job.status, -1)
+    completed_at = None
+    if finish_code != -1:
+        completed_at = background_job.ended_at or background_job.started_at or background_job.created_at
+    return TSC.JobItem(
+        background_job.id,
+        background_job.type,
+        None,
+        background_job.created_at,
+        background_job.started_at,
+        completed_at,
+        finish_code)
+
+
+def get_job_snapshot(server, job_ids):
+    """
+    Pages through the site job list, newest first, until every requested job has been found
+    or JOB_LIST_MAX_PAGES pages have been read. Returns JobItems by job_id for the jobs found.
+    """
+    remaining_job_ids = set(job_ids)
+    job_infos = {}
+    for page_number in range(1, JOB_LIST_MAX_PAGES + 1):
+        req_option = TSC.RequestOptions(
+            pagenumber=page_number, pagesize=JOB_LIST_PAGE_SIZE)
+        req_option.sort.add(TSC.Sort(TSC.RequestOptions.Field.CreatedAt,
+                                     TSC.RequestOptions.Direction.Desc))
+        try:
+            background_jobs, pagination_item = server.jobs.get(
+                req_options=req_option)
+        except Exception as e:
+            print('Could not read the site job list. Checking jobs individually instead.')
+            print(e)
+            break
+        for background_job in background_jobs:
+            if background_job.id in remaining_job_ids:
+                job_infos[background_job.id] = convert_background_job(
+                    background_job)
+                remaining_job_ids.discard(background_job.id)
+        if not remaining_job_ids or page_number * \
+                pagination_item.page_size >= pagination_item.total_available:
+            break
+    return job_infos
+
+
+def get_job_infos(server, job_ids, use_job_list=None):
+    """
+    Gets information about every job_id, returning job info by job_id for the jobs that exist.
+
+    With many jobs (or use_job_list set), they are resolved from a few pages of the site job list,
+    and only the jobs missing from it are fetched with get_by_id.
+    """
+    job_ids = list(dict.fromkeys(job_ids))
+    if use_job_list is None:
+        use_job_list = len(job_ids) >= JOB_LIST_MIN_JOB_COUNT
+    job_infos = get_job_snapshot(server, job_ids) if use_job_list else {}
+    for job_id in job_ids:
+        if job_id in job_infos:
+            continue
+        try:
+            job_infos[job_id] = server.jobs.get_by_id(job_id)
+        except Exception as e:
+            print(f'Job {job_id} was not found.')
+            print(e)
+    return job_infos
+
+
+async def get_job_infos_async(server, job_ids):
+    """
+    Async counterpart of get_job_infos, which fetches every job at the same time.
+    """
+    job_ids = list(dict.fromkeys(job_ids))
+
+    async def get_job(job_id):
+        try:
+            return await server.get_job(job_id)
+        except Exception as e:
+            print(f'Job {job_id} was not found.')
+            print(e)
+            return None
+
+    job_infos = await asyncio.gather(*map(get_job, job_ids))
+    return {
+        job_id: job_info for job_id, job_info in zip(job_ids, job_infos)
+        if job_info is not None}
+
+
 def determine_job_status(server, job_id):
     """
     Job status response handler.
@@ -50,6 +210,13 @@ def determine_job_status(server, job_id):
     The finishCode indicates the status of the job: -1 for incomplete, 0 for success, 1 for error, or 2 for cancelled.
     """
     job_info = get_job_info(server, job_id)
+    return report_job_status(job_id, job_info)
+
+
+def report_job_status(job_id, job_info):
+    """
+    Prints the status of an already fetched job and returns the matching exit code.
+    """
     if job_info.finish_code == -1:
         if job_info.started_at is None:
             print(
@@ -73,8 +240,317 @@ def determine_job_status(server, job_id):
     return exit_code
 
 
+class JobPollSchedule():
+    """
+    Decides how long to wait before polling a single job again.
+
+    Intervals grow exponentially with jitter and reset to the minimum when the job starts.
+    When an expected duration is known, a running job is not polled again until shortly
+    before it is expected to finish, after which the backoff restarts from the minimum.
+    """
+
+    def __init__(self, expected_duration=None):
+        self.expected_duration = expected_duration
+        self.interval = POLL_MIN_INTERVAL
+        self.started_at = None
+
+    def next_delay(self, job_info):
+        if job_info.started_at != self.started_at:
+            self.started_at = job_info.started_at
+            self.interval = POLL_MIN_INTERVAL
+
+        delay = self.interval * random.uniform(
+            1 - POLL_JITTER, 1 + POLL_JITTER)
+        self.interval = min(
+            self.interval * POLL_BACKOFF_FACTOR,
+            POLL_MAX_INTERVAL)
+
+        if self.started_at and self.expected_duration:
+            elapsed = (datetime.now(timezone.utc) -
+                       self.started_at).total_seconds()
+            remaining = self.expected_duration * EXPECTED_DURATION_LEAD - elapsed
+            if remaining > delay:
+                delay = remaining
+                self.interval = POLL_MIN_INTERVAL
+        return delay
+
+
+@metrics.timed('estimate_job_duration')
+def estimate_job_duration(server, resource_name):
+    """
+    Estimates how long a refresh of resource_name takes from the median duration of its
+    most recent successful jobs. Returns None when there is no usable history.
+
+    The history is found by job title, so a name that can't be filtered on has none.
+    """
+    if not lookup.can_filter_on(resource_name):
+        return None
+    try:
+        previous_jobs, _ = server.jobs.get(
+            req_options=build_job_history_request_options(resource_name))
+    except Exception:
+        return None
+    return get_median_duration(previous_jobs)
+
+
+async def estimate_job_duration_async(server, resource_name):
+    with metrics.phase('estimate_job_duration'):
+        if not lookup.can_filter_on(resource_name):
+            return None
+        try:
+            previous_jobs, _ = await server.get_items(
+                'jobs',
+                TSC.BackgroundJobItem,
+                build_job_history_request_options(resource_name))
+        except Exception:
+            return None
+        return get_median_duration(previous_jobs)
+
+
+def build_job_history_request_options(resource_name):
+    req_option = TSC.RequestOptions(pagesize=HISTORICAL_JOB_SAMPLE_SIZE)
+    req_option.filter.add(TSC.Filter(TSC.RequestOptions.Field.Title,
+                                     TSC.RequestOptions.Operator.Equals,
+                                     resource_name))
+    req_option.filter.add(TSC.Filter(TSC.RequestOptions.Field.Status,
+                                     TSC.RequestOptions.Operator.Equals,
+                                     TSC.BackgroundJobItem.Status.Success))
+    req_option.sort.add(TSC.Sort(TSC.RequestOptions.Field.CreatedAt,
+                                 TSC.RequestOptions.Direction.Desc))
+    return req_option
+
+
+def get_median_duration(previous_jobs):
+    durations = [
+        (job.ended_at - job.started_at).total_seconds()
+        for job in previous_jobs if job.started_at and job.ended_at]
+    if not durations:
+        return None
+    return statistics.median(durations)
+
+
+def record_job_detection(job_info):
+    """
+    Records how long after a job completed its completion was detected, so polling can be
+    tuned from the metrics file.
+    """
+    detection_latency = max(
+        (datetime.now(timezone.utc) - job_info.completed_at).total_seconds(), 0)
+    metrics.increment('completed_jobs_detected')
+    metrics.increment('job_detection_latency_seconds', round(detection_latency, 3))
+
+
+def record_job_polls(poll_count, job_count, timed_out):
+    print(f'Made {poll_count} status request(s) for {job_count} job(s).')
+    metrics.increment('job_polls', poll_count)
+    if timed_out:
+        metrics.increment('job_wait_timeouts')
+
+
+@metrics.timed('wait_for_jobs')
+def wait_for_jobs(server, job_ids, timeout=None, expected_durations=None):
+    """
+    Polls every job until all of them have completed or the timeout (in seconds) passes.
+
+    Each job is polled on its own JobPollSchedule, so the total wait is as long as the
+    slowest job rather than the sum of all jobs. expected_durations optionally maps a
+    job_id to its estimated duration in seconds.
+
+    Returns the latest job info by job_id. The number of polls made and how long after
+    completion each job was detected are recorded in the run's metrics.
+    """
+    expected_durations = expected_durations or {}
+    job_ids = list(dict.fromkeys(job_ids))
+    schedules = {
+        job_id: JobPollSchedule(expected_durations.get(job_id))
+        for job_id in job_ids}
+    next_poll_times = {job_id: time.monotonic() for job_id in job_ids}
+    deadline = time.monotonic() + timeout if timeout else None
+    job_infos = {}
+    poll_count = 0
+    timed_out = False
+
+    while next_poll_times:
+        now = time.monotonic()
+        due_job_ids = [job_id for job_id, poll_time in next_poll_times.items()
+                       if poll_time <= now]
+        due_job_infos = get_job_infos(server, due_job_ids)
+        for job_id in due_job_ids:
+            if job_id not in due_job_infos:
+                del next_poll_times[job_id]
+                continue
+            job_info = due_job_infos[job_id]
+            job_infos[job_id] = job_info
+            poll_count += 1
+            if job_info.completed_at is not None:
+                record_job_detection(job_info)
+                del next_poll_times[job_id]
+            else:
+                next_poll_times[job_id] = time.monotonic(
+                ) + schedules[job_id].next_delay(job_info)
+
+        if not next_poll_times:
+            break
+        sleep_until = min(next_poll_times.values())
+        if deadline is not None:
+            if time.monotonic() >= deadline:
+                print(
+                    f'Stopped waiting after {timeout} seconds with {len(next_poll_times)} job(s) still running.')
+                timed_out = True
+                break
+            sleep_until = min(sleep_until, deadline)
+        time.sleep(max(sleep_until - time.monotonic(), 0))
+
+    record_job_polls(poll_count, len(job_ids), timed_out)
+    return job_infos
+
+
+async def wait_for_jobs_async(server, job_ids, timeout=None, expected_durations=None):
+    """
+    Async counterpart of wait_for_jobs, where each job is polled by its own coroutine on its own
+    JobPollSchedule. Returns the same job infos and records the same metrics.
+    """
+    with metrics.phase('wait_for_jobs'):
+        expected_durations = expected_durations or {}
+        job_ids = list(dict.fromkeys(job_ids))
+        job_infos = {}
+        poll_counts = {job_id: 0 for job_id in job_ids}
+
+        async def wait_for_job(job_id):
+            schedule = JobPollSchedule(expected_durations.get(job_id))
+            while True:
+                try:
+                    job_info = await server.get_job(job_id)
+                except Exception as e:
+                    print(f'Job {job_id} was not found.')
+                    print(e)
+                    return
+                job_infos[job_id] = job_info
+                poll_counts[job_id] += 1
+                if job_info.completed_at is not None:
+                    record_job_detection(job_info)
+                    return
+                await asyncio.sleep(schedule.next_delay(job_info))
+
+        pending = ()
+        if job_ids:
+            _, pending = await asyncio.wait(
+                [asyncio.ensure_future(wait_for_job(job_id)) for job_id in job_ids],
+                timeout=timeout)
+            if pending:
+                print(
+                    f'Stopped waiting after {timeout} seconds with {len(pending)} job(s) still running.')
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        record_job_polls(sum(poll_counts.values()), len(job_ids), bool(pending))
+        return job_infos
+
+
+def report_job_statuses(job_ids, job_infos):
+    """
+    Reports the status of each job and returns the exit code for each job_id.
+    Jobs without job info could not be found.
+    """
+    exit_codes = {}
+    for job_id in dict.fromkeys(job_ids):
+        if job_id in job_infos:
+            exit_codes[job_id] = report_job_status(job_id, job_infos[job_id])
+        else:
+            exit_codes[job_id] = errors.EXIT_CODE_INVALID_JOB
+    return exit_codes
+
+
+def determine_job_statuses(server, job_ids, use_job_list=None):
+    """
+    Fetches and reports the status of each job, returning the exit code for each job_id.
+    """
+    return report_job_statuses(
+        job_ids, get_job_infos(server, job_ids, use_job_list))
+
+
+def format_timestamp(timestamp):
+    return timestamp.strftime('%Y-%m-%d %H:%M:%S') if timestamp else '-'
+
+
+def print_job_status_report(job_infos, exit_codes):
+    print(f'{"Job ID":<38}{"Type":<25}{"Started":<21}{"Completed":<21}Status')
+    for job_id, exit_code in exit_codes.items():
+        job_info = job_infos.get(job_id)
+        status = EXIT_CODE_DESCRIPTIONS.get(exit_code, 'Not found')
+        if job_info is None:
+            print(f'{job_id:<38}{"-":<25}{"-":<21}{"-":<21}{status}')
+            continue
+        print(
+            f'{job_id:<38}{str(job_info.type):<25}{format_timestamp(job_info.started_at):<21}{format_timestamp(job_info.completed_at):<21}{status}')
+
+
+def determine_aggregate_exit_code(exit_codes):
+    """
+    Combines the exit codes of several jobs into one.
+
+    Success only if every job succeeded. Otherwise errored takes precedence over cancelled,
+    which takes precedence over incomplete, and any other failure code is returned as is.
+    """
+    failed_exit_codes = [
+        exit_code for exit_code in exit_codes
+        if exit_code != errors.EXIT_CODE_FINAL_STATUS_SUCCESS]
+    if not failed_exit_codes:
+        return errors.EXIT_CODE_FINAL_STATUS_SUCCESS
+    for exit_code in AGGREGATE_EXIT_CODE_PRIORITY:
+        if exit_code in failed_exit_codes:
+            return exit_code
+    return failed_exit_codes[0]
+
+
+def read_job_ids(artifact_subfolder_paths):
+    """
+    Reads the job IDs pickled by a previous refresh, preferring the full list written by bulk refreshes.
+    """
+    job_ids_file_name = shipyard.files.combine_folder_and_file_name(
+        artifact_subfolder_paths['variables'], 'job_ids.pickle')
+    if os.path.exists(job_ids_file_name):
+        return shipyard.logs.read_pickle_file(
+            artifact_subfolder_paths, 'job_ids')
+    return [shipyard.logs.read_pickle_file(
+        artifact_subfolder_paths, 'job_id')]
+
+
+def collect_job_ids(args, artifact_subfolder_paths):
+    """
+    Gathers the job IDs to check from --job-id, --job-ids, a file with one job ID per line
+    and any pickled artifact variables. Defaults to the job IDs pickled by the last refresh.
+    """
+    job_ids = []
+    if args.job_id:
+        job_ids.append(args.job_id)
+    if args.job_ids:
+        job_ids.extend(job_id.strip()
+                       for job_id in args.job_ids.split(',') if job_id.strip())
+    if args.job_ids_file_name:
+        try:
+            with open(args.job_ids_file_name, 'r') as f:
+                job_ids.extend(line.strip() for line in f if line.strip())
+        except OSError as e:
+            print(f'Could not read job IDs from {args.job_ids_file_name}')
+            print(e)
+            sys.exit(errors.EXIT_CODE_INVALID_JOB)
+    if args.job_id_variables:
+        for variable_name in args.job_id_variables.split(','):
+            value = shipyard.logs.read_pickle_file(
+                artifact_subfolder_paths, variable_name.strip())
+            job_ids.extend(value if isinstance(value, list) else [value])
+    if not job_ids:
+        job_ids = read_job_ids(artifact_subfolder_paths)
+    return list(dict.fromkeys(job_ids))
+
+
 def main():
     args = get_args()
+    worker_client.forward_to_worker(
+        args.worker_socket_file_name, 'job_status')
+    metrics.start(args)
     username = args.username
     password = args.password
     site_id = args.site_id
@@ -87,17 +563,23 @@ def main():
         base_folder_name)
     shipyard.logs.create_artifacts_folders(artifact_subfolder_paths)
 
-    if args.job_id:
-        job_id = args.job_id
-    else:
-        job_id = shipyard.logs.read_pickle_file(
-            artifact_subfolder_paths, 'job_id')
+    job_ids = collect_job_ids(args, artifact_subfolder_paths)
 
     server, connection = authorization.connect_to_tableau(
-        username, password, site_id, server_url, sign_in_method)
+        username, password, site_id, server_url, sign_in_method,
+        **authorization.get_connection_options(args))
 
     with connection:
-        sys.exit(determine_job_status(server, job_id))
+        if shipyard.args.convert_to_boolean(args.wait_for_completion):
+            job_infos = wait_for_jobs(
+                server, job_ids, timeout=args.timeout)
+        else:
+            job_infos = get_job_infos(
+                server, job_ids, use_job_list=len(job_ids) > 1)
+        exit_codes = report_job_statuses(job_ids, job_infos)
+        if len(job_ids) > 1:
+            print_job_status_report(job_infos, exit_codes)
+        sys.exit(determine_aggregate_exit_code(exit_codes.values()))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,119 @@
+import atexit
+import builtins
+import importlib
+import sys
+import threading
+import time
+import types
+
+PROFILE_STARTUP_FLAG = '--profile-startup'
+PROFILE_REPORT_SIZE = 20
+
+
+class ImportProfiler():
+    """
+    Records the inclusive and self time of every module imported while it is installed,
+    the same measurements as python -X importtime, including modules loaded lazily.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.timings = {}
+        self._original_import = builtins.__import__
+        self._local = threading.local()
+
+    def install(self):
+        builtins.__import__ = self._import
+        atexit.register(self.print_report)
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+        return self.time_import(
+            name,
+            lambda: self._original_import(name, globals, locals, fromlist, level))
+
+    def time_import(self, name, import_function):
+        child_times = self._local.__dict__.setdefault('child_times', [0.0])
+        child_times.append(0.0)
+        start_time = time.perf_counter()
+        try:
+            return import_function()
+        finally:
+            inclusive_time = time.perf_counter() - start_time
+            self_time = inclusive_time - child_times.pop()
+            child_times[-1] += inclusive_time
+            self.timings.setdefault(name, (inclusive_time, self_time))
+
+    def print_report(self):
+        total_time = sum(self_time for _, self_time in self.timings.values())
+        print(
+            f'Startup profile: imported {len(self.timings)} modules in {total_time * 1000:.1f} ms.')
+        print(f'{"Module":<50} {"Self (ms)":>10} {"Total (ms)":>11}')
+        slowest_imports = sorted(
+            self.timings.items(),
+            key=lambda item: item[1][1],
+            reverse=True)[:PROFILE_REPORT_SIZE]
+        for name, (inclusive_time, self_time) in slowest_imports:
+            print(
+                f'{name:<50} {self_time * 1000:>10.1f} {inclusive_time * 1000:>11.1f}')
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stands in for a module until one of its attributes is first used, then imports it.
+
+    The import happens under a lock, so threads that first use the module at the
+    same time all wait for one complete import.
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                if profiler and self.__name__ not in sys.modules:
+                    self._module = profiler.time_import(
+                        self.__name__, lambda: importlib.import_module(self.__name__))
+                else:
+                    self._module = importlib.import_module(self.__name__)
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._module or self._load(), attribute)
+
+    def __dir__(self):
+        return dir(self._module or self._load())
+
+
+def lazy_import(name):
+    """
+    Returns the module, deferring its import until one of its attributes is first used.
+
+    A module that isn't installed raises ModuleNotFoundError on that first use rather than here,
+    so optional dependencies such as aiohttp can be lazily imported by modules every blueprint loads.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
+
+def add_profile_startup_argument(parser):
+    """
+    The flag is read from sys.argv when this module is imported, so profiling covers imports made
+    before the arguments are parsed. It is also added to the parser so that it is accepted.
+    """
+    parser.add_argument(
+        PROFILE_STARTUP_FLAG,
+        dest='profile_startup',
+        action='store_true',
+        required=False)
+
+
+profiler = None
+if PROFILE_STARTUP_FLAG in sys.argv:
+    profiler = ImportProfiler()
+    profiler.install()
@@ -1,24 +1,115 @@
 import sys
-import tableauserverclient as TSC
 
 try:
     import errors
+    import lazy_imports
+    import metrics
 except BaseException:
     from . import errors
+    from . import lazy_imports
+    from . import metrics
+
+TSC = lazy_imports.lazy_import('tableauserverclient')
+asyncio = lazy_imports.lazy_import('asyncio')
+futures = lazy_imports.lazy_import('concurrent.futures')
+
+# Name filters narrow results to a handful of items, so small pages keep responses light.
+LOOKUP_PAGE_SIZE = 20
+# TSC has no constant for this view filter field.
+VIEW_WORKBOOK_NAME_FIELD = 'workbookName'
+
+
+def find_matches(endpoint, filters, is_match=None, max_matches=2):
+    """
+    Lazily pages through the endpoint with the given server-side name filters and returns
+    up to max_matches items that also satisfy is_match.
+
+    Paging stops as soon as max_matches items are found, which is enough to tell a unique match from an ambiguous one.
+    """
+    matches = []
+    for item in TSC.Pager(endpoint, build_lookup_request_options(filters)):
+        if is_lookup_match(item, filters, is_match):
+            matches.append(item)
+            if len(matches) >= max_matches:
+                break
+    return matches
+
+
+async def find_matches_async(server, endpoint, item_class, filters, is_match=None, max_matches=2):
+    """
+    Async counterpart of find_matches, where endpoint names the site endpoint, such as 'views',
+    and item_class is its TSC model.
+    """
+    matches = []
+    items = server.pager(endpoint, item_class, build_lookup_request_options(filters))
+    try:
+        async for item in items:
+            if is_lookup_match(item, filters, is_match):
+                matches.append(item)
+                if len(matches) >= max_matches:
+                    break
+    finally:
+        await items.aclose()
+    return matches
+
+
+def is_lookup_match(item, filters, is_match=None):
+    """
+    The name is also compared here, since a name that can't be sent as a server-side filter isn't filtered on by the server.
+    """
+    name = filters.get(TSC.RequestOptions.Field.Name)
+    if name is not None and item.name != name:
+        return False
+    return is_match is None or is_match(item)
+
+
+def can_filter_on(value):
+    """
+    Filter expressions are separated by commas, so a value containing one can't be sent as a server-side filter.
+    """
+    return ',' not in value
+
+
+def build_lookup_request_options(filters):
+    req_option = TSC.RequestOptions(pagesize=LOOKUP_PAGE_SIZE)
+    for field, value in filters.items():
+        # Leaving out a value that can't be sent only widens the results, which is_lookup_match and is_match narrow again.
+        if value is not None and can_filter_on(value):
+            req_option.filter.add(TSC.Filter(field,
+                                             TSC.RequestOptions.Operator.Equals,
+                                             value))
+    return req_option
 
 
 def get_project_id(server, project_name):
     """
     Looks up and returns the project_id of the project_name that was specified.
     """
-    req_option = TSC.RequestOptions()
-    req_option.filter.add(TSC.Filter(TSC.RequestOptions.Field.Name,
-                                     TSC.RequestOptions.Operator.Equals,
-                                     project_name))
+    project_matches = find_matches(
+        server.projects,
+        {TSC.RequestOptions.Field.Name: project_name})
+    return select_project_id(project_matches, project_name)
 
-    project_matches = server.projects.get(req_options=req_option)
-    if len(project_matches[0]) == 1:
-        project_id = project_matches[0][0].id
+
+async def get_project_id_async(server, project_name):
+    project_matches = await find_matches_async(
+        server,
+        'projects',
+        TSC.ProjectItem,
+        {TSC.RequestOptions.Field.Name: project_name})
+    return select_project_id(project_matches, project_name)
+
+
+def select_project_id(project_matches, project_name):
+    """
+    Returns the ID of the only matching project, and exits when there is no match or more than one.
+    """
+    if len(project_matches) == 1:
+        project_id = project_matches[0].id
+    elif len(project_matches) > 1:
+        print(
+            f'More than one project is named {project_name}. Please rename one of them so the project can be identified.')
+        sys.exit(errors.EXIT_CODE_INVALID_PROJECT)
     else:
         print(
             f'{project_name} could not be found. Please check for typos and ensure that the name you provide matches exactly (case sensitive)')
@@ -26,72 +117,472 @@ def get_project_id(server, project_name):
     return project_id
 
 
-def get_datasource_id(server, project_id, datasource_name):
+def get_datasource_id(server, project_id, datasource_name, project_name=None):
     """
     Looks up and returns the datasource_id of the datasource_name that was specified, filtered by project_id matches.
+
+    When project_name is provided it is also filtered on by the server, so only datasources in projects with that name are returned.
     """
-    req_option = TSC.RequestOptions()
-    req_option.filter.add(TSC.Filter(TSC.RequestOptions.Field.Name,
-                                     TSC.RequestOptions.Operator.Equals,
-                                     datasource_name))
+    datasource_matches = find_matches(
+        server.datasources,
+        {TSC.RequestOptions.Field.Name: datasource_name,
+         TSC.RequestOptions.Field.ProjectName: project_name},
+        lambda datasource: datasource.project_id == project_id)
+    return select_datasource_id(datasource_matches, datasource_name)
+
 
-    datasource_matches = server.datasources.get(req_options=req_option)
+async def get_datasource_id_async(server, project_id, datasource_name, project_name=None):
+    datasource_matches = await find_matches_async(
+        server,
+        'datasources',
+        TSC.DatasourceItem,
+        {TSC.RequestOptions.Field.Name: datasource_name,
+         TSC.RequestOptions.Field.ProjectName: project_name},
+        lambda datasource: datasource.project_id == project_id)
+    return select_datasource_id(datasource_matches, datasource_name)
 
-    # We can't filter by project_id or project_name in the initial request,
-    # so we have to find all name matches and look for a project_id match.
-    datasource_id = None
-    for datasource in datasource_matches[0]:
-        if datasource.project_id == project_id:
-            datasource_id = datasource.id
-    if datasource_id is None:
+
+def select_datasource_id(datasource_matches, datasource_name):
+    if len(datasource_matches) > 1:
+        print(
+            f'More than one datasource named {datasource_name} lives in the project you specified.')
+        sys.exit(errors.EXIT_CODE_INVALID_DATASOURCE)
+    if not datasource_matches:
         print(
             f'{datasource_name} could not be found that lives in the project you specified. Please check for typos and ensure that the name(s) you provide match exactly (case sensitive)')
         sys.exit(errors.EXIT_CODE_INVALID_DATASOURCE)
-    return datasource_id
+    return datasource_matches[0].id
 
 
-def get_workbook_id(server, project_id, workbook_name):
+def get_workbook_id(server, project_id, workbook_name, project_name=None):
     """
     Looks up and returns the workbook_id of the workbook_name that was specified, filtered by project_id matches.
+
+    When project_name is provided it is also filtered on by the server, so only workbooks in projects with that name are returned.
     """
-    req_option = TSC.RequestOptions()
-    req_option.filter.add(TSC.Filter(TSC.RequestOptions.Field.Name,
-                                     TSC.RequestOptions.Operator.Equals,
-                                     workbook_name))
-
-    workbook_matches = server.workbooks.get(req_options=req_option)
-    # We can't filter by project_id in the initial request,
-    # so we have to find all name matches and look for a project_id match.
-    workbook_id = None
-    for workbook in workbook_matches[0]:
-        if workbook.project_id == project_id:
-            workbook_id = workbook.id
-    if workbook_id is None:
+    workbook_matches = find_matches(
+        server.workbooks,
+        {TSC.RequestOptions.Field.Name: workbook_name,
+         TSC.RequestOptions.Field.ProjectName: project_name},
+        lambda workbook: workbook.project_id == project_id)
+    return select_workbook_id(workbook_matches, workbook_name)
+
+
+async def get_workbook_id_async(server, project_id, workbook_name, project_name=None):
+    workbook_matches = await find_matches_async(
+        server,
+        'workbooks',
+        TSC.WorkbookItem,
+        {TSC.RequestOptions.Field.Name: workbook_name,
+         TSC.RequestOptions.Field.ProjectName: project_name},
+        lambda workbook: workbook.project_id == project_id)
+    return select_workbook_id(workbook_matches, workbook_name)
+
+
+def select_workbook_id(workbook_matches, workbook_name):
+    if len(workbook_matches) > 1:
+        print(
+            f'More than one workbook named {workbook_name} lives in the project you specified.')
+        sys.exit(errors.EXIT_CODE_INVALID_WORKBOOK)
+    if not workbook_matches:
         print(
             f'{workbook_name} could not be found in the project you specified. Please check for typos and ensure that the name(s) you provide match exactly (case sensitive)')
         sys.exit(errors.EXIT_CODE_INVALID_WORKBOOK)
-    return workbook_id
+    return workbook_matches[0].id
 
 
-def get_view_id(server, project_id, workbook_id, view_name):
+def get_view_id(
+        server,
+        project_id,
+        workbook_id,
+        view_name,
+        project_name=None,
+        workbook_name=None):
     """
     Looks up and returns the view_id of the view_name that was specified, filtered by project_id AND workbook_id matches.
+
+    When project_name and workbook_name are provided they are also filtered on by the server,
+    so same-named views in other workbooks are never downloaded.
     """
-    req_option = TSC.RequestOptions()
-    req_option.filter.add(TSC.Filter(TSC.RequestOptions.Field.Name,
-                                     TSC.RequestOptions.Operator.Equals,
-                                     view_name))
-
-    view_matches = server.views.get(req_options=req_option)
-    # We can't filter by project_id or workbook_id in the initial request,
-    # so we have to find all name matches and look for those matches.
-    view_id = None
-    for view in view_matches[0]:
-        if view.project_id == project_id:
-            if view.workbook_id == workbook_id:
-                view_id = view.id
-    if view_id is None:
+    view_matches = find_matches(
+        server.views,
+        {TSC.RequestOptions.Field.Name: view_name,
+         TSC.RequestOptions.Field.ProjectName: project_name,
+         VIEW_WORKBOOK_NAME_FIELD: workbook_name},
+        lambda view: view.project_id == project_id and view.workbook_id == workbook_id)
+    return select_view_id(view_matches, view_name)
+
+
+async def get_view_id_async(
+        server,
+        project_id,
+        workbook_id,
+        view_name,
+        project_name=None,
+        workbook_name=None):
+    view_matches = await find_matches_async(
+        server,
+        'views',
+        TSC.ViewItem,
+        {TSC.RequestOptions.Field.Name: view_name,
+         TSC.RequestOptions.Field.ProjectName: project_name,
+         VIEW_WORKBOOK_NAME_FIELD: workbook_name},
+        lambda view: view.project_id == project_id and view.workbook_id == workbook_id)
+    return select_view_id(view_matches, view_name)
+
+
+def select_view_id(view_matches, view_name):
+    if len(view_matches) > 1:
+        print(
+            f'More than one view named {view_name} lives in the project and workbook you specified.')
+        sys.exit(errors.EXIT_CODE_INVALID_VIEW)
+    if not view_matches:
         print(
             f'{view_name} could not be found that lives in the project and workbook you specified. Please check for typos and ensure that the name(s) you provide match exactly (case sensitive)')
         sys.exit(errors.EXIT_CODE_INVALID_VIEW)
-    return view_id
+    return view_matches[0].id
+
+
+def resolve_once(ids, key, lookup_function, **kwargs):
+    """
+    Returns ids[key], calling lookup_function to fill it in the first time the key is needed.
+
+    While the key is being looked up, ids holds a future of its ID, so threads that need
+    the same key wait for that lookup instead of repeating it. A failed lookup is raised
+    to those threads and then dropped, so the next call for the key tries again.
+    """
+    pending_id = futures.Future()
+    resolved_id = ids.setdefault(key, pending_id)
+    if resolved_id is not pending_id:
+        return resolved_id.result() if isinstance(resolved_id, futures.Future) else resolved_id
+    try:
+        resolved_id = lookup_function(**kwargs)
+    except BaseException as e:
+        pending_id.set_exception(e)
+        if ids.get(key) is pending_id:
+            del ids[key]
+        raise
+    pending_id.set_result(resolved_id)
+    ids[key] = resolved_id
+    return resolved_id
+
+
+def resolve_project_id(server, project_name, project_ids=None):
+    """
+    Looks up the project_id, reusing project_ids, a dictionary of project names already resolved in this run.
+    The dictionary can be shared between threads.
+    """
+    if project_ids is None:
+        return get_project_id(server=server, project_name=project_name)
+    return resolve_once(
+        project_ids,
+        project_name,
+        get_project_id,
+        server=server,
+        project_name=project_name)
+
+
+def resolve_workbook_id(server, project_id, workbook_name, project_name=None, workbook_ids=None):
+    """
+    Looks up the workbook_id, reusing workbook_ids, a dictionary of workbooks already resolved in this run.
+    The dictionary can be shared between threads.
+    """
+    if workbook_ids is None:
+        return get_workbook_id(
+            server=server,
+            project_id=project_id,
+            workbook_name=workbook_name,
+            project_name=project_name)
+    return resolve_once(
+        workbook_ids,
+        (project_id, workbook_name),
+        get_workbook_id,
+        server=server,
+        project_id=project_id,
+        workbook_name=workbook_name,
+        project_name=project_name)
+
+
+async def resolve_once_async(ids, key, lookup_function, **kwargs):
+    """
+    Async counterpart of resolve_once, where lookup_function is a coroutine function and
+    coroutines that need a key being looked up wait for that lookup instead of repeating it.
+    """
+    if key in ids:
+        resolved_id = ids[key]
+        return await resolved_id if asyncio.isfuture(resolved_id) else resolved_id
+
+    pending_id = asyncio.get_event_loop().create_future()
+    ids[key] = pending_id
+    try:
+        resolved_id = await lookup_function(**kwargs)
+    except BaseException as e:
+        pending_id.set_exception(e)
+        # Marks the failure as retrieved, since no other call may be waiting for it.
+        pending_id.exception()
+        if ids.get(key) is pending_id:
+            del ids[key]
+        raise
+    pending_id.set_result(resolved_id)
+    ids[key] = resolved_id
+    return resolved_id
+
+
+async def resolve_project_id_async(server, project_name, project_ids=None):
+    """
+    Async counterpart of resolve_project_id.
+    """
+    if project_ids is None:
+        return await get_project_id_async(server=server, project_name=project_name)
+    return await resolve_once_async(
+        project_ids,
+        project_name,
+        get_project_id_async,
+        server=server,
+        project_name=project_name)
+
+
+async def resolve_workbook_id_async(
+        server,
+        project_id,
+        workbook_name,
+        project_name=None,
+        workbook_ids=None):
+    """
+    Async counterpart of resolve_workbook_id.
+    """
+    if workbook_ids is None:
+        return await get_workbook_id_async(
+            server=server,
+            project_id=project_id,
+            workbook_name=workbook_name,
+            project_name=project_name)
+    return await resolve_once_async(
+        workbook_ids,
+        (project_id, workbook_name),
+        get_workbook_id_async,
+        server=server,
+        project_id=project_id,
+        workbook_name=workbook_name,
+        project_name=project_name)
+
+
+def get_cached_ids(server, name_path, cache=None, refresh=False):
+    """
+    Returns the cached IDs of the name path, or None when there is no cache or no fresh entry.
+    Set refresh to discard the cached entry instead.
+    """
+    if cache and refresh:
+        cache.invalidate(server, name_path)
+    elif cache:
+        cached_ids = cache.get(server, name_path)
+        if cached_ids:
+            metrics.increment('lookup_cache_hits')
+            return cached_ids
+    return None
+
+
+@metrics.timed('lookup')
+def get_view_ids(
+        server,
+        project_name,
+        workbook_name,
+        view_name,
+        cache=None,
+        refresh=False,
+        project_ids=None,
+        workbook_ids=None):
+    """
+    Resolves the project, workbook and view names to their IDs, using the lookup cache when one is provided.
+
+    Set refresh to discard any cached entry, e.g. after the server reports that a cached ID no longer exists.
+    Pass the same project_ids and workbook_ids dictionaries to several calls, including from several threads,
+    to only look up each project and workbook once.
+    """
+    name_path = ('view', project_name, workbook_name, view_name)
+    cached_ids = get_cached_ids(server, name_path, cache, refresh)
+    if cached_ids:
+        return cached_ids
+
+    project_id = resolve_project_id(server, project_name, project_ids)
+    workbook_id = resolve_workbook_id(
+        server,
+        project_id,
+        workbook_name,
+        project_name=project_name,
+        workbook_ids=workbook_ids)
+    view_id = get_view_id(
+        server=server,
+        project_id=project_id,
+        workbook_id=workbook_id,
+        view_name=view_name,
+        project_name=project_name,
+        workbook_name=workbook_name)
+    ids = {
+        'project_id': project_id,
+        'workbook_id': workbook_id,
+        'view_id': view_id}
+    if cache:
+        cache.set(server, name_path, ids)
+    return ids
+
+
+async def get_view_ids_async(
+        server,
+        project_name,
+        workbook_name,
+        view_name,
+        cache=None,
+        refresh=False,
+        project_ids=None,
+        workbook_ids=None):
+    """
+    Async counterpart of get_view_ids.
+    """
+    with metrics.phase('lookup'):
+        name_path = ('view', project_name, workbook_name, view_name)
+        cached_ids = get_cached_ids(server, name_path, cache, refresh)
+        if cached_ids:
+            return cached_ids
+
+        project_id = await resolve_project_id_async(server, project_name, project_ids)
+        workbook_id = await resolve_workbook_id_async(
+            server,
+            project_id,
+            workbook_name,
+            project_name=project_name,
+            workbook_ids=workbook_ids)
+        view_id = await get_view_id_async(
+            server=server,
+            project_id=project_id,
+            workbook_id=workbook_id,
+            view_name=view_name,
+            project_name=project_name,
+            workbook_name=workbook_name)
+        ids = {
+            'project_id': project_id,
+            'workbook_id': workbook_id,
+            'view_id': view_id}
+        if cache:
+            cache.set(server, name_path, ids)
+        return ids
+
+
+@metrics.timed('lookup')
+def get_workbook_ids(
+        server,
+        project_name,
+        workbook_name,
+        cache=None,
+        refresh=False,
+        project_ids=None):
+    """
+    Resolves the project and workbook names to their IDs, using the lookup cache when one is provided.
+    """
+    name_path = ('workbook', project_name, workbook_name)
+    cached_ids = get_cached_ids(server, name_path, cache, refresh)
+    if cached_ids:
+        return cached_ids
+
+    project_id = resolve_project_id(server, project_name, project_ids)
+    workbook_id = get_workbook_id(
+        server=server,
+        project_id=project_id,
+        workbook_name=workbook_name,
+        project_name=project_name)
+    ids = {'project_id': project_id, 'workbook_id': workbook_id}
+    if cache:
+        cache.set(server, name_path, ids)
+    return ids
+
+
+async def get_workbook_ids_async(
+        server,
+        project_name,
+        workbook_name,
+        cache=None,
+        refresh=False,
+        project_ids=None):
+    """
+    Async counterpart of get_workbook_ids.
+    """
+    with metrics.phase('lookup'):
+        name_path = ('workbook', project_name, workbook_name)
+        cached_ids = get_cached_ids(server, name_path, cache, refresh)
+        if cached_ids:
+            return cached_ids
+
+        project_id = await resolve_project_id_async(server, project_name, project_ids)
+        workbook_id = await get_workbook_id_async(
+            server=server,
+            project_id=project_id,
+            workbook_name=workbook_name,
+            project_name=project_name)
+        ids = {'project_id': project_id, 'workbook_id': workbook_id}
+        if cache:
+            cache.set(server, name_path, ids)
+        return ids
+
+
+@metrics.timed('lookup')
+def get_datasource_ids(
+        server,
+        project_name,
+        datasource_name,
+        cache=None,
+        refresh=False,
+        project_ids=None):
+    """
+    Resolves the project and datasource names to their IDs, using the lookup cache when one is provided.
+    """
+    name_path = ('datasource', project_name, datasource_name)
+    cached_ids = get_cached_ids(server, name_path, cache, refresh)
+    if cached_ids:
+        return cached_ids
+
+    project_id = resolve_project_id(server, project_name, project_ids)
+    datasource_id = get_datasource_id(
+        server=server,
+        project_id=project_id,
+        datasource_name=datasource_name,
+        project_name=project_name)
+    ids = {'project_id': project_id, 'datasource_id': datasource_id}
+    if cache:
+        cache.set(server, name_path, ids)
+    return ids
+
+
+async def get_datasource_ids_async(
+        server,
+        project_name,
+        datasource_name,
+        cache=None,
+        refresh=False,
+        project_ids=None):
+    """
+    Async counterpart of get_datasource_ids.
+    """
+    with metrics.phase('lookup'):
+        name_path = ('datasource', project_name, datasource_name)
+        cached_ids = get_cached_ids(server, name_path, cache, refresh)
+        if cached_ids:
+            return cached_ids
+
+        project_id = await resolve_project_id_async(server, project_name, project_ids)
+        datasource_id = await get_datasource_id_async(
+            server=server,
+            project_id=project_id,
+            datasource_name=datasource_name,
+            project_name=project_name)
+        ids = {'project_id': project_id, 'datasource_id': datasource_id}
+        if cache:
+            cache.set(server, name_path, ids)
+        return ids
+
+
+def is_not_found_error(error):
+    """
+    Whether a TSC error reports that the requested resource does not exist (HTTP 404).
+    """
+    return isinstance(error, TSC.ServerResponseError) and str(
+        error.code).startswith('404')
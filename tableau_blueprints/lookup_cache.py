@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+
+try:
+    import catalog
+except BaseException:
+    from . import catalog
+
+DEFAULT_CACHE_FOLDER_NAME = os.path.join(
+    os.path.expanduser('~'), '.cache', 'tableau-blueprints', 'lookups')
+
+
+class LookupCache():
+    """
+    On-disk cache of resolved Tableau IDs.
+
+    Entries are keyed by server URL, site and a name path such as
+    ('view', project_name, workbook_name, view_name) and expire after ttl_seconds.
+    Each entry is its own file and is replaced atomically, so concurrent processes
+    can share a cache folder without locking.
+    """
+
+    def __init__(self, ttl_seconds, cache_folder_name=None):
+        self.ttl_seconds = ttl_seconds
+        self.cache_folder_name = cache_folder_name or DEFAULT_CACHE_FOLDER_NAME
+
+    def _entry_file_name(self, server, name_path):
+        key = json.dumps([server.server_address, server.site_id, list(name_path)])
+        return os.path.join(
+            self.cache_folder_name,
+            f'{hashlib.sha256(key.encode("utf-8")).hexdigest()}.json')
+
+    def get(self, server, name_path):
+        """
+        Returns the cached IDs for the name path, or None if they are missing or expired.
+        """
+        try:
+            with open(self._entry_file_name(server, name_path), 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get('cached_at', 0) > self.ttl_seconds:
+            return None
+        return entry.get('ids')
+
+    def set(self, server, name_path, ids):
+        entry_file_name = self._entry_file_name(server, name_path)
+        temporary_file_name = f'{entry_file_name}.{uuid.uuid4().hex[:8]}.part'
+        try:
+            os.makedirs(self.cache_folder_name, exist_ok=True)
+            with open(temporary_file_name, 'w') as f:
+                json.dump({'cached_at': time.time(), 'ids': ids}, f)
+            os.replace(temporary_file_name, entry_file_name)
+        except OSError as e:
+            # The cache is an optimization, so a failed write should never fail the run.
+            print(f'Could not write to the lookup cache: {e}')
+            try:
+                os.remove(temporary_file_name)
+            except OSError:
+                pass
+
+    def invalidate(self, server, name_path):
+        try:
+            os.remove(self._entry_file_name(server, name_path))
+        except OSError:
+            pass
+
+
+class MemoryLookupCache():
+    """
+    In-process lookup cache with the same interface as LookupCache, used by the worker.
+
+    Changes are also kept in a journal, so a forked worker process can hand back what
+    it learned to the long-lived worker.
+    """
+
+    def __init__(self, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self.entries = {}
+        self.journal = []
+
+    def _key(self, server, name_path):
+        return json.dumps([server.server_address, server.site_id, list(name_path)])
+
+    def get(self, server, name_path):
+        entry = self.entries.get(self._key(server, name_path))
+        if entry is None or time.time() - entry['cached_at'] > self.ttl_seconds:
+            return None
+        return entry['ids']
+
+    def set(self, server, name_path, ids):
+        key = self._key(server, name_path)
+        self.entries[key] = {'cached_at': time.time(), 'ids': ids}
+        self.journal.append([key, self.entries[key]])
+
+    def invalidate(self, server, name_path):
+        key = self._key(server, name_path)
+        self.entries.pop(key, None)
+        self.journal.append([key, None])
+
+    def apply_journal(self, journal):
+        for key, entry in journal:
+            if entry is None:
+                self.entries.pop(key, None)
+            else:
+                self.entries[key] = entry
+
+
+# Set by the worker so that every lookup in the process consults its in-memory cache first.
+memory_cache = None
+
+
+class LookupCacheChain():
+    """
+    Reads from each lookup cache in order and writes to all of them.
+    """
+
+    def __init__(self, caches):
+        self.caches = caches
+
+    def get(self, server, name_path):
+        for cache in self.caches:
+            ids = cache.get(server, name_path)
+            if ids:
+                return ids
+        return None
+
+    def set(self, server, name_path, ids):
+        for cache in self.caches:
+            cache.set(server, name_path, ids)
+
+    def invalidate(self, server, name_path):
+        for cache in self.caches:
+            cache.invalidate(server, name_path)
+
+
+def create_lookup_cache(
+        ttl_seconds,
+        cache_folder_name=None,
+        catalog_file_name=None):
+    """
+    Returns the lookup cache to use, or None when neither a TTL nor a catalog is configured.
+
+    The worker's in-memory cache is consulted first, then a synced catalog, then the on-disk cache.
+    """
+    caches = []
+    if memory_cache is not None:
+        caches.append(memory_cache)
+    if catalog_file_name:
+        caches.append(catalog.CatalogIndex(catalog_file_name))
+    if ttl_seconds and ttl_seconds > 0:
+        caches.append(LookupCache(ttl_seconds, cache_folder_name))
+    if not caches:
+        return None
+    if len(caches) == 1:
+        return caches[0]
+    return LookupCacheChain(caches)
+
+
+def add_lookup_cache_arguments(parser):
+    """
+    Adds the lookup cache options shared by every blueprint that resolves names to IDs.
+    """
+    parser.add_argument(
+        '--lookup-cache-ttl',
+        dest='lookup_cache_ttl',
+        type=int,
+        default=0,
+        required=False)
+    parser.add_argument(
+        '--lookup-cache-folder-name',
+        dest='lookup_cache_folder_name',
+        default=None,
+        required=False)
+    parser.add_argument(
+        '--catalog-file-name',
+        dest='catalog_file_name',
+        default=None,
+        required=False)
@@ -0,0 +1,52 @@
+import csv
+import json
+import os
+import sys
+
+try:
+    import errors
+except BaseException:
+    from . import errors
+
+
+def read_manifest(manifest_file_name, required_fields, optional_fields=()):
+    """
+    Reads a CSV or JSON manifest and returns a list of dictionaries, one per row.
+
+    JSON manifests must contain a list of objects. CSV manifests must have a header row.
+    Every row must provide a value for each of the required_fields.
+    """
+    try:
+        with open(manifest_file_name, 'r', newline='') as f:
+            if os.path.splitext(manifest_file_name)[1].lower() == '.json':
+                rows = json.load(f)
+            else:
+                rows = list(csv.DictReader(f))
+    except (OSError, ValueError) as e:
+        print(f'Could not read manifest file: {manifest_file_name}')
+        print(e)
+        sys.exit(errors.EXIT_CODE_INVALID_MANIFEST)
+
+    if not isinstance(rows, list) or not rows:
+        print(
+            f'Manifest file {manifest_file_name} must contain a non-empty list of entries.')
+        sys.exit(errors.EXIT_CODE_INVALID_MANIFEST)
+
+    manifest = []
+    for row_number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            print(f'Manifest entry {row_number} is not an object.')
+            sys.exit(errors.EXIT_CODE_INVALID_MANIFEST)
+        missing_fields = [
+            field for field in required_fields if not str(
+                row.get(field) or '').strip()]
+        if missing_fields:
+            print(
+                f'Manifest entry {row_number} is missing required field(s): {", ".join(missing_fields)}')
+            sys.exit(errors.EXIT_CODE_INVALID_MANIFEST)
+        entry = {field: str(row[field]).strip() for field in required_fields}
+        for field in optional_fields:
+            value = row.get(field)
+            entry[field] = str(value).strip() if value not in (None, '') else None
+        manifest.append(entry)
+    return manifest
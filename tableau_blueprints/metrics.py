@@ -0,0 +1,258 @@
+import atexit
+import contextvars
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import lazy_imports
+except BaseException:
+    from . import lazy_imports
+
+shipyard = lazy_imports.lazy_import('shipyard_utils')
+
+
+class MetricsRecorder():
+    """
+    Collects phase timings, REST request statistics and counters for a single blueprint run.
+
+    Phases are also kept as spans, nested by the phase that was open in the same thread
+    or asyncio task, so they can be exported in an OpenTelemetry-style trace.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.trace_id = uuid.uuid4().hex
+        self.root_span_id = uuid.uuid4().hex[:16]
+        self.phases = {}
+        self.spans = []
+        self.counters = {}
+        self.requests = {
+            'count': 0,
+            'total_latency_seconds': 0.0,
+            'max_latency_seconds': 0.0,
+            'bytes_received': 0,
+            'status_codes': {},
+        }
+        self._lock = threading.Lock()
+        self._span_stack = contextvars.ContextVar('span_stack', default=())
+
+    @contextmanager
+    def phase(self, name, **attributes):
+        """
+        Times the enclosed block as the named phase.
+        """
+        span_stack = self._span_stack.get()
+        span_id = uuid.uuid4().hex[:16]
+        parent_span_id = span_stack[-1] if span_stack else self.root_span_id
+        span_stack_token = self._span_stack.set(span_stack + (span_id,))
+        start_time = time.time()
+        start_counter = time.perf_counter()
+        status = 'ok'
+        try:
+            yield
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                status = 'error'
+            raise
+        except BaseException:
+            status = 'error'
+            raise
+        finally:
+            duration = time.perf_counter() - start_counter
+            self._span_stack.reset(span_stack_token)
+            with self._lock:
+                phase = self.phases.setdefault(
+                    name, {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+                phase['count'] += 1
+                phase['total_seconds'] += duration
+                phase['max_seconds'] = max(phase['max_seconds'], duration)
+                self.spans.append({
+                    'name': name,
+                    'span_id': span_id,
+                    'parent_span_id': parent_span_id,
+                    'start_time': start_time,
+                    'end_time': start_time + duration,
+                    'status': status,
+                    'attributes': attributes,
+                })
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_response(self, response, *args, stream=False, **kwargs):
+        """
+        A requests response hook. A body that isn't streamed is read right after the hooks run
+        anyway, so its size is counted here. A streamed body is counted with record_bytes_received
+        as its chunks are read, since Content-Length is missing from chunked responses.
+        """
+        self.record_request(
+            response.status_code,
+            response.elapsed.total_seconds(),
+            None if stream else len(response.content))
+
+    def record_request(self, status_code, latency, content_length=None):
+        with self._lock:
+            self.requests['count'] += 1
+            self.requests['total_latency_seconds'] += latency
+            self.requests['max_latency_seconds'] = max(
+                self.requests['max_latency_seconds'], latency)
+            if content_length:
+                self.requests['bytes_received'] += content_length
+            status_code = str(status_code)
+            self.requests['status_codes'][status_code] = self.requests['status_codes'].get(
+                status_code, 0) + 1
+
+    def record_bytes_received(self, byte_count):
+        with self._lock:
+            self.requests['bytes_received'] += byte_count
+
+    def instrument_session(self, session):
+        if self.record_response not in session.hooks['response']:
+            session.hooks['response'].append(self.record_response)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'script': os.path.basename(sys.argv[0]),
+                'started_at': self.started_at,
+                'duration_seconds': round(time.time() - self.started_at, 3),
+                'phases': {
+                    name: {
+                        'count': phase['count'],
+                        'total_seconds': round(phase['total_seconds'], 3),
+                        'max_seconds': round(phase['max_seconds'], 3),
+                    } for name, phase in self.phases.items()},
+                'requests': {
+                    **self.requests,
+                    'total_latency_seconds': round(self.requests['total_latency_seconds'], 3),
+                    'max_latency_seconds': round(self.requests['max_latency_seconds'], 3),
+                    'status_codes': dict(self.requests['status_codes']),
+                },
+                'counters': dict(self.counters),
+            }
+
+    def to_spans(self):
+        """
+        Returns the run and its phases as spans in the OTLP JSON field layout.
+        """
+        def to_span(name, span_id, parent_span_id, start_time, end_time, status, attributes):
+            return {
+                'traceId': self.trace_id,
+                'spanId': span_id,
+                'parentSpanId': parent_span_id,
+                'name': name,
+                'startTimeUnixNano': int(start_time * 1e9),
+                'endTimeUnixNano': int(end_time * 1e9),
+                'status': {'code': 'STATUS_CODE_ERROR' if status == 'error' else 'STATUS_CODE_OK'},
+                'attributes': [
+                    {'key': key, 'value': {'stringValue': str(value)}}
+                    for key, value in attributes.items()],
+            }
+
+        with self._lock:
+            spans = [to_span(
+                os.path.basename(sys.argv[0]),
+                self.root_span_id,
+                '',
+                self.started_at,
+                time.time(),
+                'ok',
+                {})]
+            spans.extend(to_span(**span) for span in self.spans)
+        return spans
+
+
+recorder = MetricsRecorder()
+
+
+def phase(name, **attributes):
+    return recorder.phase(name, **attributes)
+
+
+def timed(name):
+    """
+    Decorates a function so that every call is timed as the named phase.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with recorder.phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def increment(name, amount=1):
+    recorder.increment(name, amount)
+
+
+def instrument_session(session):
+    recorder.instrument_session(session)
+
+
+def record_request(status_code, latency, content_length=None):
+    recorder.record_request(status_code, latency, content_length)
+
+
+def record_bytes_received(byte_count):
+    recorder.record_bytes_received(byte_count)
+
+
+def write_metrics(metrics_file_name=None, span_file_name=None):
+    """
+    Writes the run's metrics to the artifacts logs folder, and optionally appends its spans as one JSON line per span.
+    """
+    try:
+        if metrics_file_name:
+            base_folder_name = shipyard.logs.determine_base_artifact_folder(
+                'tableau')
+            artifact_subfolder_paths = shipyard.logs.determine_artifact_subfolders(
+                base_folder_name)
+            shipyard.files.create_folder_if_dne(
+                artifact_subfolder_paths['logs'])
+            shipyard.files.write_json_to_file(
+                recorder.to_dict(),
+                shipyard.files.combine_folder_and_file_name(
+                    artifact_subfolder_paths['logs'], metrics_file_name))
+        if span_file_name:
+            shipyard.files.create_folder_if_dne(
+                os.path.dirname(span_file_name))
+            with open(span_file_name, 'a') as f:
+                for span in recorder.to_spans():
+                    f.write(json.dumps(span) + '\n')
+    except OSError as e:
+        # Metrics are diagnostics, so a failed write should never fail the run.
+        print(f'Could not write metrics: {e}')
+
+
+def start(args):
+    """
+    Writes the metrics when the run ends, including runs that end with sys.exit.
+    Nothing is written unless --metrics-file-name or --span-file-name is set.
+    """
+    if not args.metrics_file_name and not args.span_file_name:
+        return
+    atexit.register(
+        write_metrics,
+        args.metrics_file_name,
+        args.span_file_name)
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument(
+        '--metrics-file-name',
+        dest='metrics_file_name',
+        default=None,
+        required=False)
+    parser.add_argument(
+        '--span-file-name',
+        dest='span_file_name',
+        default=None,
+        required=False)
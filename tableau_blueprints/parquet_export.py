@@ -0,0 +1,108 @@
+import importlib.util
+import io
+import sys
+
+try:
+    import errors
+except BaseException:
+    from . import errors
+
+PARQUET_COMPRESSIONS = ('none', 'snappy', 'gzip', 'brotli', 'zstd', 'lz4')
+DEFAULT_PARQUET_COMPRESSION = 'snappy'
+# Column types are inferred from the first block, and at most a few blocks are held in memory at once.
+DEFAULT_PARQUET_BLOCK_SIZE = 16 * 1024 * 1024
+
+
+class ChunkReader(io.RawIOBase):
+    """
+    Presents an iterator of byte chunks, such as a streamed export, as a readable file.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            try:
+                self.pending = memoryview(next(self.chunks))
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+def is_pyarrow_installed():
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def write_csv_as_parquet(
+        csv_chunks,
+        file,
+        compression=DEFAULT_PARQUET_COMPRESSION,
+        block_size=DEFAULT_PARQUET_BLOCK_SIZE):
+    """
+    Converts a streamed CSV export to Parquet as it arrives, writing one row group per block
+    of block_size bytes. Returns the number of rows written.
+
+    The schema is inferred from the first block. A later value that doesn't fit it, such as
+    text in a column whose first block was all numbers, ends the conversion with an error.
+    """
+    import pyarrow
+    import pyarrow.csv
+    import pyarrow.parquet
+
+    row_count = 0
+    try:
+        reader = pyarrow.csv.open_csv(
+            io.BufferedReader(ChunkReader(csv_chunks)),
+            read_options=pyarrow.csv.ReadOptions(block_size=block_size))
+        with pyarrow.parquet.ParquetWriter(
+                file,
+                reader.schema,
+                compression=None if compression == 'none' else compression) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+                row_count += batch.num_rows
+    except pyarrow.ArrowInvalid as e:
+        print('Could not convert the CSV export to Parquet.')
+        print(e)
+        if 'conversion error' in str(e):
+            print(
+                'A column changes type part way through the export. Increase --parquet-block-size so the first block includes the change.')
+        sys.exit(errors.EXIT_CODE_FILE_WRITE_ERROR)
+    return row_count
+
+
+def add_parquet_arguments(parser):
+    parser.add_argument(
+        '--parquet-compression',
+        dest='parquet_compression',
+        choices=PARQUET_COMPRESSIONS,
+        type=str.lower,
+        default=DEFAULT_PARQUET_COMPRESSION,
+        required=False)
+    parser.add_argument(
+        '--parquet-block-size',
+        dest='parquet_block_size',
+        type=int,
+        default=DEFAULT_PARQUET_BLOCK_SIZE,
+        required=False)
+
+
+def get_parquet_options(args, file_type=None):
+    """
+    Returns the keyword arguments for write_csv_as_parquet, or None when the export isn't converted to Parquet.
+    The file type defaults to --file-type, for blueprints whose file type is set per export.
+    """
+    if (file_type or args.file_type) != 'parquet':
+        return None
+    return {
+        'compression': args.parquet_compression,
+        'block_size': args.parquet_block_size,
+    }
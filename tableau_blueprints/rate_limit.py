@@ -0,0 +1,144 @@
+import fcntl
+import json
+import os
+import re
+import time
+from urllib.parse import urlsplit
+
+try:
+    import metrics
+except BaseException:
+    from . import metrics
+
+REQUEST_CATEGORIES = ('sign_in', 'metadata', 'export')
+# Requests per second allowed for each category, summed over every process sharing the rate limit file.
+# A limit of 0 leaves the category unlimited.
+DEFAULT_RATE_LIMITS = {
+    'sign_in': 1.0,
+    'metadata': 20.0,
+    'export': 5.0,
+}
+# How many seconds of unused budget a category can save up and spend in a burst.
+DEFAULT_BURST_SECONDS = 1.0
+DEFAULT_PORTS = {
+    'http': 80,
+    'https': 443,
+}
+SIGN_IN_PATH_PATTERN = re.compile(r'/auth/(signin|switchSite)$')
+EXPORT_PATH_PATTERN = re.compile(
+    r'/(views|workbooks|datasources)/[^/]+/(image|pdf|data|crosstab/excel|content)$')
+
+
+def classify_request(url):
+    """
+    Returns the budget a REST request draws from: sign_in, export for renders and downloads, or metadata for everything else.
+    """
+    path = urlsplit(url).path
+    if SIGN_IN_PATH_PATTERN.search(path):
+        return 'sign_in'
+    if EXPORT_PATH_PATTERN.search(path):
+        return 'export'
+    return 'metadata'
+
+
+def get_server_key(url):
+    """
+    Budgets are shared per server, so requests to every site and API version of a server count together.
+    The port is always included, so a URL with the scheme's default port shares the budget of one without a port.
+    """
+    parts = urlsplit(url)
+    port = parts.port or DEFAULT_PORTS.get(parts.scheme.lower())
+    return f'{parts.scheme}://{parts.hostname}:{port}'.lower()
+
+
+class RateLimiter():
+    """
+    A token bucket per server and request category, kept in a local file so that every
+    process on the host that uses the same file shares one request budget.
+
+    Each request reserves the next free slot under an flock and then sleeps until that slot,
+    so waiting requests are spread out at the configured rate instead of retrying in bursts.
+    """
+
+    def __init__(
+            self,
+            rate_limit_file_name,
+            rate_limits=None,
+            burst_seconds=DEFAULT_BURST_SECONDS):
+        self.rate_limit_file_name = rate_limit_file_name
+        self.rate_limits = dict(DEFAULT_RATE_LIMITS, **(rate_limits or {}))
+        self.burst_seconds = burst_seconds
+
+    def reserve(self, url):
+        """
+        Takes a token for the request and returns how many seconds to wait before sending it.
+        """
+        category = classify_request(url)
+        rate = self.rate_limits[category]
+        if rate <= 0:
+            return 0
+        capacity = max(rate * self.burst_seconds, 1)
+        key = f'{get_server_key(url)} {category}'
+
+        folder_name = os.path.dirname(os.path.abspath(self.rate_limit_file_name))
+        os.makedirs(folder_name, exist_ok=True)
+        file_descriptor = os.open(
+            self.rate_limit_file_name, os.O_RDWR | os.O_CREAT, 0o600)
+        with os.fdopen(file_descriptor, 'r+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                try:
+                    buckets = json.load(f)
+                except ValueError:
+                    buckets = {}
+                now = time.time()
+                bucket = buckets.get(key, {'tokens': capacity, 'updated_at': now})
+                tokens = min(
+                    capacity,
+                    bucket['tokens'] + (now - bucket['updated_at']) * rate)
+                # Tokens go negative while requests are queued, and each request waits until its token is refilled.
+                tokens -= 1
+                buckets[key] = {'tokens': tokens, 'updated_at': now}
+                f.seek(0)
+                f.truncate()
+                json.dump(buckets, f)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return max(-tokens / rate, 0)
+
+
+def record_wait(delay):
+    if delay > 0:
+        metrics.increment('rate_limited_requests')
+        metrics.increment('rate_limit_wait_seconds', round(delay, 3))
+
+
+def create_rate_limiter(rate_limit_file_name, rate_limits=None):
+    """
+    Returns the rate limiter to use, or None when no rate limit file is configured.
+    """
+    if not rate_limit_file_name:
+        return None
+    return RateLimiter(rate_limit_file_name, rate_limits)
+
+
+def add_rate_limit_arguments(parser):
+    parser.add_argument(
+        '--rate-limit-file-name',
+        dest='rate_limit_file_name',
+        default=None,
+        required=False)
+    for category in REQUEST_CATEGORIES:
+        parser.add_argument(
+            f'--{category.replace("_", "-")}-rate-limit',
+            dest=f'{category}_rate_limit',
+            type=float,
+            default=DEFAULT_RATE_LIMITS[category],
+            required=False)
+
+
+def get_rate_limits(args):
+    return {
+        category: getattr(args, f'{category}_rate_limit')
+        for category in REQUEST_CATEGORIES}
@@ -0,0 +1,399 @@
+import argparse
+import sys
+import time
+from collections import deque
+
+try:
+    import authorization
+    import errors
+    import job_status
+    import lazy_imports
+    import lookup
+    import lookup_cache
+    import manifest
+    import metrics
+    import refresh_resource
+except BaseException:
+    from . import authorization
+    from . import errors
+    from . import job_status
+    from . import lazy_imports
+    from . import lookup
+    from . import lookup_cache
+    from . import manifest
+    from . import metrics
+    from . import refresh_resource
+
+shipyard = lazy_imports.lazy_import('shipyard_utils')
+
+MANIFEST_OPTIONAL_FIELDS = ('depends_on',)
+DEPENDENCY_SEPARATOR = ';'
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--username', dest='username', required=True)
+    parser.add_argument('--password', dest='password', required=True)
+    parser.add_argument('--site-id', dest='site_id', required=True)
+    parser.add_argument('--server-url', dest='server_url', required=True)
+    parser.add_argument(
+        '--sign-in-method',
+        dest='sign_in_method',
+        default='username_password',
+        choices={
+            'username_password',
+            'access_token'},
+        required=False)
+    parser.add_argument(
+        '--resource-manifest-file-name',
+        dest='resource_manifest_file_name',
+        required=True)
+    parser.add_argument(
+        '--discover-dependencies',
+        dest='discover_dependencies',
+        default='FALSE',
+        required=False)
+    parser.add_argument(
+        '--max-concurrent-jobs',
+        dest='max_concurrent_jobs',
+        type=int,
+        default=4,
+        required=False)
+    parser.add_argument(
+        '--timeout',
+        dest='timeout',
+        type=float,
+        default=None,
+        required=False)
+    parser.add_argument(
+        '--summary-file-name',
+        dest='summary_file_name',
+        default='refresh_dag_summary.json',
+        required=False)
+    refresh_resource.add_coalesce_argument(parser)
+    lookup_cache.add_lookup_cache_arguments(parser)
+    authorization.add_connection_arguments(parser)
+    metrics.add_metrics_arguments(parser)
+    lazy_imports.add_profile_startup_argument(parser)
+    args = parser.parse_args()
+    if args.max_concurrent_jobs < 1:
+        parser.error('--max-concurrent-jobs must be at least 1.')
+    return args
+
+
+def get_target_key(target):
+    return f'{target["resource_type"]}:{target["project_name"]}/{target["resource_name"]}'
+
+
+def resolve_dependency(reference, targets_by_key):
+    """
+    Finds the target a depends_on entry refers to. Entries are written as project_name/resource_name,
+    with a datasource: or workbook: prefix when a datasource and a workbook share the name.
+    """
+    if reference in targets_by_key:
+        return [reference]
+    return [
+        key for key in targets_by_key
+        if key.split(':', 1)[1] == reference]
+
+
+def read_refresh_graph(resource_manifest_file_name):
+    """
+    Reads the manifest of resources to refresh and the dependencies declared in its depends_on column,
+    a semicolon separated list of the upstream resources in the same manifest.
+
+    Returns the targets by key and the keys of each target's upstream targets.
+    """
+    targets_by_key = {}
+    declared_dependencies = {}
+    for row_number, entry in enumerate(manifest.read_manifest(
+            resource_manifest_file_name,
+            refresh_resource.MANIFEST_REQUIRED_FIELDS,
+            MANIFEST_OPTIONAL_FIELDS), start=1):
+        entry['resource_type'] = entry['resource_type'].lower()
+        if entry['resource_type'] not in refresh_resource.RESOURCE_TYPES:
+            print(
+                f'Manifest entry {row_number} has an invalid resource_type {entry["resource_type"]}. Valid options are {", ".join(refresh_resource.RESOURCE_TYPES)}')
+            sys.exit(errors.EXIT_CODE_INVALID_MANIFEST)
+        key = get_target_key(entry)
+        targets_by_key.setdefault(key, entry)
+        declared_dependencies.setdefault(key, []).extend(
+            reference.strip()
+            for reference in (entry.pop('depends_on') or '').split(DEPENDENCY_SEPARATOR)
+            if reference.strip())
+
+    upstreams = {key: set() for key in targets_by_key}
+    for key, references in declared_dependencies.items():
+        for reference in references:
+            upstream_keys = resolve_dependency(reference, targets_by_key)
+            if len(upstream_keys) != 1:
+                problem = 'is not in the manifest' if not upstream_keys else 'matches more than one resource. Prefix it with datasource: or workbook:'
+                print(f'The dependency {reference} of {key} {problem}.')
+                sys.exit(errors.EXIT_CODE_INVALID_MANIFEST)
+            upstreams[key].add(upstream_keys[0])
+    return targets_by_key, upstreams
+
+
+@metrics.timed('discover_dependencies')
+def discover_dependencies(server, targets_by_key, upstreams, cache=None):
+    """
+    Adds a dependency from every workbook in the manifest to the manifest's datasources it connects to.
+
+    Workbooks whose connections can't be read keep only their declared dependencies.
+    """
+    project_ids = {}
+    datasource_keys = {}
+    for key, target in targets_by_key.items():
+        if target['resource_type'] != 'datasource':
+            continue
+        try:
+            datasource_ids = lookup.get_datasource_ids(
+                server,
+                target['project_name'],
+                target['resource_name'],
+                cache=cache,
+                project_ids=project_ids)
+        except SystemExit:
+            continue
+        except Exception as e:
+            print(f'Could not look up {key}, so no dependencies on it were discovered.')
+            print(e)
+            continue
+        datasource_keys[datasource_ids['datasource_id']] = key
+    if not datasource_keys:
+        return upstreams
+
+    for key, target in targets_by_key.items():
+        if target['resource_type'] != 'workbook':
+            continue
+        try:
+            workbook_ids = lookup.get_workbook_ids(
+                server,
+                target['project_name'],
+                target['resource_name'],
+                cache=cache,
+                project_ids=project_ids)
+            workbook = server.workbooks.get_by_id(workbook_ids['workbook_id'])
+            server.workbooks.populate_connections(workbook)
+        except SystemExit:
+            continue
+        except Exception as e:
+            # The workbook still refreshes, only without the dependencies that couldn't be discovered.
+            print(
+                f'Could not read the connections of {key}, so its dependencies were not discovered.')
+            print(e)
+            continue
+        for connection in workbook.connections:
+            upstream_key = datasource_keys.get(connection.datasource_id)
+            if upstream_key and upstream_key not in upstreams[key]:
+                print(f'Found that {key} depends on {upstream_key}.')
+                upstreams[key].add(upstream_key)
+    return upstreams
+
+
+def find_cycle(upstreams):
+    """
+    Returns the keys of targets that are part of or wait on a dependency cycle, or an empty list if there is none.
+    """
+    remaining_upstreams = {key: set(keys) for key, keys in upstreams.items()}
+    ready = [key for key, keys in remaining_upstreams.items() if not keys]
+    while ready:
+        key = ready.pop()
+        del remaining_upstreams[key]
+        for downstream_key, keys in remaining_upstreams.items():
+            if key in keys:
+                keys.discard(key)
+                if not keys:
+                    ready.append(downstream_key)
+    return list(remaining_upstreams)
+
+
+def get_downstreams(upstreams):
+    downstreams = {key: [] for key in upstreams}
+    for key, upstream_keys in upstreams.items():
+        for upstream_key in upstream_keys:
+            downstreams[upstream_key].append(key)
+    return downstreams
+
+
+class RefreshGraphRun():
+    """
+    Runs the refreshes of a dependency graph, starting each one as soon as all of its upstream
+    refreshes have succeeded, with at most max_concurrent_jobs refresh jobs running at once.
+
+    When a refresh fails, every refresh downstream of it is skipped. Running jobs are each
+    polled on their own JobPollSchedule, paced by the resource's previous refresh durations.
+    """
+
+    def __init__(
+            self,
+            server,
+            targets_by_key,
+            upstreams,
+            max_concurrent_jobs,
+            cache=None,
+            coalesce='none'):
+        self.server = server
+        self.targets_by_key = targets_by_key
+        self.downstreams = get_downstreams(upstreams)
+        self.remaining_upstreams = {
+            key: set(keys) for key, keys in upstreams.items()}
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.cache = cache
+        self.coalesce = coalesce
+        self.project_ids = {}
+        self.results = {
+            key: dict(target, job_id=None, exit_code=None, status='Not started')
+            for key, target in targets_by_key.items()}
+        self.ready = deque(
+            key for key, keys in self.remaining_upstreams.items() if not keys)
+        self.running = {}
+        self.schedules = {}
+        self.next_poll_times = {}
+
+    def start_ready_refreshes(self):
+        while self.ready and len(self.running) < self.max_concurrent_jobs:
+            key = self.ready.popleft()
+            target = self.targets_by_key[key]
+            result = refresh_resource.trigger_refresh(
+                self.server, target, self.cache, self.project_ids, self.coalesce)
+            if result['job_id'] is None:
+                self.finish(
+                    key, result['exit_code'], f'Not triggered ({result["exit_code"]})')
+                continue
+            job_id = result['job_id']
+            self.results[key].update(job_id=job_id, status='Running')
+            self.running[job_id] = key
+            self.schedules[job_id] = job_status.JobPollSchedule(
+                job_status.estimate_job_duration(self.server, target['resource_name']))
+            self.next_poll_times[job_id] = time.monotonic()
+
+    def finish(self, key, exit_code, status):
+        self.results[key].update(exit_code=exit_code, status=status)
+        if exit_code == errors.EXIT_CODE_FINAL_STATUS_SUCCESS:
+            for downstream_key in self.downstreams[key]:
+                self.remaining_upstreams[downstream_key].discard(key)
+                if not self.remaining_upstreams[downstream_key]:
+                    self.ready.append(downstream_key)
+        else:
+            self.skip_downstreams(key)
+
+    def skip_downstreams(self, failed_key):
+        pending_keys = list(self.downstreams[failed_key])
+        while pending_keys:
+            key = pending_keys.pop()
+            if self.results[key]['status'] != 'Not started':
+                continue
+            print(f'Skipping {key} because {failed_key} did not succeed.')
+            self.results[key]['status'] = 'Skipped (upstream failed)'
+            pending_keys.extend(self.downstreams[key])
+
+    def poll_running_jobs(self):
+        now = time.monotonic()
+        due_job_ids = [
+            job_id for job_id, poll_time in self.next_poll_times.items()
+            if poll_time <= now]
+        job_infos = job_status.get_job_infos(self.server, due_job_ids)
+        metrics.increment('job_polls', len(job_infos))
+        for job_id in due_job_ids:
+            job_info = job_infos.get(job_id)
+            if job_info is not None and job_info.completed_at is None:
+                self.next_poll_times[job_id] = time.monotonic(
+                ) + self.schedules[job_id].next_delay(job_info)
+                continue
+            key = self.running.pop(job_id)
+            del self.next_poll_times[job_id]
+            if job_info is None:
+                self.finish(key, errors.EXIT_CODE_INVALID_JOB, 'Not found')
+                continue
+            exit_code = job_status.report_job_status(job_id, job_info)
+            self.finish(
+                key,
+                exit_code,
+                job_status.EXIT_CODE_DESCRIPTIONS.get(exit_code, f'Unknown ({exit_code})'))
+
+    @metrics.timed('run_refresh_graph')
+    def run(self, timeout=None):
+        """
+        Returns the result of every target, in manifest order.
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        self.start_ready_refreshes()
+        while self.running:
+            sleep_until = min(self.next_poll_times.values())
+            if deadline is not None:
+                if time.monotonic() >= deadline:
+                    print(
+                        f'Stopped waiting after {timeout} seconds with {len(self.running)} refresh(es) still running.')
+                    break
+                sleep_until = min(sleep_until, deadline)
+            time.sleep(max(sleep_until - time.monotonic(), 0))
+            self.poll_running_jobs()
+            self.start_ready_refreshes()
+
+        for result in self.results.values():
+            if result['status'] in ('Running', 'Not started'):
+                result['exit_code'] = errors.EXIT_CODE_STATUS_INCOMPLETE
+        return list(self.results.values())
+
+
+def print_refresh_graph_report(results, upstreams):
+    print(
+        f'{"Type":<12}{"Project":<30}{"Resource":<40}{"Job ID":<38}{"Status":<30}Depends on')
+    for key, result in zip(upstreams, results):
+        print(
+            f'{result["resource_type"]:<12}{result["project_name"]:<30}{result["resource_name"]:<40}{result["job_id"] or "-":<38}{result["status"]:<30}{", ".join(sorted(upstreams[key])) or "-"}')
+
+
+def main():
+    args = get_args()
+    metrics.start(args)
+    username = args.username
+    password = args.password
+    site_id = args.site_id
+    server_url = args.server_url
+    sign_in_method = args.sign_in_method
+    targets_by_key, upstreams = read_refresh_graph(
+        args.resource_manifest_file_name)
+    cache = lookup_cache.create_lookup_cache(
+        args.lookup_cache_ttl,
+        args.lookup_cache_folder_name,
+        args.catalog_file_name)
+
+    base_folder_name = shipyard.logs.determine_base_artifact_folder(
+        'tableau')
+    artifact_subfolder_paths = shipyard.logs.determine_artifact_subfolders(
+        base_folder_name)
+    shipyard.logs.create_artifacts_folders(artifact_subfolder_paths)
+
+    server, connection = authorization.connect_to_tableau(
+        username, password, site_id, server_url, sign_in_method,
+        **authorization.get_connection_options(args))
+
+    with connection:
+        if shipyard.args.convert_to_boolean(args.discover_dependencies):
+            upstreams = discover_dependencies(
+                server, targets_by_key, upstreams, cache)
+        cycle_keys = find_cycle(upstreams)
+        if cycle_keys:
+            print(
+                f'The dependencies of these resources form a cycle: {", ".join(cycle_keys)}')
+            sys.exit(errors.EXIT_CODE_INVALID_MANIFEST)
+        results = RefreshGraphRun(
+            server,
+            targets_by_key,
+            upstreams,
+            args.max_concurrent_jobs,
+            cache,
+            args.coalesce_refreshes).run(args.timeout)
+
+    print_refresh_graph_report(results, upstreams)
+    summary_file_name = shipyard.files.combine_folder_and_file_name(
+        artifact_subfolder_paths['responses'], args.summary_file_name)
+    shipyard.files.write_json_to_file(results, summary_file_name)
+    sys.exit(job_status.determine_aggregate_exit_code(
+        [result['exit_code'] for result in results if result['exit_code'] is not None]))
+
+
+if __name__ == '__main__':
+    main()
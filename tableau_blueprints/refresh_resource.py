@@ -1,7 +1,5 @@
-import tableauserverclient as TSC
 import argparse
 import sys
-import shipyard_utils as shipyard
 
 # Handle import difference between local and github install
 try:
@@ -9,11 +7,37 @@ try:
     import errors
     import authorization
     import lookup
+    import lookup_cache
+    import manifest
+    import metrics
+    import lazy_imports
+    import worker_client
 except BaseException:
     from . import job_status
     from . import errors
     from . import authorization
     from . import lookup
+    from . import lookup_cache
+    from . import manifest
+    from . import metrics
+    from . import lazy_imports
+    from . import worker_client
+
+TSC = lazy_imports.lazy_import('tableauserverclient')
+shipyard = lazy_imports.lazy_import('shipyard_utils')
+asyncio = lazy_imports.lazy_import('asyncio')
+
+MANIFEST_REQUIRED_FIELDS = ('project_name', 'resource_type', 'resource_name')
+RESOURCE_TYPES = ('datasource', 'workbook')
+RESOURCE_NOT_FOUND_EXIT_CODES = {
+    'datasource': errors.EXIT_CODE_INVALID_DATASOURCE,
+    'workbook': errors.EXIT_CODE_INVALID_WORKBOOK,
+}
+# none triggers every refresh, on_conflict adopts the running job when Tableau refuses a refresh
+# because one is already underway, and always looks for a running job before triggering.
+COALESCE_MODES = ('none', 'on_conflict', 'always')
+# Background job statuses of queued and running jobs, spelled out so that TSC is not loaded at import time.
+ACTIVE_JOB_STATUSES = ('Pending', 'InProgress')
 
 
 def get_args():
@@ -38,26 +62,171 @@ def get_args():
         '--datasource-name',
         dest='datasource_name',
         required=False)
-    parser.add_argument('--project-name', dest='project_name', required=True)
+    parser.add_argument('--project-name', dest='project_name', required=False)
+    parser.add_argument(
+        '--resource-manifest-file-name',
+        dest='resource_manifest_file_name',
+        required=False)
     parser.add_argument('--check-status', dest='check_status', default='TRUE',
                         required=False)
+    parser.add_argument(
+        '--timeout',
+        dest='timeout',
+        type=float,
+        default=None,
+        required=False)
+    add_coalesce_argument(parser)
+    lookup_cache.add_lookup_cache_arguments(parser)
+    authorization.add_connection_arguments(parser)
+    metrics.add_metrics_arguments(parser)
+    lazy_imports.add_profile_startup_argument(parser)
+    worker_client.add_worker_arguments(parser)
     args = parser.parse_args()
+    if not (args.workbook_name or args.datasource_name or args.resource_manifest_file_name):
+        parser.error(
+            'Provide --datasource-name, --workbook-name or --resource-manifest-file-name.')
+    if (args.workbook_name or args.datasource_name) and not args.project_name:
+        parser.error(
+            '--project-name is required with --datasource-name or --workbook-name.')
     return args
 
 
-def refresh_datasource(server, datasource_id, datasource_name):
+def add_coalesce_argument(parser):
+    parser.add_argument(
+        '--coalesce-refreshes',
+        dest='coalesce_refreshes',
+        choices=COALESCE_MODES,
+        type=str.lower,
+        default='none',
+        required=False)
+
+
+def find_active_refresh_job(server, resource_type, resource_id, resource_name):
+    """
+    Finds a queued or running refresh of the resource in the site's job list, or returns None.
+
+    The job list only names the resource in each job's title, so every candidate is fetched
+    to confirm that it refreshes this resource and not another one with the same name.
+    """
+    try:
+        background_jobs, _ = server.jobs.get(
+            req_options=build_active_job_request_options(resource_name))
+    except Exception as e:
+        print('Could not read the site job list to look for a refresh that is already underway.')
+        print(e)
+        return None
+
+    for background_job in background_jobs:
+        if not is_active_refresh_job(background_job):
+            continue
+        try:
+            job = server.jobs.get_by_id(background_job.id)
+        except Exception:
+            continue
+        if get_job_resource_id(job, resource_type) == resource_id:
+            return job
+    return None
+
+
+async def find_active_refresh_job_async(server, resource_type, resource_id, resource_name):
+    try:
+        background_jobs, _ = await server.get_items(
+            'jobs',
+            TSC.BackgroundJobItem,
+            build_active_job_request_options(resource_name))
+    except Exception as e:
+        print('Could not read the site job list to look for a refresh that is already underway.')
+        print(e)
+        return None
+
+    for background_job in background_jobs:
+        if not is_active_refresh_job(background_job):
+            continue
+        try:
+            job = await server.get_job(background_job.id)
+        except Exception:
+            continue
+        if get_job_resource_id(job, resource_type) == resource_id:
+            return job
+    return None
+
+
+def build_active_job_request_options(resource_name):
+    req_option = TSC.RequestOptions()
+    # Without the title filter every active job is a candidate, and each is still confirmed by its resource ID.
+    if lookup.can_filter_on(resource_name):
+        req_option.filter.add(TSC.Filter(TSC.RequestOptions.Field.Title,
+                                         TSC.RequestOptions.Operator.Equals,
+                                         resource_name))
+    req_option.filter.add(TSC.Filter(TSC.RequestOptions.Field.Status,
+                                     TSC.RequestOptions.Operator.In,
+                                     list(ACTIVE_JOB_STATUSES)))
+    req_option.sort.add(TSC.Sort(TSC.RequestOptions.Field.CreatedAt,
+                                 TSC.RequestOptions.Direction.Desc))
+    return req_option
+
+
+def is_active_refresh_job(background_job):
+    return background_job.status in ACTIVE_JOB_STATUSES and 'extract' in str(
+        background_job.type).lower()
+
+
+def get_job_resource_id(job, resource_type):
+    return job.datasource_id if resource_type == 'datasource' else job.workbook_id
+
+
+def adopt_active_refresh_job(server, resource_type, resource_id, resource_name):
+    """
+    Returns the refresh job already underway for the resource, so it can be waited on instead of starting another.
+    """
+    job = find_active_refresh_job(
+        server, resource_type, resource_id, resource_name)
+    if job:
+        print(
+            f'A refresh of {resource_type} {resource_name} is already underway. Using its job {job.id} instead of starting another.')
+        metrics.increment('coalesced_refreshes')
+    return job
+
+
+async def adopt_active_refresh_job_async(server, resource_type, resource_id, resource_name):
+    job = await find_active_refresh_job_async(
+        server, resource_type, resource_id, resource_name)
+    if job:
+        print(
+            f'A refresh of {resource_type} {resource_name} is already underway. Using its job {job.id} instead of starting another.')
+        metrics.increment('coalesced_refreshes')
+    return job
+
+
+def refresh_datasource(server, datasource_id, datasource_name, coalesce='none'):
     """
     Refreshes the data of the specified datasource_id.
+
+    Depending on coalesce, a refresh that is already underway is adopted instead, see COALESCE_MODES.
     """
+    if coalesce == 'always':
+        active_job = adopt_active_refresh_job(
+            server, 'datasource', datasource_id, datasource_name)
+        if active_job:
+            return active_job
 
     try:
         datasource = server.datasources.get_by_id(datasource_id)
         refreshed_datasource = server.datasources.refresh(datasource)
         print(f'Datasource {datasource_name} was successfully triggered.')
     except Exception as e:
+        if lookup.is_not_found_error(e):
+            print(f'Datasource {datasource_name} could not be found.')
+            print(e)
+            sys.exit(errors.EXIT_CODE_INVALID_DATASOURCE)
         if 'Resource Conflict' in e.args[0]:
             print(
                 f'A refresh or extract operation for the datasource is already underway.')
+            if coalesce != 'none':
+                active_job = adopt_active_refresh_job(
+                    server, 'datasource', datasource_id, datasource_name)
+                if active_job:
+                    return active_job
         if 'is not allowed.' in e.args[0]:
             print(f'Refresh or extract operation for the datasource is not allowed.')
         else:
@@ -68,19 +237,35 @@ def refresh_datasource(server, datasource_id, datasource_name):
     return refreshed_datasource
 
 
-def refresh_workbook(server, workbook_id, workbook_name):
+def refresh_workbook(server, workbook_id, workbook_name, coalesce='none'):
     """
     Refreshes the data of the specified datasource_id.
+
+    Depending on coalesce, a refresh that is already underway is adopted instead, see COALESCE_MODES.
     """
+    if coalesce == 'always':
+        active_job = adopt_active_refresh_job(
+            server, 'workbook', workbook_id, workbook_name)
+        if active_job:
+            return active_job
 
     try:
         workbook = server.workbooks.get_by_id(workbook_id)
         refreshed_workbook = server.workbooks.refresh(workbook)
         print(f'Workbook {workbook_name} was successfully triggered.')
     except Exception as e:
+        if lookup.is_not_found_error(e):
+            print(f'Workbook {workbook_name} could not be found.')
+            print(e)
+            sys.exit(errors.EXIT_CODE_INVALID_WORKBOOK)
         if 'Resource Conflict' in e.args[0]:
             print(
                 f'A refresh or extract operation for the workbook is already underway.')
+            if coalesce != 'none':
+                active_job = adopt_active_refresh_job(
+                    server, 'workbook', workbook_id, workbook_name)
+                if active_job:
+                    return active_job
         if 'is not allowed.' in e.args[0]:
             print(f'Refresh or extract operation for the workbook is not allowed.')
         else:
@@ -91,8 +276,324 @@ def refresh_workbook(server, workbook_id, workbook_name):
     return refreshed_workbook
 
 
+async def refresh_resource_async(
+        server,
+        resource_type,
+        resource_id,
+        resource_name,
+        coalesce='none'):
+    """
+    Async counterpart of refresh_datasource and refresh_workbook.
+    """
+    if coalesce == 'always':
+        active_job = await adopt_active_refresh_job_async(
+            server, resource_type, resource_id, resource_name)
+        if active_job:
+            return active_job
+
+    try:
+        job = await server.refresh(f'{resource_type}s', resource_id)
+        print(f'{resource_type.capitalize()} {resource_name} was successfully triggered.')
+    except Exception as e:
+        if lookup.is_not_found_error(e):
+            print(f'{resource_type.capitalize()} {resource_name} could not be found.')
+            print(e)
+            sys.exit(RESOURCE_NOT_FOUND_EXIT_CODES[resource_type])
+        if 'Resource Conflict' in str(e):
+            print(
+                f'A refresh or extract operation for the {resource_type} is already underway.')
+            if coalesce != 'none':
+                active_job = await adopt_active_refresh_job_async(
+                    server, resource_type, resource_id, resource_name)
+                if active_job:
+                    return active_job
+        if 'is not allowed.' in str(e):
+            print(f'Refresh or extract operation for the {resource_type} is not allowed.')
+        else:
+            print(f'An unknown refresh or extract error occurred.')
+        print(e)
+        sys.exit(errors.EXIT_CODE_REFRESH_ERROR)
+
+    return job
+
+
+async def refresh_resource_by_name_async(
+        server,
+        resource_type,
+        project_name,
+        resource_name,
+        cache=None,
+        project_ids=None,
+        coalesce='none'):
+    """
+    Async counterpart of refresh_datasource_by_name and refresh_workbook_by_name.
+    """
+    get_ids = lookup.get_datasource_ids_async if resource_type == 'datasource' \
+        else lookup.get_workbook_ids_async
+    resource_ids = await get_ids(
+        server, project_name, resource_name, cache=cache, project_ids=project_ids)
+    try:
+        return await refresh_resource_async(
+            server,
+            resource_type,
+            resource_ids[f'{resource_type}_id'],
+            resource_name,
+            coalesce)
+    except SystemExit as e:
+        if cache is None or e.code != RESOURCE_NOT_FOUND_EXIT_CODES[resource_type]:
+            raise
+    print(f'The cached ID for {resource_name} no longer exists. Looking it up again.')
+    resource_ids = await get_ids(
+        server, project_name, resource_name, cache=cache, refresh=True)
+    return await refresh_resource_async(
+        server,
+        resource_type,
+        resource_ids[f'{resource_type}_id'],
+        resource_name,
+        coalesce)
+
+
+def refresh_datasource_by_name(
+        server,
+        project_name,
+        datasource_name,
+        cache=None,
+        project_ids=None,
+        coalesce='none'):
+    """
+    Looks up the datasource by name and refreshes it.
+
+    If a cached datasource_id no longer exists on the server, the lookup is repeated once without the cache.
+    """
+    datasource_ids = lookup.get_datasource_ids(
+        server, project_name, datasource_name, cache=cache, project_ids=project_ids)
+    try:
+        return refresh_datasource(
+            server, datasource_ids['datasource_id'], datasource_name, coalesce)
+    except SystemExit as e:
+        if cache is None or e.code != errors.EXIT_CODE_INVALID_DATASOURCE:
+            raise
+    print(f'The cached ID for {datasource_name} no longer exists. Looking it up again.')
+    datasource_ids = lookup.get_datasource_ids(
+        server, project_name, datasource_name, cache=cache, refresh=True)
+    return refresh_datasource(
+        server, datasource_ids['datasource_id'], datasource_name, coalesce)
+
+
+def refresh_workbook_by_name(
+        server,
+        project_name,
+        workbook_name,
+        cache=None,
+        project_ids=None,
+        coalesce='none'):
+    """
+    Looks up the workbook by name and refreshes it.
+
+    If a cached workbook_id no longer exists on the server, the lookup is repeated once without the cache.
+    """
+    workbook_ids = lookup.get_workbook_ids(
+        server, project_name, workbook_name, cache=cache, project_ids=project_ids)
+    try:
+        return refresh_workbook(
+            server, workbook_ids['workbook_id'], workbook_name, coalesce)
+    except SystemExit as e:
+        if cache is None or e.code != errors.EXIT_CODE_INVALID_WORKBOOK:
+            raise
+    print(f'The cached ID for {workbook_name} no longer exists. Looking it up again.')
+    workbook_ids = lookup.get_workbook_ids(
+        server, project_name, workbook_name, cache=cache, refresh=True)
+    return refresh_workbook(
+        server, workbook_ids['workbook_id'], workbook_name, coalesce)
+
+
+def determine_refresh_targets(
+        project_name,
+        datasource_name,
+        workbook_name,
+        resource_manifest_file_name):
+    """
+    Combines the datasource and workbook named on the command line with any resource manifest
+    into one list of refresh targets, dropping duplicates.
+
+    Names are used exactly as given, since Tableau names can contain commas. Refreshing
+    more than one datasource or workbook in a run goes through the resource manifest.
+    """
+    targets = []
+    if datasource_name:
+        targets.append({
+            'project_name': project_name,
+            'resource_type': 'datasource',
+            'resource_name': datasource_name})
+    if workbook_name:
+        targets.append({
+            'project_name': project_name,
+            'resource_type': 'workbook',
+            'resource_name': workbook_name})
+    if resource_manifest_file_name:
+        for row_number, entry in enumerate(manifest.read_manifest(
+                resource_manifest_file_name, MANIFEST_REQUIRED_FIELDS), start=1):
+            entry['resource_type'] = entry['resource_type'].lower()
+            if entry['resource_type'] not in RESOURCE_TYPES:
+                print(
+                    f'Manifest entry {row_number} has an invalid resource_type {entry["resource_type"]}. Valid options are {", ".join(RESOURCE_TYPES)}')
+                sys.exit(errors.EXIT_CODE_INVALID_MANIFEST)
+            targets.append(entry)
+
+    unique_targets = {}
+    for target in targets:
+        key = (
+            target['project_name'],
+            target['resource_type'],
+            target['resource_name'])
+        unique_targets.setdefault(key, target)
+    return list(unique_targets.values())
+
+
+def trigger_refresh(server, target, cache=None, project_ids=None, coalesce='none'):
+    """
+    Triggers a refresh for one target and returns its result record.
+
+    A target that fails to trigger is recorded with its exit code instead of exiting.
+    """
+    result = dict(target, job_id=None, exit_code=None)
+    try:
+        if target['resource_type'] == 'datasource':
+            job = refresh_datasource_by_name(
+                server,
+                target['project_name'],
+                target['resource_name'],
+                cache,
+                project_ids,
+                coalesce)
+        else:
+            job = refresh_workbook_by_name(
+                server,
+                target['project_name'],
+                target['resource_name'],
+                cache,
+                project_ids,
+                coalesce)
+        result['job_id'] = job.id
+    except SystemExit as e:
+        result['exit_code'] = e.code
+    return result
+
+
+async def trigger_refresh_async(server, target, cache=None, project_ids=None, coalesce='none'):
+    """
+    Async counterpart of trigger_refresh.
+    """
+    result = dict(target, job_id=None, exit_code=None)
+    try:
+        job = await refresh_resource_by_name_async(
+            server,
+            target['resource_type'],
+            target['project_name'],
+            target['resource_name'],
+            cache,
+            project_ids,
+            coalesce)
+        result['job_id'] = job.id
+    except SystemExit as e:
+        # Caught here, as a SystemExit escaping an asyncio task stops the event loop.
+        result['exit_code'] = e.code
+    return result
+
+
+@metrics.timed('trigger_refreshes')
+def trigger_refreshes(server, targets, cache=None, coalesce='none'):
+    """
+    Triggers a refresh for every target, looking up each project only once.
+
+    A target that fails to trigger is recorded with its exit code instead of stopping the remaining refreshes.
+    """
+    project_ids = {}
+    return [
+        trigger_refresh(server, target, cache, project_ids, coalesce)
+        for target in targets]
+
+
+async def trigger_refreshes_async(server, targets, cache=None, coalesce='none'):
+    """
+    Async counterpart of trigger_refreshes, which triggers every refresh at the same time.
+    """
+    with metrics.phase('trigger_refreshes'):
+        project_ids = {}
+        return list(await asyncio.gather(*(
+            trigger_refresh_async(server, target, cache, project_ids, coalesce)
+            for target in targets)))
+
+
+def wait_for_refreshes(server, results, timeout=None):
+    """
+    Waits on every triggered job together and records each job's final exit code.
+
+    Each job's polling is paced by the durations of previous refreshes of the same resource.
+    """
+    triggered_results = [result for result in results if result['job_id']]
+    if not triggered_results:
+        return results
+    expected_durations = {
+        result['job_id']: job_status.estimate_job_duration(
+            server, result['resource_name'])
+        for result in triggered_results}
+    print(f'Waiting for {len(triggered_results)} job(s) to complete...')
+    job_infos = job_status.wait_for_jobs(
+        server,
+        list(expected_durations),
+        timeout=timeout,
+        expected_durations=expected_durations)
+    exit_codes = job_status.report_job_statuses(
+        list(expected_durations), job_infos)
+    for result in triggered_results:
+        result['exit_code'] = exit_codes[result['job_id']]
+    return results
+
+
+async def wait_for_refreshes_async(server, results, timeout=None):
+    """
+    Async counterpart of wait_for_refreshes.
+    """
+    triggered_results = [result for result in results if result['job_id']]
+    if not triggered_results:
+        return results
+    job_ids = [result['job_id'] for result in triggered_results]
+    durations = await asyncio.gather(*(
+        job_status.estimate_job_duration_async(server, result['resource_name'])
+        for result in triggered_results))
+    expected_durations = dict(zip(job_ids, durations))
+    print(f'Waiting for {len(triggered_results)} job(s) to complete...')
+    job_infos = await job_status.wait_for_jobs_async(
+        server,
+        list(expected_durations),
+        timeout=timeout,
+        expected_durations=expected_durations)
+    exit_codes = job_status.report_job_statuses(
+        list(expected_durations), job_infos)
+    for result in triggered_results:
+        result['exit_code'] = exit_codes[result['job_id']]
+    return results
+
+
+def print_refresh_report(results):
+    print(
+        f'{"Type":<12}{"Project":<30}{"Resource":<40}{"Job ID":<38}Status')
+    for result in results:
+        if result['job_id'] is None:
+            status = f'Not triggered ({result["exit_code"]})'
+        else:
+            status = job_status.EXIT_CODE_DESCRIPTIONS.get(
+                result['exit_code'], f'Unknown ({result["exit_code"]})')
+        print(
+            f'{result["resource_type"]:<12}{result["project_name"]:<30}{result["resource_name"]:<40}{result["job_id"] or "-":<38}{status}')
+
+
 def main():
     args = get_args()
+    worker_client.forward_to_worker(
+        args.worker_socket_file_name, 'refresh_resource')
+    metrics.start(args)
     username = args.username
     password = args.password
     site_id = args.site_id
@@ -102,6 +603,15 @@ def main():
     project_name = args.project_name
     sign_in_method = args.sign_in_method
     should_check_status = shipyard.args.convert_to_boolean(args.check_status)
+    cache = lookup_cache.create_lookup_cache(
+        args.lookup_cache_ttl,
+        args.lookup_cache_folder_name,
+        args.catalog_file_name)
+    targets = determine_refresh_targets(
+        project_name,
+        datasource_name,
+        workbook_name,
+        args.resource_manifest_file_name)
 
     base_folder_name = shipyard.logs.determine_base_artifact_folder(
         'tableau')
@@ -110,39 +620,32 @@ def main():
     shipyard.logs.create_artifacts_folders(artifact_subfolder_paths)
 
     server, connection = authorization.connect_to_tableau(
-        username, password, site_id, server_url, sign_in_method)
+        username, password, site_id, server_url, sign_in_method,
+        **authorization.get_connection_options(args))
 
     with connection:
-        project_id = lookup.get_project_id(server, project_name)
-
-        # Allowing user to provide one or the other. These will form two separate Blueprints
-        # that use the same underlying script.
-        if datasource_name:
-            datasource_id = lookup.get_datasource_id(
-                server, project_id, datasource_name)
-            refreshed_datasource = refresh_datasource(
-                server, datasource_id, datasource_name)
-            job_id = refreshed_datasource.id
-        if workbook_name:
-            workbook_id = lookup.get_workbook_id(
-                server, project_id, workbook_name)
-            refreshed_workbook = refresh_workbook(
-                server, workbook_id, workbook_name)
-            job_id = refreshed_workbook.id
+        results = trigger_refreshes(
+            server, targets, cache, args.coalesce_refreshes)
+        job_ids = [result['job_id'] for result in results if result['job_id']]
 
         if should_check_status:
-            try:
-                # `wait_for_job` will automatically check every few seconds
-                # and throw if the job isn't executed successfully
-                print('Waiting for the job to complete...')
-                server.jobs.wait_for_job(job_id)
-                exit_code = job_status.determine_job_status(server, job_id)
-            except BaseException:
-                exit_code = job_status.determine_job_status(server, job_id)
-            sys.exit(exit_code)
+            results = wait_for_refreshes(server, results, args.timeout)
+            if len(results) > 1:
+                print_refresh_report(results)
+            sys.exit(job_status.determine_aggregate_exit_code(
+                [result['exit_code'] for result in results]))
         else:
-            shipyard.logs.create_pickle_file(
-                artifact_subfolder_paths, 'job_id', job_id)
+            if job_ids:
+                shipyard.logs.create_pickle_file(
+                    artifact_subfolder_paths, 'job_id', job_ids[-1])
+                shipyard.logs.create_pickle_file(
+                    artifact_subfolder_paths, 'job_ids', job_ids)
+            trigger_exit_codes = [
+                result['exit_code'] for result in results if result['job_id'] is None]
+            if trigger_exit_codes:
+                print_refresh_report(results)
+                sys.exit(job_status.determine_aggregate_exit_code(
+                    trigger_exit_codes))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,339 @@
+import argparse
+import sys
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import ExitStack
+
+try:
+    import authorization
+    import errors
+    import job_status
+    import lazy_imports
+    import lookup_cache
+    import manifest
+    import metrics
+    import refresh_resource
+except BaseException:
+    from . import authorization
+    from . import errors
+    from . import job_status
+    from . import lazy_imports
+    from . import lookup_cache
+    from . import manifest
+    from . import metrics
+    from . import refresh_resource
+
+shipyard = lazy_imports.lazy_import('shipyard_utils')
+
+MANIFEST_REQUIRED_FIELDS = (
+    'site_id',
+    'project_name',
+    'resource_type',
+    'resource_name')
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--username', dest='username', required=True)
+    parser.add_argument('--password', dest='password', required=True)
+    parser.add_argument('--server-url', dest='server_url', required=True)
+    parser.add_argument(
+        '--sign-in-method',
+        dest='sign_in_method',
+        default='username_password',
+        choices={
+            'username_password',
+            'access_token'},
+        required=False)
+    parser.add_argument(
+        '--targets-manifest-file-name',
+        dest='targets_manifest_file_name',
+        required=True)
+    parser.add_argument(
+        '--max-workers',
+        dest='max_workers',
+        type=int,
+        default=8,
+        required=False)
+    parser.add_argument(
+        '--max-workers-per-site',
+        dest='max_workers_per_site',
+        type=int,
+        default=2,
+        required=False)
+    parser.add_argument('--check-status', dest='check_status', default='TRUE',
+                        required=False)
+    parser.add_argument(
+        '--timeout',
+        dest='timeout',
+        type=float,
+        default=None,
+        required=False)
+    parser.add_argument(
+        '--summary-file-name',
+        dest='summary_file_name',
+        default='refresh_summary.json',
+        required=False)
+    refresh_resource.add_coalesce_argument(parser)
+    lookup_cache.add_lookup_cache_arguments(parser)
+    authorization.add_connection_arguments(parser)
+    metrics.add_metrics_arguments(parser)
+    lazy_imports.add_profile_startup_argument(parser)
+    args = parser.parse_args()
+    if args.max_workers < 1:
+        parser.error('--max-workers must be at least 1.')
+    if args.max_workers_per_site < 1:
+        parser.error('--max-workers-per-site must be at least 1.')
+    return args
+
+
+def read_targets_manifest(targets_manifest_file_name):
+    """
+    Reads the manifest of sites and resources to refresh, dropping duplicates.
+    """
+    targets = {}
+    for row_number, entry in enumerate(manifest.read_manifest(
+            targets_manifest_file_name, MANIFEST_REQUIRED_FIELDS), start=1):
+        entry['resource_type'] = entry['resource_type'].lower()
+        if entry['resource_type'] not in refresh_resource.RESOURCE_TYPES:
+            print(
+                f'Manifest entry {row_number} has an invalid resource_type {entry["resource_type"]}. Valid options are {", ".join(refresh_resource.RESOURCE_TYPES)}')
+            sys.exit(errors.EXIT_CODE_INVALID_MANIFEST)
+        key = (
+            entry['site_id'],
+            entry['project_name'],
+            entry['resource_type'],
+            entry['resource_name'])
+        targets.setdefault(key, entry)
+    return list(targets.values())
+
+
+def group_targets_by_site(targets):
+    targets_by_site = {}
+    for target in targets:
+        targets_by_site.setdefault(target['site_id'], []).append(target)
+    return targets_by_site
+
+
+def sign_in_to_site(
+        username,
+        password,
+        site_id,
+        server_url,
+        sign_in_method,
+        connection_options):
+    """
+    Signs in to one site, returning the server and connection, or the exit code if signing in failed.
+    """
+    try:
+        server, connection = authorization.connect_to_tableau(
+            username, password, site_id, server_url, sign_in_method,
+            **connection_options)
+    except SystemExit as e:
+        print(f'Could not sign in to site {site_id}.')
+        return e.code
+    return server, connection
+
+
+def sign_in_to_sites(
+        username,
+        password,
+        site_ids,
+        server_url,
+        sign_in_method,
+        connection_options,
+        max_workers):
+    """
+    Signs in to every site once, concurrently. Returns the sign-in result by site_id.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        sign_ins = list(executor.map(
+            lambda site_id: sign_in_to_site(
+                username,
+                password,
+                site_id,
+                server_url,
+                sign_in_method,
+                connection_options),
+            site_ids))
+    return dict(zip(site_ids, sign_ins))
+
+
+@metrics.timed('trigger_refreshes')
+def trigger_site_refreshes(
+        servers,
+        targets_by_site,
+        max_workers,
+        max_workers_per_site,
+        cache=None,
+        coalesce='none'):
+    """
+    Triggers every target's refresh, with at most max_workers refreshes being triggered at once
+    and at most max_workers_per_site of them on the same site.
+
+    Sites take turns for free workers, so a site with many targets doesn't hold up the others.
+    Returns the result records by site_id, in manifest order.
+    """
+    queues = {
+        site_id: deque(enumerate(targets))
+        for site_id, targets in targets_by_site.items()}
+    project_ids = {site_id: {} for site_id in targets_by_site}
+    running_by_site = {site_id: 0 for site_id in targets_by_site}
+    results = {
+        site_id: [None] * len(targets)
+        for site_id, targets in targets_by_site.items()}
+    futures = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while queues or futures:
+            submitted = True
+            while submitted and len(futures) < max_workers:
+                submitted = False
+                for site_id in list(queues):
+                    if len(futures) >= max_workers:
+                        break
+                    if running_by_site[site_id] >= max_workers_per_site:
+                        continue
+                    index, target = queues[site_id].popleft()
+                    if not queues[site_id]:
+                        del queues[site_id]
+                    future = executor.submit(
+                        refresh_resource.trigger_refresh,
+                        servers[site_id],
+                        target,
+                        cache,
+                        project_ids[site_id],
+                        coalesce)
+                    futures[future] = (site_id, index)
+                    running_by_site[site_id] += 1
+                    submitted = True
+
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                site_id, index = futures.pop(future)
+                running_by_site[site_id] -= 1
+                results[site_id][index] = future.result()
+    return results
+
+
+def wait_for_site_refreshes(servers, results_by_site, timeout=None):
+    """
+    Polls the jobs of every site at the same time, each site on its own session,
+    so the total wait is as long as the slowest site.
+    """
+    site_ids = [
+        site_id for site_id, results in results_by_site.items()
+        if any(result['job_id'] for result in results)]
+    if not site_ids:
+        return results_by_site
+    with ThreadPoolExecutor(max_workers=len(site_ids)) as executor:
+        list(executor.map(
+            lambda site_id: refresh_resource.wait_for_refreshes(
+                servers[site_id], results_by_site[site_id], timeout),
+            site_ids))
+    return results_by_site
+
+
+def create_sign_in_failure_results(targets, exit_code):
+    return [dict(target, job_id=None, exit_code=exit_code) for target in targets]
+
+
+def print_site_refresh_report(results):
+    print(
+        f'{"Site":<25}{"Type":<12}{"Project":<30}{"Resource":<40}{"Job ID":<38}Status')
+    for result in results:
+        if result['job_id'] is None:
+            status = f'Not triggered ({result["exit_code"]})'
+        elif result['exit_code'] is None:
+            status = 'Triggered'
+        else:
+            status = job_status.EXIT_CODE_DESCRIPTIONS.get(
+                result['exit_code'], f'Unknown ({result["exit_code"]})')
+        print(
+            f'{result["site_id"]:<25}{result["resource_type"]:<12}{result["project_name"]:<30}{result["resource_name"]:<40}{result["job_id"] or "-":<38}{status}')
+
+
+def print_site_summary(results_by_site, checked_status):
+    for site_id, results in results_by_site.items():
+        if checked_status:
+            succeeded = sum(
+                result['exit_code'] == errors.EXIT_CODE_FINAL_STATUS_SUCCESS for result in results)
+            print(f'Site {site_id}: {succeeded} of {len(results)} refresh(es) succeeded.')
+        else:
+            triggered = sum(bool(result['job_id']) for result in results)
+            print(f'Site {site_id}: {triggered} of {len(results)} refresh(es) triggered.')
+
+
+def main():
+    args = get_args()
+    metrics.start(args)
+    username = args.username
+    password = args.password
+    server_url = args.server_url
+    sign_in_method = args.sign_in_method
+    should_check_status = shipyard.args.convert_to_boolean(args.check_status)
+    targets = read_targets_manifest(args.targets_manifest_file_name)
+    targets_by_site = group_targets_by_site(targets)
+    cache = lookup_cache.create_lookup_cache(
+        args.lookup_cache_ttl,
+        args.lookup_cache_folder_name,
+        args.catalog_file_name)
+
+    base_folder_name = shipyard.logs.determine_base_artifact_folder(
+        'tableau')
+    artifact_subfolder_paths = shipyard.logs.determine_artifact_subfolders(
+        base_folder_name)
+    shipyard.logs.create_artifacts_folders(artifact_subfolder_paths)
+
+    sign_ins = sign_in_to_sites(
+        username,
+        password,
+        list(targets_by_site),
+        server_url,
+        sign_in_method,
+        authorization.get_connection_options(args),
+        args.max_workers)
+    servers = {}
+    results_by_site = {}
+    with ExitStack() as connections:
+        for site_id, sign_in in sign_ins.items():
+            if isinstance(sign_in, tuple):
+                servers[site_id] = sign_in[0]
+                connections.enter_context(sign_in[1])
+            else:
+                results_by_site[site_id] = create_sign_in_failure_results(
+                    targets_by_site[site_id], sign_in)
+
+        results_by_site.update(trigger_site_refreshes(
+            servers,
+            {site_id: targets_by_site[site_id] for site_id in servers},
+            args.max_workers,
+            args.max_workers_per_site,
+            cache,
+            args.coalesce_refreshes))
+        if should_check_status:
+            wait_for_site_refreshes(
+                servers,
+                {site_id: results_by_site[site_id] for site_id in servers},
+                args.timeout)
+
+    results_by_site = {
+        site_id: results_by_site[site_id] for site_id in targets_by_site}
+    results = [
+        result for site_results in results_by_site.values() for result in site_results]
+    print_site_refresh_report(results)
+    print_site_summary(results_by_site, should_check_status)
+    summary_file_name = shipyard.files.combine_folder_and_file_name(
+        artifact_subfolder_paths['responses'], args.summary_file_name)
+    shipyard.files.write_json_to_file(results, summary_file_name)
+
+    if should_check_status:
+        exit_codes = [result['exit_code'] for result in results]
+    else:
+        exit_codes = [
+            result['exit_code'] for result in results if result['job_id'] is None]
+    sys.exit(job_status.determine_aggregate_exit_code(exit_codes))
+
+
+if __name__ == '__main__':
+    main()
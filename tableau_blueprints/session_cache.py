@@ -0,0 +1,90 @@
+import fcntl
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+
+
+def get_cache_key(server_url, site_id, username, password, sign_in_method):
+    """
+    Sessions are keyed by everything used to sign in, so a cached session is only
+    reused by callers that could have created it themselves.
+    """
+    key = json.dumps([server_url, site_id, sign_in_method, username, password])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+@contextmanager
+def locked_session_cache(session_cache_file_name, exclusive):
+    """
+    Opens the session cache file under an flock and yields its contents as a dictionary.
+    With an exclusive lock, changes made to the dictionary are written back before the lock is released.
+    """
+    folder_name = os.path.dirname(os.path.abspath(session_cache_file_name))
+    os.makedirs(folder_name, exist_ok=True)
+    file_descriptor = os.open(
+        session_cache_file_name,
+        os.O_RDWR | os.O_CREAT,
+        0o600)
+    with os.fdopen(file_descriptor, 'r+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            try:
+                sessions = json.load(f)
+            except ValueError:
+                sessions = {}
+            original_sessions = dict(sessions)
+            yield sessions
+            if exclusive and sessions != original_sessions:
+                f.seek(0)
+                f.truncate()
+                json.dump(sessions, f)
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def capture_session(server):
+    return {
+        'auth_token': server.auth_token,
+        'site_id': server.site_id,
+        'user_id': server.user_id,
+        'version': server.version,
+        'created_at': time.time(),
+    }
+
+
+def restore_session(server, cached_session):
+    """
+    Applies a cached session to a TSC.Server that has not signed in, skipping both sign-in and server version detection.
+    """
+    server.version = cached_session['version']
+    server._set_auth(
+        cached_session['site_id'],
+        cached_session['user_id'],
+        cached_session['auth_token'])
+    return server
+
+
+def is_session_valid(server):
+    """
+    Checks a restored session with a single request. Only a 401 marks the session
+    as expired; any other response means the token was accepted.
+    """
+    try:
+        server_response = server.session.get(
+            f'{server.baseurl}/sessions/current',
+            headers={'x-tableau-auth': server.auth_token},
+            **server.http_options)
+    except Exception:
+        return False
+    return server_response.status_code != 401
+
+
+def keep_session_open(server):
+    """
+    Returns a connection context manager that leaves the session signed in, so it can be reused by later runs.
+    """
+    return server.auth.contextmgr(lambda: None)
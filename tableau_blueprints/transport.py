@@ -0,0 +1,238 @@
+import functools
+import random
+import time
+from types import SimpleNamespace
+
+try:
+    import lazy_imports
+    import metrics
+    import rate_limit
+except BaseException:
+    from . import lazy_imports
+    from . import metrics
+    from . import rate_limit
+
+TSC = lazy_imports.lazy_import('tableauserverclient')
+ElementTree = lazy_imports.lazy_import('defusedxml.ElementTree')
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_FACTOR = 0.5
+# urllib3's cap on a single backoff step.
+DEFAULT_BACKOFF_MAX = 120
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 600
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+SUCCESS_STATUS_CODES = (200, 201, 202, 204)
+
+
+@functools.lru_cache(maxsize=None)
+def get_retry_class():
+    """
+    Builds the Retry subclass on first use, so that importing this module doesn't import urllib3.
+    """
+    from urllib3.util.retry import Retry
+
+    class JitteredRetry(Retry):
+        """
+        Exponential backoff that sleeps a random time between half and all of each backoff step,
+        so concurrent runs that were throttled together don't retry in lockstep.
+        A Retry-After header from Tableau takes precedence over the backoff.
+
+        urllib3 sends retries itself, below the adapter, so with a rate_limiter each retry
+        also waits for a token of its own after the backoff.
+        """
+
+        def __init__(self, *args, rate_limiter=None, rate_limit_url=None, **kwargs):
+            self.rate_limiter = rate_limiter
+            self.rate_limit_url = rate_limit_url
+            super().__init__(*args, **kwargs)
+
+        def new(self, **kwargs):
+            kwargs.setdefault('rate_limiter', self.rate_limiter)
+            kwargs.setdefault('rate_limit_url', self.rate_limit_url)
+            return super().new(**kwargs)
+
+        def get_backoff_time(self):
+            backoff_time = super().get_backoff_time()
+            return random.uniform(backoff_time / 2, backoff_time)
+
+        def increment(self, method=None, url=None, *args, _pool=None, **kwargs):
+            retry = super().increment(method, url, *args, _pool=_pool, **kwargs)
+            if _pool is not None and url:
+                # urllib3 passes only the path, so the URL is rebuilt from the pool to find the server's budget.
+                host = f'[{_pool.host}]' if ':' in _pool.host else _pool.host
+                retry.rate_limit_url = f'{_pool.scheme}://{host}:{_pool.port}{url}'
+            return retry
+
+        def sleep(self, response=None):
+            super().sleep(response)
+            if self.rate_limiter and self.rate_limit_url:
+                delay = self.rate_limiter.reserve(self.rate_limit_url)
+                rate_limit.record_wait(delay)
+                time.sleep(delay)
+
+    return JitteredRetry
+
+
+@functools.lru_cache(maxsize=None)
+def get_adapter_class():
+    """
+    Builds the HTTPAdapter subclass on first use, so that importing this module doesn't import requests.
+    """
+    from requests.adapters import HTTPAdapter
+
+    class RateLimitedAdapter(HTTPAdapter):
+        """
+        Waits for the shared rate limiter before sending each request, when one is configured.
+        Retries of the request wait in JitteredRetry.sleep.
+        """
+
+        def __init__(self, rate_limiter=None, **kwargs):
+            self.rate_limiter = rate_limiter
+            super().__init__(**kwargs)
+
+        def send(self, request, **kwargs):
+            if self.rate_limiter:
+                delay = self.rate_limiter.reserve(request.url)
+                rate_limit.record_wait(delay)
+                time.sleep(delay)
+            return super().send(request, **kwargs)
+
+    return RateLimitedAdapter
+
+
+def create_response_error(status_code, content, namespace):
+    """
+    Builds the exception TSC raises for a failed response, for requests that don't go through TSC's endpoints.
+    """
+    if status_code >= 500:
+        return TSC.server.endpoint.exceptions.InternalServerError(
+            SimpleNamespace(status_code=status_code, content=content))
+    try:
+        return TSC.ServerResponseError.from_response(content, namespace)
+    except (ElementTree.ParseError, AttributeError):
+        return TSC.server.endpoint.exceptions.NonXMLResponseError(content)
+
+
+def send_streamed_request(server, url, req_options=None):
+    """
+    Sends an authenticated GET and returns the response with its body still unread.
+
+    This bypasses TSC's get_request, whose response logging reads the whole body of any
+    response with a text encoding, such as a CSV export, into memory before returning it.
+    """
+    server_response = server.session.get(
+        url,
+        stream=True,
+        headers={'x-tableau-auth': server.auth_token},
+        params=req_options.get_query_params() if req_options else None,
+        **server.http_options)
+    if server_response.status_code not in SUCCESS_STATUS_CODES:
+        with server_response:
+            metrics.record_bytes_received(len(server_response.content))
+            raise create_response_error(
+                server_response.status_code,
+                server_response.content,
+                server.namespace)
+    return server_response
+
+
+def get_backoff_time(retry_number, backoff_factor=DEFAULT_BACKOFF_FACTOR):
+    """
+    Returns how long to sleep before the given retry, with the same jittered exponential
+    backoff as JitteredRetry, for clients that don't go through urllib3.
+    """
+    if retry_number <= 1:
+        return 0
+    backoff_time = min(
+        backoff_factor * 2 ** (retry_number - 1),
+        DEFAULT_BACKOFF_MAX)
+    return random.uniform(backoff_time / 2, backoff_time)
+
+
+def create_retry(max_retries=DEFAULT_MAX_RETRIES, rate_limiter=None):
+    """
+    Retries connection failures and throttled or unavailable responses. Only idempotent
+    methods are retried on a response, so sign-ins and refresh requests are never sent twice.
+    With a rate_limiter, every retry also waits for its share of the host's request budget.
+    """
+    retry_class = get_retry_class()
+    return retry_class(
+        total=max_retries,
+        connect=max_retries,
+        read=0,
+        status=max_retries,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=retry_class.DEFAULT_ALLOWED_METHODS,
+        backoff_factor=DEFAULT_BACKOFF_FACTOR,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+        rate_limiter=rate_limiter)
+
+
+def configure_server(
+        server,
+        pool_size=DEFAULT_POOL_SIZE,
+        max_retries=DEFAULT_MAX_RETRIES,
+        read_timeout=DEFAULT_READ_TIMEOUT,
+        rate_limiter=None):
+    """
+    Installs a pooled, retrying adapter on the server's session and sets a timeout on every request.
+    With a rate_limiter, every request first waits for its share of the host's request budget.
+    """
+    adapter = get_adapter_class()(
+        rate_limiter=rate_limiter,
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=create_retry(max_retries, rate_limiter))
+    server.session.mount('https://', adapter)
+    server.session.mount('http://', adapter)
+    metrics.instrument_session(server.session)
+    server.add_http_options(
+        {'timeout': (DEFAULT_CONNECT_TIMEOUT, read_timeout)})
+    return server
+
+
+def create_server(server_url, transport_options=None, use_server_version=True):
+    """
+    Returns a TSC.Server whose transport is configured before its first request,
+    including the server version detection.
+    """
+    server = TSC.Server(server_url, use_server_version=False)
+    configure_server(server, **(transport_options or {}))
+    if use_server_version:
+        server.use_server_version()
+    return server
+
+
+def add_transport_arguments(parser):
+    parser.add_argument(
+        '--http-pool-size',
+        dest='http_pool_size',
+        type=int,
+        default=DEFAULT_POOL_SIZE,
+        required=False)
+    parser.add_argument(
+        '--http-max-retries',
+        dest='http_max_retries',
+        type=int,
+        default=DEFAULT_MAX_RETRIES,
+        required=False)
+    parser.add_argument(
+        '--http-timeout',
+        dest='http_timeout',
+        type=float,
+        default=DEFAULT_READ_TIMEOUT,
+        required=False)
+    rate_limit.add_rate_limit_arguments(parser)
+
+
+def get_transport_options(args):
+    return {
+        'pool_size': args.http_pool_size,
+        'max_retries': args.http_max_retries,
+        'read_timeout': args.http_timeout,
+        'rate_limiter': rate_limit.create_rate_limiter(
+            args.rate_limit_file_name, rate_limit.get_rate_limits(args)),
+    }
@@ -0,0 +1,348 @@
+"""
+A long-lived worker that runs download_view, refresh_resource and job_status on behalf of
+the blueprints, so that repeated runs skip interpreter start-up, imports and sign-in.
+
+    python worker.py --socket-file-name /tmp/tableau-worker.sock
+    python download_view.py ... --worker-socket-file-name /tmp/tableau-worker.sock
+
+A blueprint given --worker-socket-file-name sends its arguments, working directory and
+environment to the worker, and falls back to running itself when no worker is listening.
+Each request runs in a process forked from the worker, which already has every module
+imported and shares the worker's session cache file and in-memory lookup cache, so runs
+behave exactly like standalone runs, including their output, artifacts and exit codes.
+"""
+import argparse
+import atexit
+import json
+import os
+import selectors
+import signal
+import socket
+import sys
+import traceback
+from collections import deque
+
+try:
+    import download_view
+    import errors
+    import job_status
+    import lookup_cache
+    import metrics
+    import refresh_resource
+    import worker_client
+except BaseException:
+    from . import download_view
+    from . import errors
+    from . import job_status
+    from . import lookup_cache
+    from . import metrics
+    from . import refresh_resource
+    from . import worker_client
+
+WORKER_SCRIPTS = {
+    'download_view': download_view,
+    'refresh_resource': refresh_resource,
+    'job_status': job_status,
+}
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_LOOKUP_CACHE_TTL = 3600
+REQUEST_TIMEOUT = 30
+READ_SIZE = 64 * 1024
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--socket-file-name',
+        dest='socket_file_name',
+        required=True)
+    parser.add_argument(
+        '--session-cache-file-name',
+        dest='session_cache_file_name',
+        default=None,
+        required=False)
+    parser.add_argument(
+        '--lookup-cache-ttl',
+        dest='lookup_cache_ttl',
+        type=int,
+        default=DEFAULT_LOOKUP_CACHE_TTL,
+        required=False)
+    parser.add_argument(
+        '--max-workers',
+        dest='max_workers',
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        required=False)
+    args = parser.parse_args()
+    if args.max_workers < 1:
+        parser.error('--max-workers must be at least 1.')
+    if not args.session_cache_file_name:
+        args.session_cache_file_name = f'{os.path.splitext(args.socket_file_name)[0]}-sessions.json'
+    return args
+
+
+def preload_modules():
+    """
+    Imports the deferred dependencies up front, so forked runs start with them loaded.
+    """
+    for module in (
+            download_view.TSC,
+            download_view.shipyard,
+            download_view.requests):
+        dir(module)
+    import requests.adapters
+    import urllib3.util.retry
+
+
+def read_request(connection):
+    connection.settimeout(REQUEST_TIMEOUT)
+    with connection.makefile('rb') as f:
+        request = json.loads(f.readline())
+    connection.settimeout(None)
+    return request
+
+
+def get_run_arguments(request, session_cache_file_name):
+    """
+    Runs share the worker's session cache unless the request brings its own.
+    """
+    arguments = list(request['arguments'])
+    if '--session-cache-file-name' not in arguments:
+        arguments.extend(['--session-cache-file-name', session_cache_file_name])
+    return arguments
+
+
+def run_request(connection, journal_file_descriptor, session_cache_file_name):
+    """
+    Runs one request in a forked process, with stdout and stderr sent to the client as output frames.
+    Returns the run's exit code.
+    """
+    worker_client.running_in_worker = True
+    metrics.recorder = metrics.MetricsRecorder()
+    lookup_cache.memory_cache.journal = []
+    exit_code = errors.EXIT_CODE_UNKNOWN_ERROR
+    try:
+        request = read_request(connection)
+        module = WORKER_SCRIPTS[request['script_name']]
+        os.chdir(request['working_directory'])
+        os.environ.clear()
+        os.environ.update(request['environment'])
+        frame_writer = worker_client.FrameWriter(connection)
+        sys.stdout = worker_client.open_output(frame_writer)
+        sys.stderr = worker_client.open_output(
+            frame_writer, errors='backslashreplace')
+        sys.argv = [
+            f'{request["script_name"]}.py',
+            *get_run_arguments(request, session_cache_file_name)]
+        module.main()
+        exit_code = errors.EXIT_CODE_FINAL_STATUS_SUCCESS
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = errors.EXIT_CODE_FINAL_STATUS_SUCCESS
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        with os.fdopen(journal_file_descriptor, 'w') as f:
+            json.dump(lookup_cache.memory_cache.journal, f)
+    return exit_code
+
+
+class Worker():
+    """
+    Accepts requests on a Unix socket and runs each one in a forked process, at most max_workers at a time.
+
+    The worker itself is single-threaded, so forking never copies a lock held by another thread.
+    Lookups made by a run are sent back through a pipe and merged into the in-memory cache.
+    """
+
+    def __init__(self, socket_file_name, session_cache_file_name, max_workers):
+        self.socket_file_name = socket_file_name
+        self.session_cache_file_name = session_cache_file_name
+        self.max_workers = max_workers
+        self.selector = selectors.DefaultSelector()
+        self.pending_connections = deque()
+        self.runs = {}
+        self.stopping = False
+
+    def listen(self):
+        if os.path.exists(self.socket_file_name):
+            os.remove(self.socket_file_name)
+        self.listening_socket = socket.socket(
+            socket.AF_UNIX, socket.SOCK_STREAM)
+        # Requests carry credentials, so only this user may connect.
+        previous_umask = os.umask(0o177)
+        try:
+            self.listening_socket.bind(self.socket_file_name)
+        finally:
+            os.umask(previous_umask)
+        self.listening_socket.listen()
+        self.listening_socket.setblocking(False)
+        self.selector.register(self.listening_socket, selectors.EVENT_READ)
+
+        # SIGCHLD wakes the selector so finished runs are reported immediately.
+        self.wakeup_read, self.wakeup_write = os.pipe()
+        os.set_blocking(self.wakeup_write, False)
+        signal.set_wakeup_fd(self.wakeup_write)
+        signal.signal(signal.SIGCHLD, lambda signal_number, frame: None)
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.selector.register(self.wakeup_read, selectors.EVENT_READ)
+
+    def stop(self, signal_number=None, frame=None):
+        self.stopping = True
+
+    def start_run(self, connection):
+        journal_read, journal_write = os.pipe()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            os.close(journal_read)
+            self.close_inherited_files()
+            exit_code = errors.EXIT_CODE_UNKNOWN_ERROR
+            try:
+                exit_code = run_request(
+                    connection, journal_write, self.session_cache_file_name)
+                # Runs register their metrics writer with atexit, which os._exit skips.
+                atexit._run_exitfuncs()
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(exit_code)
+
+        os.close(journal_write)
+        os.set_blocking(journal_read, False)
+        self.runs[pid] = {
+            'connection': connection,
+            'journal_file_descriptor': journal_read,
+            'journal': b'',
+            'journal_complete': False,
+            'exit_code': None,
+        }
+        self.selector.register(
+            journal_read, selectors.EVENT_READ, data=pid)
+
+    def close_inherited_files(self):
+        """
+        A forked run closes the worker's other connections, so each client sees the end
+        of its output as soon as its own run finishes, and restores default signal handling.
+        """
+        signal.set_wakeup_fd(-1)
+        for signal_number in (signal.SIGCHLD, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signal_number, signal.SIG_DFL)
+        self.selector.close()
+        self.listening_socket.close()
+        os.close(self.wakeup_read)
+        os.close(self.wakeup_write)
+        for connection in self.pending_connections:
+            connection.close()
+        for run in self.runs.values():
+            run['connection'].close()
+            if not run['journal_complete']:
+                os.close(run['journal_file_descriptor'])
+
+    def read_journal(self, pid):
+        run = self.runs[pid]
+        data = os.read(run['journal_file_descriptor'], READ_SIZE)
+        if data:
+            run['journal'] += data
+            return
+        self.selector.unregister(run['journal_file_descriptor'])
+        os.close(run['journal_file_descriptor'])
+        run['journal_complete'] = True
+        self.finish_run(pid)
+
+    def reap_runs(self):
+        while self.runs:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if os.WIFEXITED(status):
+                self.runs[pid]['exit_code'] = os.WEXITSTATUS(status)
+            else:
+                self.runs[pid]['exit_code'] = errors.EXIT_CODE_UNKNOWN_ERROR
+            self.finish_run(pid)
+
+    def finish_run(self, pid):
+        """
+        A run is reported once it has exited and its journal has been read in full.
+        """
+        run = self.runs[pid]
+        if run['exit_code'] is None or not run['journal_complete']:
+            return
+        del self.runs[pid]
+        try:
+            lookup_cache.memory_cache.apply_journal(json.loads(run['journal']))
+        except ValueError:
+            pass
+        try:
+            run['connection'].sendall(worker_client.create_frame(
+                worker_client.RESULT_FRAME,
+                json.dumps({'exit_code': run['exit_code']}).encode('utf-8')))
+        except OSError:
+            # The client went away; the run itself has already finished.
+            pass
+        run['connection'].close()
+
+    def start_pending_runs(self):
+        while self.pending_connections and len(self.runs) < self.max_workers:
+            self.start_run(self.pending_connections.popleft())
+
+    def serve(self):
+        self.listen()
+        print(f'Worker listening on {self.socket_file_name}.')
+        try:
+            while not self.stopping or self.runs:
+                for key, _ in self.selector.select():
+                    if key.fileobj is self.listening_socket:
+                        try:
+                            connection, _ = self.listening_socket.accept()
+                        except BlockingIOError:
+                            continue
+                        connection.setblocking(True)
+                        self.pending_connections.append(connection)
+                    elif key.fileobj == self.wakeup_read:
+                        os.read(self.wakeup_read, READ_SIZE)
+                    else:
+                        self.read_journal(key.data)
+                self.reap_runs()
+                if self.stopping:
+                    self.close_listening_socket()
+                else:
+                    self.start_pending_runs()
+        finally:
+            self.close_listening_socket()
+            for connection in self.pending_connections:
+                connection.close()
+
+    def close_listening_socket(self):
+        if self.listening_socket.fileno() == -1:
+            return
+        self.selector.unregister(self.listening_socket)
+        self.listening_socket.close()
+        if os.path.exists(self.socket_file_name):
+            os.remove(self.socket_file_name)
+
+
+def main():
+    args = get_args()
+    preload_modules()
+    lookup_cache.memory_cache = lookup_cache.MemoryLookupCache(
+        args.lookup_cache_ttl)
+    worker = Worker(
+        os.path.abspath(args.socket_file_name),
+        os.path.abspath(args.session_cache_file_name),
+        args.max_workers)
+    worker.serve()
+    print('Worker stopped.')
+
+
+if __name__ == '__main__':
+    main()
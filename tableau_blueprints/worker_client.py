@@ -0,0 +1,125 @@
+import io
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+
+try:
+    import errors
+except BaseException:
+    from . import errors
+
+# The worker replies with a stream of frames, each a kind and a length followed by that many bytes,
+# so the blueprint's output can contain any bytes. The result frame holds the run's exit code.
+FRAME_HEADER = struct.Struct('>cI')
+OUTPUT_FRAME = b'o'
+RESULT_FRAME = b'r'
+
+# Set in worker processes, so that a forwarded run is executed instead of being forwarded again.
+running_in_worker = False
+
+
+def add_worker_arguments(parser):
+    parser.add_argument(
+        '--worker-socket-file-name',
+        dest='worker_socket_file_name',
+        default=None,
+        required=False)
+
+
+def create_worker_request(script_name):
+    """
+    The run is described by its arguments, working directory and environment, so the worker
+    resolves relative paths and artifact folders exactly as this process would have.
+    """
+    return {
+        'script_name': script_name,
+        'arguments': sys.argv[1:],
+        'working_directory': os.getcwd(),
+        'environment': dict(os.environ),
+    }
+
+
+class FrameWriter(io.RawIOBase):
+    """
+    Sends everything written to it over the connection as output frames. Writes are locked,
+    so stdout and stderr can share one writer across threads without splitting a frame.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._lock = threading.Lock()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        with self._lock:
+            self.connection.sendall(create_frame(OUTPUT_FRAME, data))
+        return len(data)
+
+
+def create_frame(kind, content):
+    return FRAME_HEADER.pack(kind, len(content)) + content
+
+
+def open_output(frame_writer, errors='strict'):
+    """
+    Returns a line-buffered text stream over the frame writer, to stand in for stdout or stderr.
+    """
+    return io.TextIOWrapper(
+        io.BufferedWriter(frame_writer),
+        encoding='utf-8',
+        errors=errors,
+        line_buffering=True)
+
+
+def run_in_worker(socket_file_name, request):
+    """
+    Sends the request to the worker and streams its output to stdout as each frame arrives.
+
+    Returns the run's exit code, or None if no worker is listening on the socket.
+    """
+    worker_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        worker_socket.connect(socket_file_name)
+    except (FileNotFoundError, ConnectionRefusedError):
+        worker_socket.close()
+        return None
+
+    with worker_socket:
+        worker_socket.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        output = sys.stdout.buffer
+        with worker_socket.makefile('rb') as frames:
+            while True:
+                header = frames.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    break
+                kind, content_length = FRAME_HEADER.unpack(header)
+                content = frames.read(content_length)
+                if len(content) < content_length:
+                    break
+                if kind == RESULT_FRAME:
+                    return json.loads(content)['exit_code']
+                output.write(content)
+                output.flush()
+
+    print('The worker closed the connection before the run finished.')
+    return errors.EXIT_CODE_UNKNOWN_ERROR
+
+
+def forward_to_worker(socket_file_name, script_name):
+    """
+    Runs this blueprint in the worker when one is listening on the socket, and exits with its exit code.
+    Returns without doing anything when no socket is configured or no worker is running,
+    so the blueprint runs in this process as usual.
+    """
+    if not socket_file_name or running_in_worker:
+        return
+    exit_code = run_in_worker(
+        socket_file_name, create_worker_request(script_name))
+    if exit_code is not None:
+        sys.exit(exit_code)
@@ -0,0 +1,99 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+ROOT_FOLDER_NAME = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The blueprints import their sibling modules by name, the way Shipyard runs them.
+sys.path.insert(0, os.path.join(ROOT_FOLDER_NAME, 'tableau_blueprints'))
+sys.path.insert(0, os.path.join(ROOT_FOLDER_NAME, 'benchmarks'))
+
+import async_client  # noqa: E402
+import metrics  # noqa: E402
+import mock_tableau_server  # noqa: E402
+import tableauserverclient as TSC  # noqa: E402
+import transport  # noqa: E402
+
+# Short jobs keep the refresh and polling tests fast.
+JOB_DURATION = 0.5
+
+
+@pytest.fixture
+def mock_server():
+    with mock_tableau_server.MockTableauServer(job_duration=JOB_DURATION) as server:
+        yield server
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    """
+    Replaces the run's metrics recorder with a fresh one, so tests only see their own metrics.
+    """
+    recorder = metrics.MetricsRecorder()
+    monkeypatch.setattr(metrics, 'recorder', recorder)
+    return recorder
+
+
+@pytest.fixture
+def sign_in():
+    """
+    Returns a function that signs in to a mock server with the blueprints' transport and
+    resets the mock's request counts, so tests only count their own requests.
+    """
+    def sign_in(mock_server, **transport_options):
+        server = transport.create_server(mock_server.url, transport_options)
+        server.auth.sign_in(TSC.TableauAuth('username', 'password', site_id=''))
+        mock_server.reset_request_counts()
+        return server
+    return sign_in
+
+
+@pytest.fixture
+def server(mock_server, sign_in):
+    return sign_in(mock_server)
+
+
+@pytest.fixture
+def run_async(mock_server):
+    """
+    Returns a function that signs in to the mock server with the async client, awaits
+    function(server) on a new event loop and returns its result.
+    """
+    def run_async(function, mock_server=mock_server, **transport_options):
+        async def run_function():
+            server = await async_client.create_server(mock_server.url, transport_options)
+            async with server:
+                await server.sign_in(TSC.TableauAuth('username', 'password', site_id=''))
+                mock_server.reset_request_counts()
+                return await function(server)
+        return asyncio.run(run_function())
+    return run_async
+
+
+@pytest.fixture
+def credential_arguments(mock_server):
+    return [
+        '--username', 'username',
+        '--password', 'password',
+        '--site-id', 'default',
+        '--server-url', mock_server.url,
+    ]
+
+
+@pytest.fixture
+def run_blueprint(monkeypatch, tmp_path):
+    """
+    Returns a function that runs a blueprint's main with the given arguments in a temporary
+    working folder, the way Shipyard runs it, and returns its exit code.
+    """
+    monkeypatch.chdir(tmp_path)
+
+    def run_blueprint(module, arguments):
+        monkeypatch.setattr(sys, 'argv', [f'{module.__name__}.py', *arguments])
+        try:
+            module.main()
+        except SystemExit as e:
+            return e.code or 0
+        return 0
+    return run_blueprint
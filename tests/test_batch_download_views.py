@@ -0,0 +1,95 @@
+import glob
+import json
+
+import pytest
+
+import batch_download_views
+import errors
+import mock_tableau_server
+
+
+@pytest.fixture
+def write_manifest(tmp_path):
+    def write_manifest(entries):
+        manifest_file_name = tmp_path / 'manifest.json'
+        manifest_file_name.write_text(json.dumps(entries))
+        return str(manifest_file_name)
+    return write_manifest
+
+
+def create_entry(workbook_name, view_name, destination_file_name):
+    return {
+        'project_name': 'Project 0',
+        'workbook_name': workbook_name,
+        'view_name': view_name,
+        'file_type': 'csv',
+        'destination_file_name': destination_file_name,
+        'destination_folder_name': 'views'}
+
+
+def read_summary():
+    [summary_file_name] = glob.glob('**/download_summary.json', recursive=True)
+    with open(summary_file_name) as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize('engine', batch_download_views.ENGINES)
+def test_batch_downloads_every_entry_and_isolates_failures(
+        mock_server,
+        credential_arguments,
+        run_blueprint,
+        write_manifest,
+        tmp_path,
+        engine):
+    manifest_file_name = write_manifest([
+        create_entry('Workbook 0-0', 'View 0', 'a.csv'),
+        create_entry('Workbook 0-0', 'View 1', 'b.csv'),
+        create_entry('Workbook 0-0', 'Missing', 'c.csv'),
+        create_entry('Workbook 0-1', 'View 0', 'd.csv'),
+    ])
+
+    exit_code = run_blueprint(batch_download_views, [
+        *credential_arguments,
+        '--manifest-file-name', manifest_file_name,
+        '--engine', engine])
+
+    assert exit_code == errors.EXIT_CODE_INVALID_VIEW
+    _, chunks = mock_tableau_server.generate_export('data', mock_server.export_size)
+    export = b''.join(chunks)
+    for file_name in ('a.csv', 'b.csv', 'd.csv'):
+        assert (tmp_path / 'views' / file_name).read_bytes() == export
+    assert not (tmp_path / 'views' / 'c.csv').exists()
+    assert [result['status'] for result in read_summary()] == [
+        'success', 'success', 'failed', 'success']
+    request_counts = mock_server.get_request_counts()
+    # Entries share their project and workbook lookups.
+    assert request_counts['projects'] == 1
+    assert request_counts['workbooks'] == 2
+    assert request_counts['export'] == 3
+
+
+@pytest.mark.parametrize('engine', batch_download_views.ENGINES)
+def test_parquet_entries_use_the_parquet_options(
+        mock_server,
+        credential_arguments,
+        run_blueprint,
+        write_manifest,
+        tmp_path,
+        engine):
+    pyarrow_parquet = pytest.importorskip('pyarrow.parquet')
+    manifest_file_name = write_manifest([
+        dict(create_entry('Workbook 0-0', 'View 0', 'a.parquet'), file_type='parquet'),
+        create_entry('Workbook 0-0', 'View 1', 'b.csv'),
+    ])
+
+    exit_code = run_blueprint(batch_download_views, [
+        *credential_arguments,
+        '--manifest-file-name', manifest_file_name,
+        '--engine', engine,
+        '--parquet-compression', 'gzip'])
+
+    assert exit_code == errors.EXIT_CODE_FINAL_STATUS_SUCCESS
+    metadata = pyarrow_parquet.ParquetFile(str(tmp_path / 'views' / 'a.parquet')).metadata
+    assert metadata.row_group(0).column(0).compression == 'GZIP'
+    _, chunks = mock_tableau_server.generate_export('data', mock_server.export_size)
+    assert (tmp_path / 'views' / 'b.csv').read_bytes() == b''.join(chunks)
@@ -0,0 +1,119 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import catalog
+import lookup
+import lookup_cache
+import mock_tableau_server
+
+
+@pytest.fixture
+def catalog_file_name(tmp_path):
+    return str(tmp_path / 'catalog' / 'catalog.db')
+
+
+def sync(server, catalog_file_name, full_sync=False):
+    connection = catalog.open_catalog(catalog_file_name)
+    try:
+        return catalog.sync_catalog(connection, server, full_sync)
+    finally:
+        connection.close()
+
+
+def get_workbook(mock_server, name):
+    return next(
+        workbook for workbook in mock_server.site.workbooks
+        if workbook['name'] == name)
+
+
+def test_sync_fetches_only_items_updated_since_the_last_sync(
+        mock_server, server, catalog_file_name):
+    site = mock_server.site
+    get_workbook(mock_server, 'Workbook 0-0')['updated_at'] = datetime(
+        2023, 1, 1, tzinfo=timezone.utc)
+
+    assert sync(server, catalog_file_name) == {
+        'projects': len(site.projects),
+        'workbooks': len(site.workbooks),
+        'views': len(site.views),
+        'datasources': len(site.datasources)}
+
+    renamed_workbook = get_workbook(mock_server, 'Workbook 1-1')
+    renamed_workbook['name'] = 'Renamed'
+    renamed_workbook['updated_at'] = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    synced_counts = sync(server, catalog_file_name)
+
+    # The watermark is inclusive, so the workbook updated at the previous watermark is fetched again.
+    assert synced_counts['workbooks'] == 2
+    # Views and datasources keep the watermark of their own last sync.
+    assert synced_counts['views'] == len(site.views)
+    index = catalog.CatalogIndex(catalog_file_name)
+    assert index.get(server, ('workbook', 'Project 1', 'Renamed')) == {
+        'project_id': renamed_workbook['project_id'],
+        'workbook_id': renamed_workbook['id']}
+
+
+def test_full_sync_starts_from_scratch(mock_server, server, catalog_file_name):
+    sync(server, catalog_file_name)
+
+    synced_counts = sync(server, catalog_file_name, full_sync=True)
+
+    assert synced_counts['workbooks'] == len(mock_server.site.workbooks)
+
+
+def test_lookups_through_the_catalog_make_no_requests(
+        mock_server, server, catalog_file_name):
+    sync(server, catalog_file_name)
+    cache = lookup_cache.create_lookup_cache(None, catalog_file_name=catalog_file_name)
+    mock_server.reset_request_counts()
+
+    view_ids = lookup.get_view_ids(
+        server, 'Project 1', 'Workbook 1-3', 'View 2', cache=cache)
+    datasource_ids = lookup.get_datasource_ids(
+        server, 'Project 0', 'Datasource 0-1', cache=cache)
+
+    assert mock_server.get_request_counts() == {}
+    view = next(
+        view for view in mock_server.site.views
+        if view['name'] == 'View 2' and view['workbook_name'] == 'Workbook 1-3')
+    assert view_ids['view_id'] == view['id']
+    assert datasource_ids['datasource_id'] == mock_server.site.datasources[1]['id']
+
+
+def test_ambiguous_names_fall_back_to_a_live_lookup(sign_in, catalog_file_name):
+    site = mock_tableau_server.MockSite()
+    site.projects[1]['name'] = 'Project 0'
+    with mock_tableau_server.MockTableauServer(site=site) as mock_server:
+        server = sign_in(mock_server)
+        sync(server, catalog_file_name)
+        index = catalog.CatalogIndex(catalog_file_name)
+
+        assert index.get(server, ('workbook', 'Project 0', 'Workbook 0-0')) is not None
+        assert index.get(server, ('datasource', 'Project 0', 'Datasource 0-0')) is not None
+        # Both projects have a Workbook 0-0 once their names match, so it can't be resolved from the catalog.
+        site.workbooks[len(site.workbooks) // 2]['name'] = 'Workbook 0-0'
+        site.workbooks[len(site.workbooks) // 2]['updated_at'] = datetime.now(timezone.utc)
+        sync(server, catalog_file_name)
+        assert index.get(server, ('workbook', 'Project 0', 'Workbook 0-0')) is None
+
+
+def test_catalog_of_another_site_is_ignored(mock_server, server, catalog_file_name):
+    sync(server, catalog_file_name)
+    index = catalog.CatalogIndex(catalog_file_name)
+    name_path = ('workbook', 'Project 0', 'Workbook 0-0')
+    ids = index.get(server, name_path)
+
+    # The catalog is read-only through the lookup cache interface.
+    index.set(server, name_path, {'project_id': 'other', 'workbook_id': 'other'})
+    index.invalidate(server, name_path)
+    assert index.get(server, name_path) == ids
+
+    server._site_id = 'another-site'
+    assert index.get(server, name_path) is None
+
+
+def test_missing_catalog_falls_back_to_a_live_lookup(server, tmp_path):
+    index = catalog.CatalogIndex(str(tmp_path / 'missing.db'))
+
+    assert index.get(server, ('workbook', 'Project 0', 'Workbook 0-0')) is None
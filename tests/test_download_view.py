@@ -0,0 +1,162 @@
+import os
+
+import pytest
+import requests
+import tableauserverclient as TSC
+
+import download_view
+import errors
+import lookup
+import mock_tableau_server
+
+
+def get_file_names(folder_name):
+    return sorted(os.listdir(folder_name))
+
+
+def test_download_streams_export_to_file(mock_server, server, tmp_path):
+    view_ids = lookup.get_view_ids(server, 'Project 0', 'Workbook 0-0', 'View 0')
+    destination_full_path = str(tmp_path / 'view.csv')
+
+    download_view.download_view_to_file(
+        server, view_ids, 'csv', destination_full_path, 'View 0')
+
+    _, chunks = mock_tableau_server.generate_export('data', mock_server.export_size)
+    with open(destination_full_path, 'rb') as f:
+        assert f.read() == b''.join(chunks)
+    assert get_file_names(tmp_path) == ['view.csv']
+
+
+def test_missing_view_raises_not_found_error(server, tmp_path):
+    with pytest.raises(TSC.ServerResponseError) as error:
+        download_view.download_view_to_file(
+            server,
+            {'view_id': 'missing'},
+            'csv',
+            str(tmp_path / 'view.csv'),
+            'View 0')
+
+    assert lookup.is_not_found_error(error.value)
+    assert get_file_names(tmp_path) == []
+
+
+def test_interrupted_download_keeps_previous_file(tmp_path):
+    destination_full_path = tmp_path / 'view.csv'
+    destination_full_path.write_bytes(b'previous export')
+
+    def view_content():
+        yield b'Region,Sales\n'
+        raise requests.exceptions.ChunkedEncodingError('Connection broken')
+
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        download_view.write_view_content_to_file(
+            str(destination_full_path), view_content(), 'csv', 'View 0')
+
+    assert destination_full_path.read_bytes() == b'previous export'
+    assert get_file_names(tmp_path) == ['view.csv']
+
+
+def test_write_error_exits_and_removes_partial_file(tmp_path):
+    def view_content():
+        yield b'Region,Sales\n'
+        raise OSError('No space left on device')
+
+    with pytest.raises(SystemExit) as exit_info:
+        download_view.write_view_content_to_file(
+            str(tmp_path / 'view.csv'), view_content(), 'csv', 'View 0')
+
+    assert exit_info.value.code == errors.EXIT_CODE_FILE_WRITE_ERROR
+    assert get_file_names(tmp_path) == []
+
+
+def test_write_error_in_a_missing_folder_exits_with_the_write_error(tmp_path):
+    # A file in the way of the destination folder makes both the write and the cleanup fail.
+    (tmp_path / 'slices').write_text('')
+
+    with pytest.raises(SystemExit) as exit_info:
+        download_view.write_view_content_to_file(
+            str(tmp_path / 'slices' / 'view.csv'), [b'Region,Sales\n'], 'csv', 'View 0')
+
+    assert exit_info.value.code == errors.EXIT_CODE_FILE_WRITE_ERROR
+
+
+def test_partition_folder_is_named_after_the_filter_value(tmp_path):
+    destination_full_path = download_view.get_partition_full_path(
+        str(tmp_path), 'view.csv', 'Region', f'North{os.sep}West')
+
+    assert destination_full_path == os.path.join(
+        str(tmp_path), 'Region=North_West', 'view.csv')
+
+
+def download_slices_arguments(credential_arguments, *arguments):
+    return [
+        *credential_arguments,
+        '--project-name', 'Project 0',
+        '--workbook-name', 'Workbook 0-0',
+        '--view-name', 'View 0',
+        '--file-type', 'csv',
+        '--destination-file-name', 'view.csv',
+        '--destination-folder-name', 'slices',
+        *arguments]
+
+
+def test_every_slice_is_downloaded_to_its_partition(
+        mock_server, credential_arguments, run_blueprint, tmp_path):
+    filter_values_file_name = tmp_path / 'regions.txt'
+    filter_values_file_name.write_text('South\nWest\n\n')
+
+    exit_code = run_blueprint(download_view, download_slices_arguments(
+        credential_arguments,
+        '--filter-name', 'Region',
+        '--filter-values', 'East,West',
+        '--filter-values-file-name', str(filter_values_file_name)))
+
+    assert exit_code == errors.EXIT_CODE_FINAL_STATUS_SUCCESS
+    assert get_file_names(tmp_path / 'slices') == [
+        'Region=East', 'Region=South', 'Region=West']
+    for folder_name in get_file_names(tmp_path / 'slices'):
+        assert get_file_names(tmp_path / 'slices' / folder_name) == ['view.csv']
+    assert mock_server.get_request_counts()['export'] == 3
+
+
+def test_failed_slice_does_not_stop_the_others(
+        mock_server, credential_arguments, run_blueprint, tmp_path):
+    # A file in the way of the East partition folder makes only that slice fail.
+    (tmp_path / 'slices').mkdir()
+    (tmp_path / 'slices' / 'Region=East').write_text('')
+
+    exit_code = run_blueprint(download_view, download_slices_arguments(
+        credential_arguments,
+        '--filter-name', 'Region',
+        '--filter-values', 'East,South,West'))
+
+    assert exit_code == errors.EXIT_CODE_FILE_WRITE_ERROR
+    for filter_value in ('South', 'West'):
+        assert get_file_names(tmp_path / 'slices' / f'Region={filter_value}') == ['view.csv']
+    assert mock_server.get_request_counts()['export'] == 3
+
+
+def test_missing_view_fails_every_slice_with_its_exit_code(
+        mock_server, credential_arguments, run_blueprint, tmp_path):
+    mock_server.site.views[0]['name'] = 'Renamed'
+
+    exit_code = run_blueprint(download_view, download_slices_arguments(
+        credential_arguments,
+        '--filter-name', 'Region',
+        '--filter-values', 'East,West'))
+
+    assert exit_code == errors.EXIT_CODE_INVALID_VIEW
+    assert not (tmp_path / 'slices').exists()
+
+
+@pytest.mark.parametrize('arguments', [
+    ['--filter-name', 'Region'],
+    ['--filter-values', 'East,West'],
+])
+def test_filter_name_and_values_are_required_together(
+        credential_arguments, run_blueprint, capsys, arguments):
+    exit_code = run_blueprint(download_view, download_slices_arguments(
+        credential_arguments, *arguments))
+
+    assert exit_code == 2
+    assert '--filter-name must be provided together with' in capsys.readouterr().err
@@ -0,0 +1,88 @@
+import json
+import os
+
+import download_workbook
+import errors
+
+VIEW_NAMES = [f'View {view_number}' for view_number in range(5)]
+
+
+def download_arguments(credential_arguments, file_type, *arguments):
+    return [
+        *credential_arguments,
+        '--project-name', 'Project 0',
+        '--workbook-name', 'Workbook 0-0',
+        '--file-type', file_type,
+        '--destination-folder-name', 'workbook',
+        *arguments]
+
+
+def read_index(tmp_path):
+    with open(tmp_path / 'workbook' / 'index.json') as f:
+        return json.load(f)
+
+
+def get_workbook_views(mock_server):
+    workbook = next(
+        workbook for workbook in mock_server.site.workbooks
+        if workbook['name'] == 'Workbook 0-0')
+    views = [
+        {'view_id': view['id'], 'view_name': view['name']}
+        for view in mock_server.site.views if view['workbook_id'] == workbook['id']]
+    return workbook, views
+
+
+def test_pdf_is_one_file_covering_every_view(
+        mock_server, credential_arguments, run_blueprint, tmp_path):
+    exit_code = run_blueprint(download_workbook, download_arguments(
+        credential_arguments, 'pdf'))
+
+    assert exit_code == errors.EXIT_CODE_FINAL_STATUS_SUCCESS
+    assert sorted(os.listdir(tmp_path / 'workbook')) == ['Workbook 0-0.pdf', 'index.json']
+    assert os.path.getsize(tmp_path / 'workbook' / 'Workbook 0-0.pdf') == mock_server.export_size
+    assert mock_server.get_request_counts()['export'] == 1
+    workbook, views = get_workbook_views(mock_server)
+    assert read_index(tmp_path) == {
+        'project_name': 'Project 0',
+        'workbook_id': workbook['id'],
+        'workbook_name': 'Workbook 0-0',
+        'file_type': 'pdf',
+        'files': [{
+            'file_name': 'Workbook 0-0.pdf',
+            'views': views,
+            'exit_code': errors.EXIT_CODE_FINAL_STATUS_SUCCESS,
+        }],
+    }
+
+
+def test_other_file_types_have_one_file_per_view(
+        mock_server, credential_arguments, run_blueprint, tmp_path):
+    exit_code = run_blueprint(download_workbook, download_arguments(
+        credential_arguments, 'csv', '--compression', 'gzip'))
+
+    assert exit_code == errors.EXIT_CODE_FINAL_STATUS_SUCCESS
+    file_names = [f'{view_name}.csv.gz' for view_name in VIEW_NAMES]
+    assert sorted(os.listdir(tmp_path / 'workbook')) == [*file_names, 'index.json']
+    assert mock_server.get_request_counts()['export'] == len(VIEW_NAMES)
+    _, views = get_workbook_views(mock_server)
+    assert read_index(tmp_path)['files'] == [
+        dict(view, file_name=file_name, exit_code=errors.EXIT_CODE_FINAL_STATUS_SUCCESS)
+        for view, file_name in zip(views, file_names)]
+
+
+def test_failed_view_is_recorded_in_the_index(
+        mock_server, credential_arguments, run_blueprint, tmp_path):
+    # A folder in the way of one view's file makes only that view fail.
+    os.makedirs(tmp_path / 'workbook' / 'View 1.csv')
+
+    exit_code = run_blueprint(download_workbook, download_arguments(
+        credential_arguments, 'csv'))
+
+    assert exit_code == errors.EXIT_CODE_FILE_WRITE_ERROR
+    assert mock_server.get_request_counts()['export'] == len(VIEW_NAMES)
+    exit_codes = {
+        output['view_name']: output['exit_code']
+        for output in read_index(tmp_path)['files']}
+    assert exit_codes == dict(
+        {view_name: errors.EXIT_CODE_FINAL_STATUS_SUCCESS for view_name in VIEW_NAMES},
+        **{'View 1': errors.EXIT_CODE_FILE_WRITE_ERROR})
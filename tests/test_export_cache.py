@@ -0,0 +1,93 @@
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+import download_view
+import export_cache
+import lookup
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return export_cache.ExportCache(str(tmp_path / 'cache'))
+
+
+@pytest.fixture
+def download(server, tmp_path, cache):
+    """
+    Returns a function that downloads View 0 of Workbook 0-0 through the export cache
+    and returns whether the cached export was reused.
+    """
+    view_ids = lookup.get_view_ids(server, 'Project 0', 'Workbook 0-0', 'View 0')
+
+    def download(destination_file_name='view.csv'):
+        return download_view.download_view_to_file(
+            server,
+            view_ids,
+            'csv',
+            str(tmp_path / 'output' / destination_file_name),
+            'View 0',
+            cache=cache)
+    return download
+
+
+def get_site_item(mock_server, name):
+    return next(
+        item for item in mock_server.site.items_by_id.values()
+        if item['name'] == name)
+
+
+def get_cache_entry_names(cache):
+    return os.listdir(cache.cache_folder_name)
+
+
+def test_unchanged_view_is_reused_from_the_cache(mock_server, download, cache, tmp_path):
+    assert not download('first.csv')
+    assert download('second.csv')
+
+    assert mock_server.get_request_counts()['export'] == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+    first_full_path = tmp_path / 'output' / 'first.csv'
+    second_full_path = tmp_path / 'output' / 'second.csv'
+    assert second_full_path.read_bytes() == first_full_path.read_bytes()
+
+
+def test_outputs_do_not_share_an_inode_with_the_cache_entry(download, cache, tmp_path):
+    download()
+    download()
+
+    [cache_entry_name] = get_cache_entry_names(cache)
+    cache_entry_full_path = os.path.join(cache.cache_folder_name, cache_entry_name)
+    output_full_path = tmp_path / 'output' / 'view.csv'
+    assert os.stat(output_full_path).st_ino != os.stat(cache_entry_full_path).st_ino
+    assert os.stat(cache_entry_full_path).st_nlink == 1
+
+    # Editing the output in place leaves the cached export untouched.
+    with open(output_full_path, 'ab') as f:
+        f.write(b'edited')
+    assert download()
+    assert not output_full_path.read_bytes().endswith(b'edited')
+
+
+@pytest.mark.parametrize('item_name', ['Workbook 0-0', 'Datasource 0-0'])
+def test_republished_workbook_or_datasource_misses_the_cache(
+        mock_server, download, cache, item_name):
+    download()
+    get_site_item(mock_server, item_name)['updated_at'] = datetime.now(timezone.utc)
+
+    assert not download()
+    assert mock_server.get_request_counts()['export'] == 2
+    assert len(get_cache_entry_names(cache)) == 2
+
+
+def test_expired_entry_misses_the_cache(mock_server, download, cache):
+    download()
+    [cache_entry_name] = get_cache_entry_names(cache)
+    expired_time = os.path.getmtime(os.path.join(
+        cache.cache_folder_name, cache_entry_name)) - cache.max_age_seconds - 1
+    os.utime(os.path.join(cache.cache_folder_name, cache_entry_name),
+             (expired_time, expired_time))
+
+    assert not download()
+    assert mock_server.get_request_counts()['export'] == 2
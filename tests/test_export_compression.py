@@ -0,0 +1,156 @@
+import argparse
+import gzip
+import hashlib
+import json
+
+import pytest
+
+import download_view
+import export_cache
+import export_compression
+import lookup
+import mock_tableau_server
+
+
+def decompress_zstd(content):
+    import zstandard
+    return zstandard.ZstdDecompressor().decompressobj().decompress(content)
+
+
+DECOMPRESSORS = {
+    'gzip': gzip.decompress,
+    'zstd': decompress_zstd,
+}
+requires_zstandard = pytest.mark.skipif(
+    not export_compression.is_zstandard_installed(), reason='zstandard is not installed')
+
+
+def create_compression_options(compression, compression_level=None, checksum=True):
+    return export_compression.get_compression_options(argparse.Namespace(
+        compression=compression,
+        compression_level=compression_level,
+        write_checksum='TRUE' if checksum else 'FALSE'))
+
+
+def read_checksum_file(destination_full_path):
+    with open(f'{destination_full_path}{export_compression.CHECKSUM_FILE_SUFFIX}') as f:
+        return json.load(f)
+
+
+def get_checksum(content):
+    return {'sha256': hashlib.sha256(content).hexdigest(), 'bytes': len(content)}
+
+
+@pytest.mark.parametrize('compression', ['gzip', pytest.param('zstd', marks=requires_zstandard)])
+def test_compressed_export_has_a_matching_checksum(tmp_path, compression):
+    destination_full_path = tmp_path / export_compression.get_file_name(
+        'view.csv', compression)
+    chunks = [b'Region,Sales\n', b'West,1\n' * 1000]
+
+    download_view.write_view_content_to_file(
+        str(destination_full_path),
+        iter(chunks),
+        'csv',
+        'View 0',
+        compression_options=create_compression_options(compression))
+
+    content = destination_full_path.read_bytes()
+    assert DECOMPRESSORS[compression](content) == b''.join(chunks)
+    assert read_checksum_file(destination_full_path) == {
+        'file_name': destination_full_path.name,
+        'compression': compression,
+        **get_checksum(content)}
+
+
+def test_compressed_output_is_identical_for_identical_exports(tmp_path):
+    for file_name in ('first.csv.gz', 'second.csv.gz'):
+        download_view.write_view_content_to_file(
+            str(tmp_path / file_name),
+            [b'Region,Sales\nWest,1\n'],
+            'csv',
+            'View 0',
+            compression_options=create_compression_options('gzip', checksum=False))
+
+    assert (tmp_path / 'first.csv.gz').read_bytes() == (tmp_path / 'second.csv.gz').read_bytes()
+    assert not (tmp_path / f'first.csv.gz{export_compression.CHECKSUM_FILE_SUFFIX}').exists()
+
+
+def test_reused_cached_export_gets_a_checksum(server, tmp_path):
+    view_ids = lookup.get_view_ids(server, 'Project 0', 'Workbook 0-0', 'View 0')
+    cache = export_cache.ExportCache(str(tmp_path / 'cache'))
+    destination_full_path = tmp_path / 'output' / 'view.csv.gz'
+
+    def download():
+        return download_view.download_view_to_file(
+            server,
+            view_ids,
+            'csv',
+            str(destination_full_path),
+            'View 0',
+            cache=cache,
+            compression_options=create_compression_options('gzip'))
+
+    assert not download()
+    (tmp_path / 'output' / f'view.csv.gz{export_compression.CHECKSUM_FILE_SUFFIX}').unlink()
+    assert download()
+
+    assert read_checksum_file(destination_full_path) == {
+        'file_name': 'view.csv.gz',
+        'compression': 'gzip',
+        **get_checksum(destination_full_path.read_bytes())}
+
+
+@requires_zstandard
+def test_download_view_writes_compressed_export_and_checksum(
+        mock_server, credential_arguments, run_blueprint, tmp_path):
+    exit_code = run_blueprint(download_view, [
+        *credential_arguments,
+        '--project-name', 'Project 0',
+        '--workbook-name', 'Workbook 0-0',
+        '--view-name', 'View 0',
+        '--file-type', 'csv',
+        '--destination-file-name', 'view.csv',
+        '--compression', 'zstd',
+        '--compression-level', '19',
+        '--write-checksum', 'TRUE'])
+
+    assert exit_code == 0
+    content = (tmp_path / 'view.csv.zst').read_bytes()
+    _, chunks = mock_tableau_server.generate_export('data', mock_server.export_size)
+    assert DECOMPRESSORS['zstd'](content) == b''.join(chunks)
+    assert read_checksum_file(tmp_path / 'view.csv.zst')['sha256'] == get_checksum(
+        content)['sha256']
+
+
+def test_parquet_files_are_not_compressed_twice():
+    compression_options = create_compression_options('gzip')
+
+    assert export_compression.get_file_compression_options(
+        compression_options, 'parquet') == {
+        'compression': 'none', 'compression_level': None, 'checksum': True}
+    assert export_compression.get_file_compression_options(
+        compression_options, 'csv') == compression_options
+
+
+@pytest.mark.parametrize('compression, compression_level, expected_error', [
+    ('none', None, None),
+    ('gzip', None, None),
+    ('gzip', 9, None),
+    pytest.param('zstd', 22, None, marks=requires_zstandard),
+    ('none', 3, '--compression-level requires --compression.'),
+    ('gzip', 0, '--compression-level must be between 1 and 9 for gzip.'),
+    ('gzip', 10, '--compression-level must be between 1 and 9 for gzip.'),
+    pytest.param(
+        'zstd', 23, '--compression-level must be between 1 and 22 for zstd.',
+        marks=requires_zstandard),
+])
+def test_compression_level_is_validated(compression, compression_level, expected_error):
+    args = argparse.Namespace(compression=compression, compression_level=compression_level)
+
+    assert export_compression.get_compression_error(args) == expected_error
+
+
+def test_compression_extension_is_added_once():
+    assert export_compression.get_file_name('view.csv', 'gzip') == 'view.csv.gz'
+    assert export_compression.get_file_name('view.csv.gz', 'gzip') == 'view.csv.gz'
+    assert export_compression.get_file_name('view.csv', 'none') == 'view.csv'
@@ -0,0 +1,183 @@
+import time
+import types
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import errors
+import job_status
+import mock_tableau_server
+
+
+@pytest.mark.parametrize('exit_codes, expected_exit_code', [
+    ([0, 0, 0], errors.EXIT_CODE_FINAL_STATUS_SUCCESS),
+    ([0, errors.EXIT_CODE_STATUS_INCOMPLETE, errors.EXIT_CODE_FINAL_STATUS_ERRORED,
+      errors.EXIT_CODE_FINAL_STATUS_CANCELLED], errors.EXIT_CODE_FINAL_STATUS_ERRORED),
+    ([errors.EXIT_CODE_STATUS_INCOMPLETE, errors.EXIT_CODE_FINAL_STATUS_CANCELLED],
+     errors.EXIT_CODE_FINAL_STATUS_CANCELLED),
+    ([errors.EXIT_CODE_INVALID_JOB, errors.EXIT_CODE_STATUS_INCOMPLETE],
+     errors.EXIT_CODE_STATUS_INCOMPLETE),
+    ([0, errors.EXIT_CODE_INVALID_DATASOURCE], errors.EXIT_CODE_INVALID_DATASOURCE),
+])
+def test_aggregate_exit_code(exit_codes, expected_exit_code):
+    assert job_status.determine_aggregate_exit_code(exit_codes) == expected_exit_code
+
+
+def create_finished_job(mock_server, resource):
+    return mock_server.create_job(
+        resource, created_at=datetime.now(timezone.utc) - timedelta(minutes=5))
+
+
+def test_many_jobs_are_read_from_the_job_list(mock_server, server):
+    datasource = mock_server.site.datasources[0]
+    job_ids = [
+        create_finished_job(mock_server, datasource)
+        for _ in range(job_status.JOB_LIST_MIN_JOB_COUNT)]
+
+    job_infos = job_status.get_job_infos(server, job_ids)
+
+    assert set(job_infos) == set(job_ids)
+    assert all(job_info.finish_code == 0 for job_info in job_infos.values())
+    assert mock_server.get_request_counts() == {'jobs': 1}
+
+
+def test_fewer_jobs_are_fetched_individually(mock_server, server):
+    datasource = mock_server.site.datasources[0]
+    job_ids = [
+        create_finished_job(mock_server, datasource)
+        for _ in range(job_status.JOB_LIST_MIN_JOB_COUNT - 1)]
+
+    job_infos = job_status.get_job_infos(server, job_ids)
+
+    assert set(job_infos) == set(job_ids)
+    assert mock_server.get_request_counts() == {'jobs': len(job_ids)}
+
+
+def test_jobs_missing_from_the_job_list_are_fetched_individually(mock_server, server):
+    job_ids = [
+        create_finished_job(mock_server, datasource)
+        for datasource in mock_server.site.datasources]
+
+    job_infos = job_status.get_job_infos(
+        server, job_ids + ['missing'], use_job_list=True)
+
+    assert set(job_infos) == set(job_ids)
+    # One page of the job list, then get_by_id for the missing job.
+    assert mock_server.get_request_counts() == {'jobs': 2}
+
+
+@pytest.mark.parametrize('job_states, expected_exit_code', [
+    (['finished', 'finished'], errors.EXIT_CODE_FINAL_STATUS_SUCCESS),
+    (['finished', 'running'], errors.EXIT_CODE_STATUS_INCOMPLETE),
+    (['finished', 'missing'], errors.EXIT_CODE_INVALID_JOB),
+])
+def test_job_status_aggregates_the_exit_codes_of_every_job(
+        mock_server,
+        credential_arguments,
+        run_blueprint,
+        job_states,
+        expected_exit_code):
+    datasources = iter(mock_server.site.datasources)
+    job_ids = []
+    for job_state in job_states:
+        if job_state == 'finished':
+            job_ids.append(create_finished_job(mock_server, next(datasources)))
+        elif job_state == 'running':
+            job_ids.append(mock_server.create_job(next(datasources)))
+        else:
+            job_ids.append('missing')
+
+    exit_code = run_blueprint(
+        job_status, [*credential_arguments, '--job-ids', ','.join(job_ids)])
+
+    assert exit_code == expected_exit_code
+
+
+@pytest.fixture
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(job_status.random, 'uniform', lambda low, high: 1)
+
+
+def test_poll_interval_backs_off_and_resets_when_the_job_starts(no_jitter):
+    schedule = job_status.JobPollSchedule()
+    queued_job = types.SimpleNamespace(started_at=None)
+    started_job = types.SimpleNamespace(started_at=datetime.now(timezone.utc))
+
+    queued_delays = [schedule.next_delay(queued_job) for _ in range(3)]
+    started_delays = [schedule.next_delay(started_job) for _ in range(2)]
+
+    assert queued_delays == pytest.approx([0.5, 0.7, 0.98])
+    assert started_delays == pytest.approx([0.5, 0.7])
+
+
+def test_poll_interval_is_capped(no_jitter):
+    schedule = job_status.JobPollSchedule()
+    job = types.SimpleNamespace(started_at=None)
+
+    delays = [schedule.next_delay(job) for _ in range(20)]
+
+    assert max(delays) == job_status.POLL_MAX_INTERVAL
+
+
+def test_running_job_is_not_polled_until_it_is_expected_to_finish(no_jitter):
+    schedule = job_status.JobPollSchedule(expected_duration=100)
+    job = types.SimpleNamespace(started_at=datetime.now(timezone.utc))
+
+    delay = schedule.next_delay(job)
+
+    assert delay == pytest.approx(100 * job_status.EXPECTED_DURATION_LEAD, abs=0.1)
+    # The backoff restarts from the minimum once the expected duration has passed.
+    assert schedule.interval == job_status.POLL_MIN_INTERVAL
+
+
+def test_wait_for_jobs_returns_once_every_job_completes(mock_server, server, recorder):
+    job_ids = [mock_server.create_job(datasource)
+               for datasource in mock_server.site.datasources[:2]]
+
+    job_infos = job_status.wait_for_jobs(server, job_ids, timeout=10)
+
+    assert all(job_infos[job_id].completed_at for job_id in job_ids)
+    assert recorder.counters['completed_jobs_detected'] == 2
+    assert recorder.counters['job_detection_latency_seconds'] >= 0
+    assert recorder.counters['job_polls'] >= 4
+    assert 'job_wait_timeouts' not in recorder.counters
+
+
+def test_wait_for_jobs_stops_at_the_deadline(sign_in, recorder):
+    with mock_tableau_server.MockTableauServer(job_duration=60) as mock_server:
+        server = sign_in(mock_server)
+        job_id = mock_server.create_job(mock_server.site.datasources[0])
+
+        start_time = time.monotonic()
+        job_infos = job_status.wait_for_jobs(server, [job_id], timeout=1)
+
+    assert time.monotonic() - start_time < 2
+    assert job_infos[job_id].completed_at is None
+    assert recorder.counters['job_wait_timeouts'] == 1
+    assert 'completed_jobs_detected' not in recorder.counters
+
+
+def test_async_job_infos_skip_missing_jobs(mock_server, run_async):
+    job_ids = [
+        create_finished_job(mock_server, datasource)
+        for datasource in mock_server.site.datasources[:2]]
+
+    job_infos = run_async(lambda server: job_status.get_job_infos_async(
+        server, job_ids + ['missing']))
+
+    assert set(job_infos) == set(job_ids)
+    assert all(job_info.finish_code == 0 for job_info in job_infos.values())
+    assert mock_server.get_request_counts()['jobs'] == 3
+
+
+def test_async_wait_for_jobs_records_detection(mock_server, run_async, recorder):
+    job_ids = [mock_server.create_job(datasource)
+               for datasource in mock_server.site.datasources[:2]]
+
+    job_infos = run_async(lambda server: job_status.wait_for_jobs_async(
+        server, job_ids + ['missing'], timeout=10))
+
+    assert set(job_infos) == set(job_ids)
+    assert all(job_info.completed_at for job_info in job_infos.values())
+    assert recorder.counters['completed_jobs_detected'] == 2
+    assert 'job_wait_timeouts' not in recorder.counters
@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import lazy_imports
+
+BLUEPRINTS_FOLDER_NAME = os.path.dirname(os.path.abspath(lazy_imports.__file__))
+BLUEPRINTS = (
+    'batch_download_views',
+    'download_view',
+    'download_workbook',
+    'job_status',
+    'refresh_dag',
+    'refresh_resource',
+    'refresh_sites',
+    'worker',
+)
+HEAVY_MODULES = ('tableauserverclient', 'requests', 'aiohttp', 'pyarrow')
+
+
+def run_python(*arguments):
+    """
+    Runs Python in a fresh interpreter from the blueprints folder, the way Shipyard runs a blueprint.
+    """
+    return subprocess.run(
+        [sys.executable, *arguments],
+        cwd=BLUEPRINTS_FOLDER_NAME,
+        capture_output=True,
+        text=True)
+
+
+@pytest.mark.parametrize('blueprint', BLUEPRINTS)
+def test_importing_a_blueprint_defers_heavy_imports(blueprint):
+    result = run_python('-c', (
+        f'import sys, {blueprint}; '
+        f'print(",".join(name for name in {HEAVY_MODULES!r} if name in sys.modules))'))
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ''
+
+
+def test_profile_startup_prints_the_slowest_imports():
+    result = run_python('download_view.py', '--help', lazy_imports.PROFILE_STARTUP_FLAG)
+
+    assert result.returncode == 0, result.stderr
+    report = result.stdout[result.stdout.index('Startup profile: imported '):]
+    header, *rows = report.splitlines()
+    assert header.endswith(' ms.')
+    assert 0 < len(rows) - 1 <= lazy_imports.PROFILE_REPORT_SIZE
+
+
+def test_lazy_module_is_imported_on_first_use():
+    module = lazy_imports.LazyModule('json')
+
+    assert module._module is None
+    assert module.dumps([1]) == '[1]'
+    assert module._module is sys.modules['json']
+
+
+def test_missing_module_fails_on_first_use():
+    module = lazy_imports.lazy_import('not_an_installed_module')
+
+    with pytest.raises(ModuleNotFoundError):
+        module.anything
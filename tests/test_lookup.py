@@ -0,0 +1,167 @@
+import asyncio
+
+import pytest
+import tableauserverclient as TSC
+
+import errors
+import lookup
+import lookup_cache
+import mock_tableau_server
+
+
+@pytest.fixture
+def site():
+    return mock_tableau_server.MockSite()
+
+
+@pytest.fixture
+def start_server(sign_in):
+    """
+    Returns a function that serves the site from a mock server for the rest of the test and signs in to it.
+    """
+    mock_servers = []
+
+    def start_server(site):
+        mock_server = mock_tableau_server.MockTableauServer(site=site).start()
+        mock_servers.append(mock_server)
+        return mock_server, sign_in(mock_server)
+
+    yield start_server
+    for mock_server in mock_servers:
+        mock_server.stop()
+
+
+def test_view_ids_are_resolved(mock_server, server):
+    view = next(
+        view for view in mock_server.site.views
+        if view['name'] == 'View 2' and view['workbook_name'] == 'Workbook 1-3')
+
+    view_ids = lookup.get_view_ids(server, 'Project 1', 'Workbook 1-3', 'View 2')
+
+    assert view_ids == {
+        'project_id': view['project_id'],
+        'workbook_id': view['workbook_id'],
+        'view_id': view['id']}
+
+
+def test_duplicate_project_names_are_ambiguous(site, start_server):
+    site.projects[1]['name'] = 'Project 0'
+    _, server = start_server(site)
+
+    with pytest.raises(SystemExit) as exit_info:
+        lookup.get_project_id(server, 'Project 0')
+
+    assert exit_info.value.code == errors.EXIT_CODE_INVALID_PROJECT
+
+
+def test_duplicate_view_names_in_a_workbook_are_ambiguous(site, start_server):
+    site.views[1]['name'] = site.views[0]['name']
+    _, server = start_server(site)
+
+    with pytest.raises(SystemExit) as exit_info:
+        lookup.get_view_ids(server, 'Project 0', 'Workbook 0-0', 'View 0')
+
+    assert exit_info.value.code == errors.EXIT_CODE_INVALID_VIEW
+
+
+def test_same_workbook_name_in_another_project_is_not_ambiguous(site, start_server):
+    other_workbook = next(
+        workbook for workbook in site.workbooks if workbook['name'] == 'Workbook 1-0')
+    other_workbook['name'] = 'Workbook 0-0'
+    _, server = start_server(site)
+    project_id = lookup.get_project_id(server, 'Project 0')
+
+    workbook_id = lookup.get_workbook_id(
+        server, project_id, 'Workbook 0-0', project_name='Project 0')
+
+    assert workbook_id != other_workbook['id']
+
+
+def test_matches_are_found_on_later_pages(start_server):
+    site = mock_tableau_server.MockSite(projects=45, workbooks_per_project=1)
+    for workbook in site.workbooks:
+        workbook['name'] = 'Shared'
+    mock_server, server = start_server(site)
+    project_id = site.projects[-1]['id']
+
+    matches = lookup.find_matches(
+        server.workbooks,
+        {TSC.RequestOptions.Field.Name: 'Shared'},
+        lambda workbook: workbook.project_id == project_id)
+
+    assert [match.project_id for match in matches] == [project_id]
+    # 45 workbooks in pages of 20.
+    assert mock_server.get_request_counts()['workbooks'] == 3
+
+
+def test_paging_stops_once_a_match_is_ambiguous(start_server):
+    site = mock_tableau_server.MockSite(projects=45, workbooks_per_project=1)
+    for workbook in site.workbooks:
+        workbook['name'] = 'Shared'
+    mock_server, server = start_server(site)
+
+    matches = lookup.find_matches(
+        server.workbooks, {TSC.RequestOptions.Field.Name: 'Shared'})
+
+    assert len(matches) == 2
+    assert mock_server.get_request_counts()['workbooks'] == 1
+
+
+def test_names_with_commas_are_matched_on_the_client(site, start_server):
+    site.projects[0]['name'] = 'Sales, West'
+    _, server = start_server(site)
+
+    assert lookup.get_project_id(server, 'Sales, West') == site.projects[0]['id']
+    with pytest.raises(SystemExit):
+        lookup.get_project_id(server, 'Sales')
+
+
+def test_cached_view_ids_skip_lookups(mock_server, server, tmp_path):
+    cache = lookup_cache.LookupCache(3600, str(tmp_path))
+    view_ids = lookup.get_view_ids(
+        server, 'Project 0', 'Workbook 0-0', 'View 0', cache=cache)
+    mock_server.reset_request_counts()
+
+    assert lookup.get_view_ids(
+        server, 'Project 0', 'Workbook 0-0', 'View 0', cache=cache) == view_ids
+    assert mock_server.get_request_counts() == {}
+
+    assert lookup.get_view_ids(
+        server, 'Project 0', 'Workbook 0-0', 'View 0', cache=cache, refresh=True) == view_ids
+    assert mock_server.get_request_counts() == {'projects': 1, 'workbooks': 1, 'views': 1}
+
+
+def test_concurrent_async_lookups_share_project_and_workbook_lookups(mock_server, run_async):
+    project_ids = {}
+    workbook_ids = {}
+    names = [('Project 0', f'Workbook 0-{i % 2}', f'View {i // 2}') for i in range(6)]
+
+    async def get_all_view_ids(server):
+        return await asyncio.gather(*(
+            lookup.get_view_ids_async(
+                server,
+                *name,
+                project_ids=project_ids,
+                workbook_ids=workbook_ids)
+            for name in names))
+
+    view_ids = run_async(get_all_view_ids)
+
+    assert len({ids['view_id'] for ids in view_ids}) == len(names)
+    request_counts = mock_server.get_request_counts()
+    assert request_counts['projects'] == 1
+    assert request_counts['workbooks'] == 2
+    assert request_counts['views'] == len(names)
+
+
+def test_failed_async_lookup_is_retried_by_the_next_call(mock_server, run_async):
+    project_ids = {}
+
+    async def resolve_twice(server):
+        with pytest.raises(SystemExit):
+            await lookup.resolve_project_id_async(server, 'Project 9', project_ids)
+        mock_server.site.projects[0]['name'] = 'Project 9'
+        return await lookup.resolve_project_id_async(server, 'Project 9', project_ids)
+
+    assert run_async(resolve_twice) == mock_server.site.projects[0]['id']
+    assert mock_server.get_request_counts()['projects'] == 2
@@ -0,0 +1,145 @@
+import json
+from concurrent import futures
+
+import pytest
+
+import batch_download_views
+import errors
+import manifest
+import mock_tableau_server
+import parquet_export
+import refresh_sites
+
+REQUIRED_FIELDS = ('project_name', 'resource_name')
+
+
+@pytest.fixture
+def write_file(tmp_path):
+    def write_file(file_name, content):
+        full_path = tmp_path / file_name
+        full_path.write_text(content)
+        return str(full_path)
+    return write_file
+
+
+def test_csv_and_json_manifests_are_read_alike(write_file):
+    csv_file_name = write_file(
+        'manifest.csv', 'project_name,resource_name,extra\n Project 0 ,Sales,x\n')
+    json_file_name = write_file('manifest.json', json.dumps(
+        [{'project_name': ' Project 0 ', 'resource_name': 'Sales', 'extra': 'x'}]))
+
+    for manifest_file_name in (csv_file_name, json_file_name):
+        assert manifest.read_manifest(
+            manifest_file_name, REQUIRED_FIELDS, ('depends_on',)) == [
+            {'project_name': 'Project 0', 'resource_name': 'Sales', 'depends_on': None}]
+
+
+@pytest.mark.parametrize('file_name, content', [
+    ('manifest.json', '{"project_name": "Project 0"}'),
+    ('manifest.json', '[]'),
+    ('manifest.json', '[{"project_name": "Project 0", "resource_name": "Sales"'),
+    ('manifest.json', '["Project 0/Sales"]'),
+    ('manifest.json', '[{"project_name": "Project 0", "resource_name": " "}]'),
+    ('manifest.csv', 'project_name,resource_name\n'),
+    ('manifest.csv', 'project_name\nProject 0\n'),
+])
+def test_invalid_manifests_exit(write_file, file_name, content):
+    with pytest.raises(SystemExit) as e:
+        manifest.read_manifest(write_file(file_name, content), REQUIRED_FIELDS)
+
+    assert e.value.code == errors.EXIT_CODE_INVALID_MANIFEST
+
+
+def test_missing_manifest_exits(tmp_path):
+    with pytest.raises(SystemExit) as e:
+        manifest.read_manifest(str(tmp_path / 'missing.csv'), REQUIRED_FIELDS)
+
+    assert e.value.code == errors.EXIT_CODE_INVALID_MANIFEST
+
+
+def test_download_manifest_rejects_an_invalid_file_type(write_file):
+    manifest_file_name = write_file('manifest.json', json.dumps([{
+        'project_name': 'Project 0',
+        'workbook_name': 'Workbook 0-0',
+        'view_name': 'View 0',
+        'file_type': 'xlsx',
+        'destination_file_name': 'view.xlsx'}]))
+
+    with pytest.raises(SystemExit) as e:
+        batch_download_views.read_download_manifest(manifest_file_name)
+
+    assert e.value.code == errors.EXIT_CODE_INVALID_MANIFEST
+
+
+def write_download_manifest(write_file, file_type):
+    return write_file('manifest.json', json.dumps([{
+        'project_name': 'Project 0',
+        'workbook_name': 'Workbook 0-0',
+        'view_name': 'View 0',
+        'file_type': file_type,
+        'destination_file_name': f'view.{file_type}'}]))
+
+
+def test_download_manifest_with_parquet_entries_requires_pyarrow(write_file, monkeypatch):
+    monkeypatch.setattr(parquet_export, 'is_pyarrow_installed', lambda: False)
+
+    with pytest.raises(SystemExit) as e:
+        batch_download_views.read_download_manifest(
+            write_download_manifest(write_file, 'parquet'))
+
+    assert e.value.code == errors.EXIT_CODE_INVALID_MANIFEST
+
+
+def test_download_manifest_without_parquet_entries_does_not_require_pyarrow(
+        write_file, monkeypatch):
+    monkeypatch.setattr(parquet_export, 'is_pyarrow_installed', lambda: False)
+
+    entries = batch_download_views.read_download_manifest(
+        write_download_manifest(write_file, 'csv'))
+
+    assert [entry['file_type'] for entry in entries] == ['csv']
+
+
+def test_id_resolver_looks_up_shared_projects_and_workbooks_once(sign_in):
+    # Slow lookups make sure the threads all ask for the project while the first lookup is running.
+    latency = {endpoint: 0.05 for endpoint in ('projects', 'workbooks', 'views')}
+    with mock_tableau_server.MockTableauServer(latency=latency) as mock_server:
+        server = sign_in(mock_server)
+        resolver = batch_download_views.IdResolver(server)
+        names = [
+            ('Project 0', f'Workbook 0-{i % 2}', f'View {i // 2}') for i in range(6)]
+
+        with futures.ThreadPoolExecutor(max_workers=len(names)) as executor:
+            view_ids = list(executor.map(
+                lambda name: resolver.get_view_ids(*name), names))
+
+        assert len({ids['view_id'] for ids in view_ids}) == len(names)
+        request_counts = mock_server.get_request_counts()
+    assert request_counts['projects'] == 1
+    assert request_counts['workbooks'] == 2
+    assert request_counts['views'] == len(names)
+
+
+def test_targets_manifest_drops_duplicates(write_file):
+    manifest_file_name = write_file(
+        'manifest.csv',
+        'site_id,project_name,resource_type,resource_name\n'
+        'default,Project 0,Datasource,Sales\n'
+        'default,Project 0,datasource,Sales\n'
+        'other,Project 0,datasource,Sales\n')
+
+    targets = refresh_sites.read_targets_manifest(manifest_file_name)
+
+    assert [target['site_id'] for target in targets] == ['default', 'other']
+
+
+def test_targets_manifest_rejects_an_invalid_resource_type(write_file):
+    manifest_file_name = write_file(
+        'manifest.csv',
+        'site_id,project_name,resource_type,resource_name\n'
+        'default,Project 0,flow,Sales\n')
+
+    with pytest.raises(SystemExit) as e:
+        refresh_sites.read_targets_manifest(manifest_file_name)
+
+    assert e.value.code == errors.EXIT_CODE_INVALID_MANIFEST
@@ -0,0 +1,88 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import download_view
+import errors
+import metrics
+
+
+@pytest.fixture
+def exit_functions(monkeypatch):
+    """
+    Collects the functions a run registers with atexit, so a test can run them instead of pytest's exit.
+    """
+    exit_functions = []
+    monkeypatch.setattr(metrics, 'atexit', SimpleNamespace(
+        register=lambda function, *args: exit_functions.append((function, args))))
+    return exit_functions
+
+
+def test_download_writes_metrics_and_spans(
+        mock_server, credential_arguments, run_blueprint, recorder, exit_functions,
+        monkeypatch, tmp_path):
+    # Shipyard keeps artifacts in a folder relative to the working folder.
+    monkeypatch.setenv('SHIPYARD_ARTIFACTS_DIRECTORY', 'artifacts')
+    span_file_name = tmp_path / 'traces' / 'spans.jsonl'
+
+    exit_code = run_blueprint(download_view, [
+        *credential_arguments,
+        '--project-name', 'Project 0',
+        '--workbook-name', 'Workbook 0-0',
+        '--view-name', 'View 0',
+        '--file-type', 'csv',
+        '--destination-file-name', 'view.csv',
+        '--metrics-file-name', 'metrics.json',
+        '--span-file-name', str(span_file_name)])
+    for function, args in exit_functions:
+        function(*args)
+
+    assert exit_code == errors.EXIT_CODE_FINAL_STATUS_SUCCESS
+    with open(tmp_path / 'artifacts' / 'tableau-blueprints' / 'logs' / 'metrics.json') as f:
+        run_metrics = json.load(f)
+    assert run_metrics['script'] == 'download_view.py'
+    assert {'lookup', 'render', 'write'} <= set(run_metrics['phases'])
+    assert run_metrics['requests']['count'] == sum(
+        mock_server.get_request_counts().values())
+    assert run_metrics['requests']['status_codes']['200'] >= 1
+    assert run_metrics['requests']['bytes_received'] >= mock_server.export_size
+
+    with open(span_file_name) as f:
+        spans = [json.loads(line) for line in f]
+    root_span = spans[0]
+    assert root_span['name'] == 'download_view.py'
+    assert root_span['parentSpanId'] == ''
+    assert {span['traceId'] for span in spans} == {root_span['traceId']}
+    span_ids = {span['spanId'] for span in spans}
+    assert all(span['parentSpanId'] in span_ids for span in spans[1:])
+    assert {span['name'] for span in spans[1:]} == set(run_metrics['phases'])
+    assert all(span['status']['code'] == 'STATUS_CODE_OK' for span in spans)
+
+
+def test_failed_phase_is_recorded_as_an_error_span(recorder):
+    with pytest.raises(SystemExit):
+        with recorder.phase('lookup', view_name='View 0'):
+            with recorder.phase('render'):
+                pass
+            raise SystemExit(errors.EXIT_CODE_INVALID_VIEW)
+
+    render_span, lookup_span = recorder.to_spans()[1:]
+    assert lookup_span['status']['code'] == 'STATUS_CODE_ERROR'
+    assert lookup_span['attributes'] == [{'key': 'view_name', 'value': {'stringValue': 'View 0'}}]
+    assert render_span['status']['code'] == 'STATUS_CODE_OK'
+    assert render_span['parentSpanId'] == lookup_span['spanId']
+
+
+def test_nothing_is_written_without_a_file_name(
+        mock_server, credential_arguments, run_blueprint, recorder, exit_functions):
+    exit_code = run_blueprint(download_view, [
+        *credential_arguments,
+        '--project-name', 'Project 0',
+        '--workbook-name', 'Workbook 0-0',
+        '--view-name', 'View 0',
+        '--file-type', 'csv',
+        '--destination-file-name', 'view.csv'])
+
+    assert exit_code == errors.EXIT_CODE_FINAL_STATUS_SUCCESS
+    assert exit_functions == []
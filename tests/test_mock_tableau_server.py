@@ -0,0 +1,38 @@
+import csv
+import io
+
+import pytest
+import requests
+
+import mock_tableau_server
+
+
+@pytest.mark.parametrize('export_size', [0, 10, 100 * 1024, 5 * 1024 * 1024 + 7])
+def test_data_export_is_whole_csv_rows(export_size):
+    content_length, chunks = mock_tableau_server.generate_export('data', export_size)
+    content = b''.join(chunks)
+
+    assert len(content) == content_length
+    assert content_length <= max(export_size, len(mock_tableau_server.CSV_HEADER))
+    assert content.endswith(b'\n')
+    rows = list(csv.reader(io.StringIO(content.decode('utf-8'))))
+    assert rows[0] == ['Region', 'Category', 'Order Date', 'Sales', 'Quantity']
+    assert all(len(row) == 5 for row in rows)
+
+
+def test_other_exports_have_the_exact_size():
+    content_length, chunks = mock_tableau_server.generate_export('pdf', 12345)
+
+    assert content_length == 12345
+    assert len(b''.join(chunks)) == 12345
+
+
+def test_export_is_served_with_its_content_length(mock_server):
+    view = mock_server.site.views[0]
+    response = requests.get(
+        f'{mock_server.url}/api/3.15/sites/site/views/{view["id"]}/data')
+
+    assert response.status_code == 200
+    assert response.headers['Content-Type'] == 'text/csv'
+    assert int(response.headers['Content-Length']) == len(response.content)
+    assert mock_server.get_request_counts() == {'export': 1}
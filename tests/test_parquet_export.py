@@ -0,0 +1,85 @@
+import csv
+import io
+
+import pytest
+
+import download_view
+import errors
+import mock_tableau_server
+import parquet_export
+
+pyarrow = pytest.importorskip('pyarrow')
+import pyarrow.parquet  # noqa: E402
+
+
+def read_mock_csv_export(export_size):
+    _, chunks = mock_tableau_server.generate_export('data', export_size)
+    return list(csv.DictReader(io.StringIO(b''.join(chunks).decode('utf-8'))))
+
+
+def download_arguments(credential_arguments, *arguments):
+    return [
+        *credential_arguments,
+        '--project-name', 'Project 0',
+        '--workbook-name', 'Workbook 0-0',
+        '--view-name', 'View 0',
+        '--file-type', 'parquet',
+        '--destination-file-name', 'view.parquet',
+        *arguments]
+
+
+def test_csv_export_is_converted_to_parquet(
+        mock_server, credential_arguments, run_blueprint, tmp_path):
+    exit_code = run_blueprint(download_view, download_arguments(
+        credential_arguments, '--parquet-compression', 'zstd'))
+
+    assert exit_code == errors.EXIT_CODE_FINAL_STATUS_SUCCESS
+    rows = read_mock_csv_export(mock_server.export_size)
+    table = pyarrow.parquet.read_table(str(tmp_path / 'view.parquet'))
+    assert table.num_rows == len(rows)
+    assert table.schema.names == list(rows[0])
+    assert table.schema.field('Region').type == pyarrow.string()
+    assert pyarrow.types.is_temporal(table.schema.field('Order Date').type)
+    assert table.schema.field('Sales').type == pyarrow.float64()
+    assert table.schema.field('Quantity').type == pyarrow.int64()
+    assert table.column('Region').to_pylist() == [row['Region'] for row in rows]
+    assert table.column('Quantity').to_pylist() == [int(row['Quantity']) for row in rows]
+    metadata = pyarrow.parquet.ParquetFile(str(tmp_path / 'view.parquet')).metadata
+    assert metadata.row_group(0).column(0).compression == 'ZSTD'
+
+
+def test_each_block_is_written_as_a_row_group(mock_server, tmp_path):
+    _, chunks = mock_tableau_server.generate_export('data', mock_server.export_size)
+    destination_full_path = str(tmp_path / 'view.parquet')
+
+    with open(destination_full_path, 'wb') as f:
+        row_count = parquet_export.write_csv_as_parquet(chunks, f, block_size=16 * 1024)
+
+    assert row_count == len(read_mock_csv_export(mock_server.export_size))
+    metadata = pyarrow.parquet.ParquetFile(destination_full_path).metadata
+    assert metadata.num_rows == row_count
+    assert metadata.num_row_groups > 1
+
+
+def test_column_that_changes_type_fails_the_conversion(tmp_path, capsys):
+    chunks = [b'Region,Quantity\n', b'East,1\n' * 100, b'West,many\n']
+
+    with pytest.raises(SystemExit) as exit_info:
+        with open(tmp_path / 'view.parquet', 'wb') as f:
+            parquet_export.write_csv_as_parquet(chunks, f, block_size=256)
+
+    assert exit_info.value.code == errors.EXIT_CODE_FILE_WRITE_ERROR
+    assert 'Increase --parquet-block-size' in capsys.readouterr().out
+
+
+def test_parquet_options_are_only_set_for_parquet_exports(credential_arguments, monkeypatch):
+    monkeypatch.setattr('sys.argv', ['download_view.py', *download_arguments(
+        credential_arguments, '--parquet-block-size', '1024')])
+    assert parquet_export.get_parquet_options(download_view.get_args()) == {
+        'compression': parquet_export.DEFAULT_PARQUET_COMPRESSION,
+        'block_size': 1024,
+    }
+
+    monkeypatch.setattr('sys.argv', ['download_view.py', *download_arguments(
+        credential_arguments, '--file-type', 'csv')])
+    assert parquet_export.get_parquet_options(download_view.get_args()) is None
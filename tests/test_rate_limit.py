@@ -0,0 +1,93 @@
+import pytest
+
+import rate_limit
+import transport
+
+SERVER_URL = 'https://tableau.example.com'
+VIEW_URL = f'{SERVER_URL}/api/3.15/sites/site-id/views/view-id/data'
+# One export a second, with no burst beyond a single token, so every extra token is a one second wait.
+EXPORT_RATE_LIMITS = {'export': 1.0}
+
+
+@pytest.mark.parametrize('path,category', [
+    ('/api/3.15/auth/signin', 'sign_in'),
+    ('/api/3.15/auth/switchSite', 'sign_in'),
+    ('/api/3.15/auth/signout', 'metadata'),
+    ('/api/3.15/sites/site-id/projects', 'metadata'),
+    ('/api/3.15/sites/site-id/workbooks/workbook-id/views', 'metadata'),
+    ('/api/3.15/sites/site-id/views/view-id/image', 'export'),
+    ('/api/3.15/sites/site-id/views/view-id/pdf', 'export'),
+    ('/api/3.15/sites/site-id/views/view-id/data', 'export'),
+    ('/api/3.15/sites/site-id/views/view-id/crosstab/excel', 'export'),
+    ('/api/3.15/sites/site-id/workbooks/workbook-id/pdf', 'export'),
+    ('/api/3.15/sites/site-id/datasources/datasource-id/content', 'export'),
+])
+def test_requests_are_classified_by_path(path, category):
+    assert rate_limit.classify_request(f'{SERVER_URL}{path}?maxAge=1') == category
+
+
+def test_default_port_shares_the_server_budget():
+    assert rate_limit.get_server_key(
+        'https://Tableau.example.com/api') == rate_limit.get_server_key(
+        'https://tableau.example.com:443/api')
+
+
+def test_limiters_on_one_file_share_a_budget(tmp_path):
+    rate_limit_file_name = str(tmp_path / 'rate_limits.json')
+    first_limiter = rate_limit.RateLimiter(rate_limit_file_name, EXPORT_RATE_LIMITS)
+    second_limiter = rate_limit.RateLimiter(rate_limit_file_name, EXPORT_RATE_LIMITS)
+
+    assert first_limiter.reserve(VIEW_URL) == 0
+    # The first limiter spent the only token, so the second one waits for the refill.
+    assert second_limiter.reserve(VIEW_URL) == pytest.approx(1, abs=0.1)
+    assert first_limiter.reserve(VIEW_URL) == pytest.approx(2, abs=0.1)
+
+
+def test_limiters_on_different_files_do_not_share_a_budget(tmp_path):
+    first_limiter = rate_limit.RateLimiter(
+        str(tmp_path / 'first.json'), EXPORT_RATE_LIMITS)
+    second_limiter = rate_limit.RateLimiter(
+        str(tmp_path / 'second.json'), EXPORT_RATE_LIMITS)
+
+    assert first_limiter.reserve(VIEW_URL) == 0
+    assert second_limiter.reserve(VIEW_URL) == 0
+
+
+def test_categories_have_separate_budgets(tmp_path):
+    rate_limiter = rate_limit.RateLimiter(
+        str(tmp_path / 'rate_limits.json'), EXPORT_RATE_LIMITS)
+
+    assert rate_limiter.reserve(VIEW_URL) == 0
+    assert rate_limiter.reserve(f'{SERVER_URL}/api/3.15/sites/site-id/projects') == 0
+
+
+def test_unlimited_category_never_waits(tmp_path):
+    rate_limiter = rate_limit.RateLimiter(
+        str(tmp_path / 'rate_limits.json'), {'export': 0})
+
+    for _ in range(5):
+        assert rate_limiter.reserve(VIEW_URL) == 0
+
+
+def test_retry_draws_its_own_token(tmp_path, monkeypatch):
+    rate_limit_file_name = str(tmp_path / 'rate_limits.json')
+    rate_limiter = rate_limit.RateLimiter(rate_limit_file_name, EXPORT_RATE_LIMITS)
+    sleeps = []
+    monkeypatch.setattr(transport.time, 'sleep', sleeps.append)
+    retry = transport.create_retry(rate_limiter=rate_limiter).new(
+        rate_limit_url=VIEW_URL)
+
+    # The first send spends the only token, so the retry waits for one of its own.
+    assert rate_limiter.reserve(VIEW_URL) == 0
+    retry.sleep()
+
+    assert sleeps[-1] == pytest.approx(1, abs=0.1)
+    other_limiter = rate_limit.RateLimiter(rate_limit_file_name, EXPORT_RATE_LIMITS)
+    assert other_limiter.reserve(VIEW_URL) == pytest.approx(2, abs=0.1)
+
+
+def test_rate_limiter_is_only_created_with_a_file(tmp_path):
+    assert rate_limit.create_rate_limiter(None) is None
+    assert isinstance(
+        rate_limit.create_rate_limiter(str(tmp_path / 'rate_limits.json')),
+        rate_limit.RateLimiter)
@@ -0,0 +1,165 @@
+import csv
+
+import pytest
+
+import errors
+import refresh_dag
+
+MANIFEST_FIELDS = ('project_name', 'resource_type', 'resource_name', 'depends_on')
+
+
+@pytest.fixture
+def write_manifest(tmp_path):
+    """
+    Returns a function that writes the rows to a CSV manifest and returns its file name.
+    Each row is a (project_name, resource_type, resource_name, depends_on) tuple.
+    """
+    def write_manifest(rows):
+        manifest_file_name = tmp_path / 'manifest.csv'
+        with open(manifest_file_name, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(MANIFEST_FIELDS)
+            writer.writerows(rows)
+        return str(manifest_file_name)
+    return write_manifest
+
+
+def test_find_cycle_returns_nothing_for_a_dag():
+    upstreams = {'a': set(), 'b': {'a'}, 'c': {'a', 'b'}}
+
+    assert refresh_dag.find_cycle(upstreams) == []
+
+
+def test_find_cycle_returns_the_cycle_and_what_waits_on_it():
+    upstreams = {'a': {'b'}, 'b': {'a'}, 'c': {'a'}, 'd': set()}
+
+    assert sorted(refresh_dag.find_cycle(upstreams)) == ['a', 'b', 'c']
+
+
+def test_read_refresh_graph_resolves_dependencies(write_manifest):
+    manifest_file_name = write_manifest([
+        ('Project 0', 'datasource', 'Sales', ''),
+        ('Project 0', 'Workbook', 'Sales', 'datasource:Project 0/Sales'),
+        ('Project 0', 'workbook', 'Summary', 'workbook:Project 0/Sales; Project 0/Orders'),
+        ('Project 0', 'datasource', 'Orders', ''),
+    ])
+
+    targets_by_key, upstreams = refresh_dag.read_refresh_graph(manifest_file_name)
+
+    assert list(targets_by_key) == [
+        'datasource:Project 0/Sales',
+        'workbook:Project 0/Sales',
+        'workbook:Project 0/Summary',
+        'datasource:Project 0/Orders']
+    assert upstreams == {
+        'datasource:Project 0/Sales': set(),
+        'workbook:Project 0/Sales': {'datasource:Project 0/Sales'},
+        'workbook:Project 0/Summary': {
+            'workbook:Project 0/Sales', 'datasource:Project 0/Orders'},
+        'datasource:Project 0/Orders': set(),
+    }
+
+
+@pytest.mark.parametrize('rows', [
+    # The dependency is not in the manifest.
+    [('Project 0', 'workbook', 'Sales', 'Project 0/Orders')],
+    # A datasource and a workbook share the name, so the dependency needs a prefix.
+    [('Project 0', 'datasource', 'Sales', ''),
+     ('Project 0', 'workbook', 'Sales', ''),
+     ('Project 0', 'workbook', 'Summary', 'Project 0/Sales')],
+    [('Project 0', 'flow', 'Sales', '')],
+])
+def test_read_refresh_graph_rejects_invalid_manifests(write_manifest, rows):
+    with pytest.raises(SystemExit) as e:
+        refresh_dag.read_refresh_graph(write_manifest(rows))
+
+    assert e.value.code == errors.EXIT_CODE_INVALID_MANIFEST
+
+
+def test_downstream_refresh_starts_after_its_upstream_succeeds(
+        mock_server, server, write_manifest):
+    targets_by_key, upstreams = refresh_dag.read_refresh_graph(write_manifest([
+        ('Project 0', 'datasource', 'Datasource 0-0', ''),
+        ('Project 0', 'workbook', 'Workbook 0-0', 'Project 0/Datasource 0-0'),
+    ]))
+
+    results = refresh_dag.RefreshGraphRun(
+        server, targets_by_key, upstreams, max_concurrent_jobs=4).run(timeout=10)
+
+    assert [result['exit_code'] for result in results] == [0, 0]
+    datasource_job = mock_server.jobs[results[0]['job_id']]
+    workbook_job = mock_server.jobs[results[1]['job_id']]
+    completed_at = mock_server.get_job_state(datasource_job)['completed_at']
+    assert workbook_job['created_at'] >= completed_at
+
+
+def test_failed_refresh_skips_its_downstreams(mock_server, server, write_manifest):
+    targets_by_key, upstreams = refresh_dag.read_refresh_graph(write_manifest([
+        ('Project 0', 'datasource', 'Missing', ''),
+        ('Project 0', 'workbook', 'Workbook 0-0', 'Project 0/Missing'),
+        ('Project 0', 'workbook', 'Workbook 0-1', 'Project 0/Workbook 0-0'),
+        ('Project 0', 'datasource', 'Datasource 0-1', ''),
+    ]))
+
+    results = refresh_dag.RefreshGraphRun(
+        server, targets_by_key, upstreams, max_concurrent_jobs=4).run(timeout=10)
+
+    assert [result['status'] for result in results] == [
+        f'Not triggered ({errors.EXIT_CODE_INVALID_DATASOURCE})',
+        'Skipped (upstream failed)',
+        'Skipped (upstream failed)',
+        'Success']
+    # Only the independent datasource was refreshed.
+    assert mock_server.get_request_counts()['refresh'] == 1
+
+
+def test_cycle_exits_before_any_refresh(
+        mock_server, credential_arguments, run_blueprint, write_manifest):
+    manifest_file_name = write_manifest([
+        ('Project 0', 'datasource', 'Datasource 0-0', 'Project 0/Workbook 0-0'),
+        ('Project 0', 'workbook', 'Workbook 0-0', 'Project 0/Datasource 0-0'),
+    ])
+
+    exit_code = run_blueprint(refresh_dag, [
+        *credential_arguments,
+        '--resource-manifest-file-name', manifest_file_name])
+
+    assert exit_code == errors.EXIT_CODE_INVALID_MANIFEST
+    assert 'refresh' not in mock_server.get_request_counts()
+
+
+def test_dependencies_are_discovered_from_workbook_connections(server, write_manifest):
+    targets_by_key, upstreams = refresh_dag.read_refresh_graph(write_manifest([
+        ('Project 0', 'datasource', 'Datasource 0-0', ''),
+        ('Project 0', 'workbook', 'Workbook 0-0', ''),
+        ('Project 0', 'workbook', 'Workbook 0-1', ''),
+    ]))
+
+    upstreams = refresh_dag.discover_dependencies(server, targets_by_key, upstreams)
+
+    assert upstreams == {
+        'datasource:Project 0/Datasource 0-0': set(),
+        'workbook:Project 0/Workbook 0-0': {'datasource:Project 0/Datasource 0-0'},
+        'workbook:Project 0/Workbook 0-1': {'datasource:Project 0/Datasource 0-0'},
+    }
+
+
+def test_unreadable_connections_leave_the_declared_dependencies(
+        mock_server, server, write_manifest, capsys):
+    targets_by_key, upstreams = refresh_dag.read_refresh_graph(write_manifest([
+        ('Project 0', 'datasource', 'Datasource 0-0', ''),
+        ('Project 0', 'workbook', 'Workbook 0-0', ''),
+        ('Project 0', 'workbook', 'Workbook 0-1', ''),
+    ]))
+    # The workbook is still listed, but fetching it by ID fails, as after it is republished.
+    workbook = next(
+        workbook for workbook in mock_server.site.workbooks
+        if workbook['name'] == 'Workbook 0-0')
+    del mock_server.site.items_by_id[workbook['id']]
+
+    upstreams = refresh_dag.discover_dependencies(server, targets_by_key, upstreams)
+
+    assert upstreams['workbook:Project 0/Workbook 0-0'] == set()
+    assert upstreams['workbook:Project 0/Workbook 0-1'] == {
+        'datasource:Project 0/Datasource 0-0'}
+    assert 'Could not read the connections of workbook:Project 0/Workbook 0-0' in capsys.readouterr().out
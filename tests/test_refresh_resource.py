@@ -0,0 +1,158 @@
+import json
+
+import pytest
+
+import errors
+import refresh_resource
+
+
+@pytest.fixture
+def write_manifest(tmp_path):
+    def write_manifest(entries):
+        manifest_file_name = tmp_path / 'manifest.json'
+        manifest_file_name.write_text(json.dumps(entries))
+        return str(manifest_file_name)
+    return write_manifest
+
+
+def datasource_target(name, project_name='Project 1'):
+    return {
+        'project_name': project_name,
+        'resource_type': 'datasource',
+        'resource_name': name}
+
+
+def test_every_manifest_target_is_refreshed(
+        mock_server, credential_arguments, run_blueprint, write_manifest):
+    manifest_file_name = write_manifest([
+        datasource_target('Datasource 1-0'),
+        datasource_target('Datasource 1-1'),
+        {'project_name': 'Project 0', 'resource_type': 'Workbook',
+         'resource_name': 'Workbook 0-0'},
+    ])
+
+    exit_code = run_blueprint(refresh_resource, [
+        *credential_arguments,
+        '--resource-manifest-file-name', manifest_file_name,
+        '--check-status', 'TRUE'])
+
+    assert exit_code == errors.EXIT_CODE_FINAL_STATUS_SUCCESS
+    assert mock_server.get_request_counts()['refresh'] == 3
+
+
+def test_a_missing_target_fails_the_run_without_stopping_the_others(
+        mock_server, credential_arguments, run_blueprint, write_manifest):
+    manifest_file_name = write_manifest([
+        datasource_target('Datasource 1-0'),
+        datasource_target('Missing'),
+    ])
+
+    exit_code = run_blueprint(refresh_resource, [
+        *credential_arguments,
+        '--resource-manifest-file-name', manifest_file_name,
+        '--check-status', 'TRUE'])
+
+    assert exit_code == errors.EXIT_CODE_INVALID_DATASOURCE
+    assert mock_server.get_request_counts()['refresh'] == 1
+
+
+def test_a_name_with_a_comma_is_a_single_target(
+        mock_server, credential_arguments, run_blueprint):
+    mock_server.site.datasources[0]['name'] = 'Sales, West'
+
+    exit_code = run_blueprint(refresh_resource, [
+        *credential_arguments,
+        '--project-name', 'Project 0',
+        '--datasource-name', 'Sales, West',
+        '--check-status', 'FALSE'])
+
+    assert exit_code == errors.EXIT_CODE_FINAL_STATUS_SUCCESS
+    assert mock_server.get_request_counts()['refresh'] == 1
+    assert [job['title'] for job in mock_server.jobs.values()] == ['Sales, West']
+
+
+@pytest.mark.parametrize('coalesce, expected_refresh_count', [
+    ('on_conflict', 1),
+    ('always', 0),
+])
+def test_refresh_already_underway_is_adopted(
+        mock_server, server, coalesce, expected_refresh_count):
+    running_job_id = mock_server.create_job(mock_server.site.datasources[0])
+
+    result = refresh_resource.trigger_refresh(
+        server, datasource_target('Datasource 0-0', 'Project 0'), coalesce=coalesce)
+
+    assert result['job_id'] == running_job_id
+    assert result['exit_code'] is None
+    assert mock_server.get_request_counts().get('refresh', 0) == expected_refresh_count
+    assert list(mock_server.jobs) == [running_job_id]
+
+
+def test_refresh_conflict_fails_without_coalescing(mock_server, server):
+    mock_server.create_job(mock_server.site.datasources[0])
+
+    result = refresh_resource.trigger_refresh(
+        server, datasource_target('Datasource 0-0', 'Project 0'))
+
+    assert result['job_id'] is None
+    assert result['exit_code'] == errors.EXIT_CODE_REFRESH_ERROR
+
+
+def test_conflict_on_a_name_with_a_comma_adopts_the_job_of_that_resource(mock_server, server):
+    mock_server.site.datasources[0]['name'] = 'Sales, West'
+    running_job_id = mock_server.create_job(mock_server.site.datasources[0])
+    # The name can't be filtered on, so this job is a candidate too until its resource ID is checked.
+    mock_server.create_job(mock_server.site.datasources[1])
+
+    result = refresh_resource.trigger_refresh(
+        server, datasource_target('Sales, West', 'Project 0'), coalesce='on_conflict')
+
+    assert result['job_id'] == running_job_id
+
+
+def test_refresh_without_a_conflict_starts_a_new_job(mock_server, server):
+    result = refresh_resource.trigger_refresh(
+        server, datasource_target('Datasource 0-0', 'Project 0'), coalesce='on_conflict')
+
+    assert result['job_id'] in mock_server.jobs
+    assert mock_server.get_request_counts()['refresh'] == 1
+
+
+def test_async_refreshes_are_triggered_and_waited_on_together(mock_server, run_async):
+    running_job_id = mock_server.create_job(mock_server.site.datasources[2])
+    targets = [
+        datasource_target('Datasource 0-0', 'Project 0'),
+        datasource_target('Missing', 'Project 0'),
+        datasource_target('Datasource 1-0'),
+    ]
+
+    async def refresh(server):
+        results = await refresh_resource.trigger_refreshes_async(
+            server, targets, coalesce='on_conflict')
+        results.append(dict(
+            datasource_target('Datasource 1-1'), job_id='missing', exit_code=None))
+        return await refresh_resource.wait_for_refreshes_async(server, results, timeout=10)
+
+    results = run_async(refresh)
+
+    assert [result['exit_code'] for result in results] == [
+        errors.EXIT_CODE_FINAL_STATUS_SUCCESS,
+        errors.EXIT_CODE_INVALID_DATASOURCE,
+        errors.EXIT_CODE_FINAL_STATUS_SUCCESS,
+        errors.EXIT_CODE_INVALID_JOB]
+    # The running refresh of Datasource 1-0 was adopted after Tableau refused a second one.
+    assert results[2]['job_id'] == running_job_id
+    assert results[0]['job_id'] in mock_server.jobs
+    request_counts = mock_server.get_request_counts()
+    assert request_counts['refresh'] == 2
+    assert request_counts['projects'] == 2
+
+
+def test_async_refresh_conflict_fails_without_coalescing(mock_server, run_async):
+    mock_server.create_job(mock_server.site.datasources[0])
+
+    result = run_async(lambda server: refresh_resource.trigger_refresh_async(
+        server, datasource_target('Datasource 0-0', 'Project 0')))
+
+    assert result['job_id'] is None
+    assert result['exit_code'] == errors.EXIT_CODE_REFRESH_ERROR
@@ -0,0 +1,69 @@
+import authorization
+
+
+def connect(mock_server, session_cache_file_name, **transport_options):
+    server, connection = authorization.connect_to_tableau(
+        'username',
+        'password',
+        'default',
+        mock_server.url,
+        'username_password',
+        session_cache_file_name=session_cache_file_name,
+        transport_options=transport_options)
+    with connection:
+        return server
+
+
+def test_cached_session_is_reused(mock_server, tmp_path):
+    session_cache_file_name = str(tmp_path / 'sessions.json')
+    first_server = connect(mock_server, session_cache_file_name)
+    mock_server.reset_request_counts()
+
+    server = connect(mock_server, session_cache_file_name)
+
+    assert server.auth_token == first_server.auth_token
+    assert mock_server.get_request_counts() == {'session': 1}
+
+
+def test_expired_session_signs_in_again(mock_server, tmp_path):
+    session_cache_file_name = str(tmp_path / 'sessions.json')
+    first_server = connect(mock_server, session_cache_file_name)
+    mock_server.expire_sessions()
+    mock_server.reset_request_counts()
+
+    server = connect(mock_server, session_cache_file_name)
+
+    assert server.auth_token != first_server.auth_token
+    assert mock_server.get_request_counts()['signin'] == 1
+    # The new session replaced the expired one in the cache.
+    mock_server.reset_request_counts()
+    assert connect(mock_server, session_cache_file_name).auth_token == server.auth_token
+    assert mock_server.get_request_counts() == {'session': 1}
+
+
+def test_session_is_kept_when_the_check_fails_without_a_401(mock_server, tmp_path):
+    session_cache_file_name = str(tmp_path / 'sessions.json')
+    first_server = connect(mock_server, session_cache_file_name)
+    mock_server.failure_rates['session'] = 1.0
+    mock_server.reset_request_counts()
+
+    server = connect(mock_server, session_cache_file_name, max_retries=0)
+
+    assert server.auth_token == first_server.auth_token
+    assert 'signin' not in mock_server.get_request_counts()
+
+
+def test_sessions_are_cached_per_credentials(mock_server, tmp_path):
+    session_cache_file_name = str(tmp_path / 'sessions.json')
+    connect(mock_server, session_cache_file_name)
+    mock_server.reset_request_counts()
+
+    authorization.connect_to_tableau(
+        'other-username',
+        'password',
+        'default',
+        mock_server.url,
+        'username_password',
+        session_cache_file_name=session_cache_file_name)
+
+    assert mock_server.get_request_counts()['signin'] == 1
@@ -0,0 +1,129 @@
+import time
+
+import pytest
+import tableauserverclient as TSC
+from urllib3.util.retry import RequestHistory
+
+import rate_limit
+import transport
+
+
+class RecordingRateLimiter(rate_limit.RateLimiter):
+    """
+    Records the URL of every reservation, so tests can count the tokens each request drew.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.urls = []
+
+    def reserve(self, url):
+        self.urls.append(url)
+        return super().reserve(url)
+
+
+def create_failed_retry(failure_count):
+    retry = transport.create_retry()
+    return retry.new(history=tuple(
+        RequestHistory('GET', '/api/3.4/sites', None, 503, None)
+        for _ in range(failure_count)))
+
+
+def test_retry_backoff_is_jittered():
+    retry = create_failed_retry(4)
+    # urllib3 backs off by backoff_factor * 2 ** (failures - 1) seconds.
+    backoff_time = transport.DEFAULT_BACKOFF_FACTOR * 2 ** 3
+
+    backoff_times = [retry.get_backoff_time() for _ in range(100)]
+
+    assert all(backoff_time / 2 <= time <= backoff_time for time in backoff_times)
+    assert len(set(backoff_times)) > 1
+
+
+def test_each_retry_reserves_its_own_rate_limit_token(mock_server, sign_in, tmp_path):
+    rate_limiter = RecordingRateLimiter(str(tmp_path / 'rate_limits.json'))
+    server = sign_in(mock_server, max_retries=1, rate_limiter=rate_limiter)
+    rate_limiter.urls.clear()
+    mock_server.failure_rates['projects'] = 1.0
+
+    try:
+        server.projects.get()
+    except Exception:
+        pass
+
+    assert mock_server.get_request_counts() == {'projects': 2}
+    # The first send reserves in the adapter and the retry in JitteredRetry.sleep, both against the server's budget.
+    assert len(rate_limiter.urls) == 2
+    assert {rate_limit.get_server_key(url) for url in rate_limiter.urls} == {
+        rate_limit.get_server_key(mock_server.url)}
+    assert {rate_limit.classify_request(url) for url in rate_limiter.urls} == {'metadata'}
+
+
+def test_throttled_and_unavailable_gets_are_retried(mock_server, sign_in):
+    server = sign_in(mock_server, max_retries=5)
+    mock_server.retry_after = 0
+    mock_server.throttle_rates['projects'] = 0.2
+    mock_server.failure_rates['projects'] = 0.2
+
+    for _ in range(5):
+        server.projects.get()
+
+    assert mock_server.get_request_counts()['projects'] > 5
+
+
+def test_retries_stop_after_max_retries(mock_server, sign_in):
+    server = sign_in(mock_server, max_retries=2)
+    mock_server.retry_after = 0
+    mock_server.throttle_rates['projects'] = 1.0
+
+    with pytest.raises(TSC.ServerResponseError):
+        server.projects.get()
+
+    assert mock_server.get_request_counts() == {'projects': 3}
+
+
+def test_retry_after_header_is_honored(mock_server, sign_in):
+    server = sign_in(mock_server, max_retries=1)
+    mock_server.retry_after = 1
+    mock_server.throttle_rates['projects'] = 1.0
+
+    start_time = time.monotonic()
+    with pytest.raises(TSC.ServerResponseError):
+        server.projects.get()
+
+    # Without the header, the first retry would be sent without any backoff.
+    assert time.monotonic() - start_time >= 1
+    assert mock_server.get_request_counts() == {'projects': 2}
+
+
+def test_sign_in_is_never_resent(mock_server):
+    server = transport.create_server(mock_server.url, {'max_retries': 5})
+    mock_server.reset_request_counts()
+    mock_server.retry_after = 0
+    mock_server.throttle_rates['signin'] = 1.0
+
+    with pytest.raises(Exception):
+        server.auth.sign_in(TSC.TableauAuth('username', 'password', site_id=''))
+
+    assert mock_server.get_request_counts() == {'signin': 1}
+
+
+def test_refresh_is_never_resent(mock_server, sign_in):
+    server = sign_in(mock_server, max_retries=5)
+    datasource = server.datasources.get_by_id(mock_server.site.datasources[0]['id'])
+    mock_server.reset_request_counts()
+    mock_server.failure_rates['refresh'] = 1.0
+
+    with pytest.raises(Exception):
+        server.datasources.refresh(datasource)
+
+    assert mock_server.get_request_counts() == {'refresh': 1}
+    assert not mock_server.jobs
+
+
+def test_backoff_without_urllib3_is_jittered():
+    backoff_times = [transport.get_backoff_time(4) for _ in range(100)]
+
+    assert transport.get_backoff_time(1) == 0
+    assert all(2 <= time <= 4 for time in backoff_times)
+    assert len(set(backoff_times)) > 1
@@ -0,0 +1,92 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import download_view
+import errors
+import worker
+
+# Forking a run needs a single-threaded parent, so the worker runs in its own process.
+WORKER_START_TIMEOUT = 30
+
+
+@pytest.fixture
+def worker_socket_file_name(tmp_path):
+    socket_file_name = str(tmp_path / 'worker.sock')
+    process = subprocess.Popen(
+        [sys.executable, worker.__file__, '--socket-file-name', socket_file_name],
+        stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + WORKER_START_TIMEOUT
+        while not os.path.exists(socket_file_name):
+            assert process.poll() is None, 'The worker exited before listening.'
+            assert time.monotonic() < deadline, 'The worker did not start listening.'
+            time.sleep(0.05)
+        yield socket_file_name
+    finally:
+        process.terminate()
+        process.wait(WORKER_START_TIMEOUT)
+
+
+def download_arguments(credential_arguments, view_name, *arguments):
+    return [
+        *credential_arguments,
+        '--project-name', 'Project 0',
+        '--workbook-name', 'Workbook 0-0',
+        '--view-name', view_name,
+        '--file-type', 'csv',
+        '--destination-file-name', 'view.csv',
+        *arguments]
+
+
+def test_forwarded_run_streams_output_and_shares_lookups(
+        mock_server, credential_arguments, run_blueprint, worker_socket_file_name,
+        capfd, tmp_path):
+    arguments = download_arguments(
+        credential_arguments, 'View 0',
+        '--worker-socket-file-name', worker_socket_file_name)
+
+    exit_code = run_blueprint(download_view, arguments)
+
+    assert exit_code == errors.EXIT_CODE_FINAL_STATUS_SUCCESS
+    assert 'Successfully downloaded View 0' in capfd.readouterr().out
+    assert (tmp_path / 'view.csv').exists()
+    request_counts = mock_server.get_request_counts()
+    assert request_counts['export'] == 1
+    assert request_counts['projects'] == 1
+
+    # The second run finds the IDs the first run merged into the worker's in-memory cache.
+    (tmp_path / 'view.csv').unlink()
+    exit_code = run_blueprint(download_view, arguments)
+
+    assert exit_code == errors.EXIT_CODE_FINAL_STATUS_SUCCESS
+    assert (tmp_path / 'view.csv').exists()
+    request_counts = mock_server.get_request_counts()
+    assert request_counts['export'] == 2
+    assert request_counts['projects'] == 1
+
+
+def test_forwarded_run_passes_its_exit_code_through(
+        mock_server, credential_arguments, run_blueprint, worker_socket_file_name,
+        capfd, tmp_path):
+    exit_code = run_blueprint(download_view, download_arguments(
+        credential_arguments, 'Missing',
+        '--worker-socket-file-name', worker_socket_file_name))
+
+    assert exit_code == errors.EXIT_CODE_INVALID_VIEW
+    assert 'Missing' in capfd.readouterr().out
+    assert not (tmp_path / 'view.csv').exists()
+
+
+def test_run_falls_back_to_this_process_without_a_worker(
+        mock_server, credential_arguments, run_blueprint, tmp_path):
+    exit_code = run_blueprint(download_view, download_arguments(
+        credential_arguments, 'View 0',
+        '--worker-socket-file-name', str(tmp_path / 'worker.sock')))
+
+    assert exit_code == errors.EXIT_CODE_FINAL_STATUS_SUCCESS
+    assert (tmp_path / 'view.csv').exists()
+    assert mock_server.get_request_counts()['export'] == 1